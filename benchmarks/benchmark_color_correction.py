@@ -0,0 +1,80 @@
+"""
+Measures color correction throughput in megapixels per second for the reference implementation and ColorCorrector.
+
+Usage:
+    python benchmarks/benchmark_color_correction.py --output color_correction.json
+"""
+
+import time
+from pathlib import Path
+from typing import Optional, Callable
+
+import numpy as np
+import tyro
+
+from common import save_results
+from synthetic_data import create_synthetic_ccm
+from nersemble_data.util.color_correction import ColorCorrector, correct_color_reference
+
+
+def _measure_megapixels_per_second(correct: Callable[[], np.ndarray], n_pixels: int, repeats: int) -> dict:
+    correct()  # Warm-up, e.g., lookup tables and buffers
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        correct()
+        times.append(time.perf_counter() - start)
+
+    median_time = float(np.median(times))
+    return {"median_ms": median_time * 1000, "megapixels_per_second": n_pixels / 1e6 / median_time}
+
+
+def run(width: int = 3208, height: int = 2200, repeats: int = 5, seed: int = 0, reference: bool = True) -> dict:
+    rng = np.random.default_rng(seed)
+    ccm = create_synthetic_ccm(rng)
+    image_uint8 = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    image_float32 = image_uint8.astype(np.float32) / 255
+    n_pixels = width * height
+
+    color_corrector = ColorCorrector(ccm)
+    out_uint8 = np.empty_like(image_uint8)
+    out_float32 = np.empty_like(image_float32)
+
+    results = {"config": {"width": width, "height": height}}
+    results["color_corrector_uint8_to_uint8"] = _measure_megapixels_per_second(
+        lambda: color_corrector(image_uint8, out=out_uint8), n_pixels, repeats)
+    results["color_corrector_uint8_to_float32"] = _measure_megapixels_per_second(
+        lambda: color_corrector(image_uint8, out=out_float32), n_pixels, repeats)
+    results["color_corrector_float32_to_float32"] = _measure_megapixels_per_second(
+        lambda: color_corrector(image_float32, out=out_float32), n_pixels, repeats)
+    if reference:
+        # The reference implementation is slow, a single repetition is enough
+        results["reference_float64"] = _measure_megapixels_per_second(
+            lambda: correct_color_reference(image_uint8 / 255., ccm), n_pixels, 1)
+
+    return results
+
+
+def main(width: int = 3208, height: int = 2200, repeats: int = 5, seed: int = 0, reference: bool = True, output: Optional[Path] = None):
+    """
+    Parameters
+    ----------
+    width:
+        Width of the synthetic image
+    height:
+        Height of the synthetic image
+    repeats:
+        How often each variant is timed. The median is reported
+    seed:
+        Seed for the synthetic image and color correction matrix
+    reference:
+        Whether to also measure the (slow) reference implementation
+    output:
+        If given, the results are additionally stored as JSON
+    """
+
+    save_results("color_correction", run(width=width, height=height, repeats=repeats, seed=seed, reference=reference), output)
+
+
+if __name__ == '__main__':
+    tyro.cli(main)
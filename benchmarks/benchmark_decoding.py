@@ -0,0 +1,133 @@
+"""
+Measures frame loading from videos: sequential and random frame latency of a single camera, as well as the throughput
+of loading all cameras of a timestep.
+
+Usage:
+    python benchmarks/benchmark_decoding.py --output decoding.json
+"""
+
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import tyro
+
+from common import summarize_times, save_results
+from synthetic_data import create_synthetic_dataset
+from nersemble_data.data.nersemble_data import NeRSembleParticipantDataManager
+
+SEQUENCE_NAME = "EXP-1-head"
+
+
+def run(data_folder: str,
+        n_cameras: int = 4,
+        n_frames: int = 60,
+        width: int = 1604,
+        height: int = 1100,
+        n_random_frames: int = 30,
+        seed: int = 0,
+        frame_store: bool = False) -> dict:
+    serials = create_synthetic_dataset(data_folder, n_cameras=n_cameras, n_frames=n_frames, width=width, height=height, seed=seed)
+    rng = np.random.default_rng(seed)
+    results = {"config": {"n_cameras": n_cameras, "n_frames": n_frames, "width": width, "height": height}}
+
+    # Sequential access of one camera
+    with NeRSembleParticipantDataManager(data_folder, 1) as data_manager:
+        times = []
+        for timestep in range(n_frames):
+            start = time.perf_counter()
+            data_manager.load_image(SEQUENCE_NAME, serials[0], timestep, as_uint8=True)
+            times.append(time.perf_counter() - start)
+        results["sequential_frame"] = summarize_times(times)
+
+    # Random access of one camera
+    random_timesteps = rng.integers(0, n_frames, size=n_random_frames)
+    with NeRSembleParticipantDataManager(data_folder, 1) as data_manager:
+        times = []
+        for timestep in random_timesteps:
+            start = time.perf_counter()
+            data_manager.load_image(SEQUENCE_NAME, serials[0], int(timestep), as_uint8=True)
+            times.append(time.perf_counter() - start)
+        results["random_frame"] = summarize_times(times)
+
+    # All cameras of a timestep, one timestep after the other
+    with NeRSembleParticipantDataManager(data_folder, 1) as data_manager:
+        start = time.perf_counter()
+        for timestep in range(n_frames):
+            data_manager.load_timestep(SEQUENCE_NAME, timestep, serials=serials, as_uint8=True)
+        duration = time.perf_counter() - start
+        results["load_timestep"] = {"timesteps_per_second": n_frames / duration,
+                                    "frames_per_second": n_frames * len(serials) / duration}
+
+    # Same, but with prefetching of the next timesteps
+    with NeRSembleParticipantDataManager(data_folder, 1) as data_manager:
+        start = time.perf_counter()
+        for _ in data_manager.iter_timesteps(SEQUENCE_NAME, serials=serials, prefetch=2, as_uint8=True):
+            pass
+        duration = time.perf_counter() - start
+        results["iter_timesteps"] = {"timesteps_per_second": n_frames / duration,
+                                     "frames_per_second": n_frames * len(serials) / duration}
+
+    if frame_store:
+        with NeRSembleParticipantDataManager(data_folder, 1) as data_manager:
+            data_manager.extract_frames(SEQUENCE_NAME, serials[0])
+            times = []
+            for timestep in random_timesteps:
+                start = time.perf_counter()
+                data_manager.load_image(SEQUENCE_NAME, serials[0], int(timestep), as_uint8=True, out=np.empty((height, width, 3), dtype=np.uint8))
+                times.append(time.perf_counter() - start)
+            results["random_frame_store"] = summarize_times(times)
+
+    return results
+
+
+def main(data_folder: Optional[Path] = None,
+         n_cameras: int = 4,
+         n_frames: int = 60,
+         width: int = 1604,
+         height: int = 1100,
+         n_random_frames: int = 30,
+         seed: int = 0,
+         frame_store: bool = False,
+         output: Optional[Path] = None):
+    """
+    Parameters
+    ----------
+    data_folder:
+        Where the synthetic videos are stored. Reusing the same folder across runs skips the video generation.
+        Defaults to a temporary folder
+    n_cameras:
+        Number of synthetic cameras
+    n_frames:
+        Number of frames per synthetic video
+    width:
+        Width of the synthetic videos
+    height:
+        Height of the synthetic videos
+    n_random_frames:
+        How many randomly chosen frames are loaded to measure random access latency
+    seed:
+        Seed for the synthetic data and the random frame order
+    frame_store:
+        Additionally measure random access after extracting the frames into a frame store
+    output:
+        If given, the results are additionally stored as JSON
+    """
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        results = run(str(temp_folder if data_folder is None else data_folder),
+                      n_cameras=n_cameras,
+                      n_frames=n_frames,
+                      width=width,
+                      height=height,
+                      n_random_frames=n_random_frames,
+                      seed=seed,
+                      frame_store=frame_store)
+
+    save_results("decoding", results, output)
+
+
+if __name__ == '__main__':
+    tyro.cli(main)
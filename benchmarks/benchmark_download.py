@@ -0,0 +1,159 @@
+"""
+Measures download throughput (MB/s) for large files and request rate (files/s) for many small files against a local
+HTTP server with configurable latency.
+
+Usage:
+    python benchmarks/benchmark_download.py --latency 0.05 --output download.json
+"""
+
+import contextlib
+import io
+import shutil
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from typing import Optional, List, Tuple
+
+import tyro
+
+from common import save_results
+from range_http_server import RangeHTTPServer
+from synthetic_data import create_random_file
+from nersemble_data.util.download import download_file
+
+
+def _download_with_threads(jobs: List[Tuple[str, str]], n_workers: int, n_connections: int) -> int:
+    def download(job: Tuple[str, str]) -> int:
+        result = download_file(*job, n_connections=n_connections)
+        assert result is not None, f"Download of {job[0]} failed"
+        return result.size
+
+    # download_file() reports every file, which would distort the measurement on the console
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPool(processes=n_workers) as pool:
+            return sum(pool.map(download, jobs))
+
+
+def _download_with_asyncio(jobs: List[Tuple[str, str]], n_workers: int) -> int:
+    from nersemble_data.util.async_download import AsyncDownloader
+
+    results = AsyncDownloader(max_concurrency=n_workers).download(jobs, n_jobs=len(jobs))
+    assert all(result is not None for result in results), "Some downloads failed"
+    return sum(result.size for result in results)
+
+
+def _measure(server: RangeHTTPServer,
+             relative_paths: List[str],
+             target_folder: str,
+             engine: str,
+             n_workers: int,
+             n_connections: int = 1) -> dict:
+    shutil.rmtree(target_folder, ignore_errors=True)
+    jobs = [(f"{server.url}/{relative_path}", f"{target_folder}/{relative_path}") for relative_path in relative_paths]
+
+    n_requests_before = server.n_requests
+    start = time.perf_counter()
+    if engine == 'async':
+        n_bytes = _download_with_asyncio(jobs, n_workers)
+    else:
+        n_bytes = _download_with_threads(jobs, n_workers, n_connections)
+    duration = time.perf_counter() - start
+
+    return {
+        "engine": engine,
+        "n_workers": n_workers,
+        "n_connections": n_connections,
+        "duration_s": duration,
+        "megabytes_per_second": n_bytes / (1 << 20) / duration,
+        "files_per_second": len(jobs) / duration,
+        "requests_per_second": (server.n_requests - n_requests_before) / duration,
+    }
+
+
+def run(data_folder: str,
+        latency: float = 0.02,
+        n_small_files: int = 200,
+        small_file_size_kb: int = 64,
+        n_large_files: int = 2,
+        large_file_size_mb: int = 64,
+        n_workers: int = 16,
+        n_connections: int = 4,
+        asyncio: bool = True) -> dict:
+    small_files = [f"small/file_{i:05d}.bin" for i in range(n_small_files)]
+    large_files = [f"large/file_{i:03d}.bin" for i in range(n_large_files)]
+    for i, relative_path in enumerate(small_files):
+        create_random_file(f"{data_folder}/server/{relative_path}", small_file_size_kb << 10, seed=i)
+    for i, relative_path in enumerate(large_files):
+        create_random_file(f"{data_folder}/server/{relative_path}", large_file_size_mb << 20, seed=i)
+
+    results = {"config": {"latency": latency,
+                          "n_small_files": n_small_files,
+                          "small_file_size_kb": small_file_size_kb,
+                          "n_large_files": n_large_files,
+                          "large_file_size_mb": large_file_size_mb}}
+    target_folder = f"{data_folder}/client"
+    with RangeHTTPServer(f"{data_folder}/server", latency=latency) as server:
+        results["small_files_thread_1_worker"] = _measure(server, small_files, target_folder, 'thread', 1)
+        results["small_files_thread"] = _measure(server, small_files, target_folder, 'thread', n_workers)
+        results["large_files_thread"] = _measure(server, large_files, target_folder, 'thread', n_workers)
+        results["large_files_thread_multi_connection"] = _measure(server, large_files, target_folder, 'thread', n_workers,
+                                                                  n_connections=n_connections)
+        if asyncio:
+            results["small_files_async"] = _measure(server, small_files, target_folder, 'async', n_workers * 4)
+            results["large_files_async"] = _measure(server, large_files, target_folder, 'async', n_workers)
+
+    return results
+
+
+def main(data_folder: Optional[Path] = None,
+         latency: float = 0.02,
+         n_small_files: int = 200,
+         small_file_size_kb: int = 64,
+         n_large_files: int = 2,
+         large_file_size_mb: int = 64,
+         n_workers: int = 16,
+         n_connections: int = 4,
+         asyncio: bool = True,
+         output: Optional[Path] = None):
+    """
+    Parameters
+    ----------
+    data_folder:
+        Where the served files and downloads are stored. Defaults to a temporary folder
+    latency:
+        Seconds that the local server waits before answering each request
+    n_small_files:
+        Number of small files, measures how many requests per second can be handled
+    small_file_size_kb:
+        Size of each small file
+    n_large_files:
+        Number of large files, measures throughput. Multiple connections are only used for files >= 64 MB
+    large_file_size_mb:
+        Size of each large file
+    n_workers:
+        Number of parallel downloads
+    n_connections:
+        Number of connections per file for the multi-connection variant
+    asyncio:
+        Whether to also measure the asyncio engine (requires aiohttp)
+    output:
+        If given, the results are additionally stored as JSON
+    """
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        results = run(str(temp_folder if data_folder is None else data_folder),
+                      latency=latency,
+                      n_small_files=n_small_files,
+                      small_file_size_kb=small_file_size_kb,
+                      n_large_files=n_large_files,
+                      large_file_size_mb=large_file_size_mb,
+                      n_workers=n_workers,
+                      n_connections=n_connections,
+                      asyncio=asyncio)
+
+    save_results("download", results, output)
+
+
+if __name__ == '__main__':
+    tyro.cli(main)
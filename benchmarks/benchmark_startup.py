@@ -0,0 +1,106 @@
+"""
+Measures cold-start latency of the nersemble_data entry points.
+Every target is run in a fresh interpreter with `python -X importtime`, such that regressions in import times (e.g., a
+heavy dependency that is suddenly imported at module level) show up in the results.
+
+Usage:
+    python benchmarks/benchmark_startup.py --repeats 10 --output startup.json
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import tyro
+
+REPO_ROOT = Path(__file__).parent.parent.resolve()
+
+TARGETS = {
+    "import_data_manager": "import nersemble_data.data.nersemble_data",
+    "import_constants": "import nersemble_data.constants",
+    "import_metadata": "import nersemble_data.util.metadata",
+    "import_cli": "import nersemble_data.scripts.manage_data",
+    "cli_help": "import sys; sys.argv = ['nersemble-data', '--help']\n"
+                "from nersemble_data.scripts.manage_data import app\n"
+                "try:\n"
+                "    app.cli()\n"
+                "except SystemExit:\n"
+                "    pass",
+    "path_helper": "from nersemble_data.data.nersemble_data import NeRSembleParticipantDataManager\n"
+                   "NeRSembleParticipantDataManager('.', 0).get_images_path('EXP-1-head', '222200037')",
+}
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    # Lines look like: "import time:       905 |      49607 |   numpy"
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        modules.append((module.rstrip(), int(self_us), int(cumulative_us)))
+
+    return modules
+
+
+def _run_target(statement: str, src_path: Path) -> Tuple[float, List[Tuple[str, int, int]]]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = f"{src_path}{os.pathsep}{env.get('PYTHONPATH', '')}"
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                               env=env, capture_output=True, text=True)
+    wall_time = time.perf_counter() - start
+    assert completed.returncode == 0, f"Benchmark target failed:\n{completed.stderr[-2000:]}"
+
+    return wall_time, _parse_importtime(completed.stderr)
+
+
+def main(repeats: int = 5, output: Optional[Path] = None, n_top_modules: int = 10, src_path: Path = REPO_ROOT / "src"):
+    """
+    Parameters
+    ----------
+    repeats:
+        How often each target is run. The median is reported
+    output:
+        If given, the results are additionally stored as JSON to compare them across commits
+    n_top_modules:
+        How many of the most expensive imports (cumulative time) are reported per target
+    src_path:
+        Where the nersemble_data package is imported from. Point it to another checkout to compare two versions
+    """
+
+    results: Dict[str, dict] = dict()
+    for name, statement in TARGETS.items():
+        wall_times = []
+        import_times = []
+        modules = []
+        for _ in range(repeats):
+            wall_time, modules = _run_target(statement, src_path)
+            wall_times.append(wall_time)
+            # Top-level imports are the ones that are not nested, i.e., their names are indented by a single space
+            import_times.append(sum(cumulative_us for module, _, cumulative_us in modules
+                                    if not module.startswith("  ")) / 1e6)
+
+        heaviest_modules = sorted(modules, key=lambda module: module[2], reverse=True)[:n_top_modules]
+        results[name] = {
+            "wall_time_s": statistics.median(wall_times),
+            "import_time_s": statistics.median(import_times),
+            "heaviest_imports": [{"module": module.strip(), "cumulative_s": cumulative_us / 1e6}
+                                 for module, _, cumulative_us in heaviest_modules],
+        }
+        print(f"{name:<24} wall: {results[name]['wall_time_s'] * 1000:7.1f} ms   "
+              f"imports: {results[name]['import_time_s'] * 1000:7.1f} ms")
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump({"python": sys.version, "repeats": repeats, "results": results}, f, indent=4)
+        print(f"Stored results in {output}")
+
+
+if __name__ == '__main__':
+    tyro.cli(main)
@@ -0,0 +1,58 @@
+"""
+Helpers that are shared by all benchmark scripts.
+"""
+
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional, Dict
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).parent.parent.resolve()
+
+
+def summarize_times(times: List[float]) -> Dict[str, float]:
+    """
+    Latency statistics in milliseconds.
+    """
+
+    times_ms = np.array(times) * 1000
+    return {
+        "n": len(times),
+        "mean_ms": float(times_ms.mean()),
+        "median_ms": float(np.median(times_ms)),
+        "p90_ms": float(np.percentile(times_ms, 90)),
+        "min_ms": float(times_ms.min()),
+        "max_ms": float(times_ms.max()),
+    }
+
+
+def get_environment_info() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+
+    return {
+        "commit": commit or None,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+
+def save_results(benchmark_name: str, results: dict, output: Optional[Path]):
+    """
+    Prints the results and stores them as JSON together with the commit they were measured on.
+    """
+
+    print(json.dumps(results, indent=4))
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump({"benchmark": benchmark_name, "environment": get_environment_info(), "results": results}, f, indent=4)
+        print(f"Stored results in {output}")
@@ -0,0 +1,70 @@
+"""
+Compares two JSON result files of the benchmark scripts, e.g., measured before and after a change.
+
+Usage:
+    python benchmarks/compare_results.py results_old.json results_new.json
+"""
+
+import json
+from pathlib import Path
+from typing import Dict
+
+import tyro
+
+# Metrics where larger values are better. For all other metrics (latencies, durations), smaller is better
+HIGHER_IS_BETTER_SUFFIXES = ("_per_second",)
+COMPARED_SUFFIXES = ("_per_second", "median_ms", "p90_ms", "duration_s", "wall_time_s", "import_time_s")
+
+
+def _flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    flat_results = dict()
+    for key, value in results.items():
+        if key == "config":
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat_results.update(_flatten(value, prefix=f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and name.endswith(COMPARED_SUFFIXES):
+            flat_results[name] = value
+
+    return flat_results
+
+
+def main(old: Path, new: Path, /, threshold: float = 0.05):
+    """
+    Parameters
+    ----------
+    old:
+        Results of the baseline
+    new:
+        Results to compare against the baseline
+    threshold:
+        Relative changes below this threshold are considered noise
+    """
+
+    with open(old) as f:
+        old_results = json.load(f)
+    with open(new) as f:
+        new_results = json.load(f)
+
+    print(f"old: {old_results.get('environment', {}).get('commit')}")
+    print(f"new: {new_results.get('environment', {}).get('commit')}")
+    old_metrics = _flatten(old_results['results'])
+    new_metrics = _flatten(new_results['results'])
+
+    names = [name for name in old_metrics.keys() if name in new_metrics]
+    width = max((len(name) for name in names), default=0)
+    for name in names:
+        old_value = old_metrics[name]
+        new_value = new_metrics[name]
+        change = (new_value - old_value) / old_value if old_value != 0 else 0.
+        is_improvement = change > 0 if name.endswith(HIGHER_IS_BETTER_SUFFIXES) else change < 0
+        if abs(change) < threshold:
+            verdict = ""
+        else:
+            verdict = "better" if is_improvement else "WORSE"
+        print(f"{name:<{width}}  {old_value:12.3f} -> {new_value:12.3f}  {change * 100:+7.1f}%  {verdict}")
+
+
+if __name__ == '__main__':
+    tyro.cli(main)
@@ -0,0 +1,50 @@
+"""
+Local HTTP file server with Range support and configurable latency, used to benchmark downloads without network noise.
+"""
+
+import time
+from http.server import BaseHTTPRequestHandler
+from typing import Optional
+
+from nersemble_data.util.file_server import FileServer
+
+
+class RangeHTTPServer(FileServer):
+    """
+    Serves the files of a folder on 127.0.0.1 in a background thread.
+    Usage:
+        with RangeHTTPServer(folder, latency=0.05) as server:
+            download_file(f"{server.url}/file.bin", ...)
+    """
+
+    def __init__(self, root: str, latency: float = 0., port: int = 0, max_bytes_per_second: Optional[float] = None):
+        """
+        Parameters
+        ----------
+        root:
+            Folder whose files are served
+        latency:
+            Seconds that every request waits before it is answered, simulates the round trip to a remote server
+        port:
+            Port to listen on. 0 picks a free port
+        max_bytes_per_second:
+            If given, every response is throttled to this speed
+        """
+
+        super().__init__(root, port=port)
+        self._latency = latency
+        self._max_bytes_per_second = max_bytes_per_second
+
+    def __enter__(self) -> 'RangeHTTPServer':
+        self.start()
+        return self
+
+    def _handle(self, handler: BaseHTTPRequestHandler, send_body: bool):
+        if self._latency > 0:
+            time.sleep(self._latency)
+        super()._handle(handler, send_body)
+
+    def _write_chunk(self, handler: BaseHTTPRequestHandler, chunk: bytes):
+        super()._write_chunk(handler, chunk)
+        if self._max_bytes_per_second is not None:
+            time.sleep(len(chunk) / self._max_bytes_per_second)
@@ -0,0 +1,59 @@
+"""
+Runs all benchmarks with their default settings and stores the results in a single JSON file.
+Compare two result files (e.g., before and after a change) with compare_results.py.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output results_new.json
+    python benchmarks/compare_results.py results_old.json results_new.json
+"""
+
+import tempfile
+from pathlib import Path
+from typing import Optional, Tuple, Literal
+
+import tyro
+
+import benchmark_color_correction
+import benchmark_decoding
+import benchmark_download
+from common import save_results
+
+BenchmarkName = Literal["decoding", "color_correction", "download"]
+
+
+def main(output: Optional[Path] = None,
+         benchmarks: Tuple[BenchmarkName, ...] = ("decoding", "color_correction", "download"),
+         data_folder: Optional[Path] = None,
+         latency: float = 0.02):
+    """
+    Parameters
+    ----------
+    output:
+        Where to store the results as JSON
+    benchmarks:
+        Which benchmarks to run
+    data_folder:
+        Where synthetic data is stored. Reusing the same folder across runs skips the data generation.
+        Defaults to a temporary folder
+    latency:
+        Latency of the local HTTP server for the download benchmark in seconds
+    """
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as temp_folder:
+        data_folder = Path(temp_folder if data_folder is None else data_folder)
+        if "decoding" in benchmarks:
+            print("Running decoding benchmark...")
+            results["decoding"] = benchmark_decoding.run(str(data_folder / "decoding"), frame_store=True)
+        if "color_correction" in benchmarks:
+            print("Running color correction benchmark...")
+            results["color_correction"] = benchmark_color_correction.run()
+        if "download" in benchmarks:
+            print("Running download benchmark...")
+            results["download"] = benchmark_download.run(str(data_folder / "download"), latency=latency)
+
+    save_results("all", results, output)
+
+
+if __name__ == '__main__':
+    tyro.cli(main)
@@ -0,0 +1,87 @@
+"""
+Generates a small synthetic NeRSemble folder (videos, calibration and color calibration) for benchmarking.
+"""
+
+import json
+from pathlib import Path
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from nersemble_data.constants import ASSETS, SERIALS
+
+
+def create_synthetic_ccm(rng: np.random.Generator) -> np.ndarray:
+    """
+    3x4 color correction matrix close to identity, i.e., the same shape as the CCMs that ship with the dataset.
+    """
+
+    return np.concatenate([np.eye(3), np.zeros((3, 1))], axis=1) + rng.normal(0, 0.05, size=(3, 4))
+
+
+def create_synthetic_video(video_path: str, n_frames: int, width: int, height: int, fps: float, rng: np.random.Generator):
+    Path(video_path).parent.mkdir(parents=True, exist_ok=True)
+    video_writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    assert video_writer.isOpened(), f"Could not create {video_path}"
+
+    # Moving noise texture, such that frames do not compress to nothing and decoding does real work
+    texture = rng.integers(0, 256, size=(height, width * 2, 3), dtype=np.uint8)
+    texture = cv2.GaussianBlur(texture, (9, 9), 3)
+    for frame_id in range(n_frames):
+        offset = (frame_id * 4) % width
+        video_writer.write(np.ascontiguousarray(texture[:, offset: offset + width]))
+    video_writer.release()
+
+
+def create_synthetic_dataset(nersemble_folder: str,
+                             participant_id: int = 1,
+                             sequences: Optional[List[str]] = None,
+                             n_cameras: int = 4,
+                             n_frames: int = 60,
+                             width: int = 1604,
+                             height: int = 1100,
+                             fps: float = 24,
+                             seed: int = 0) -> List[str]:
+    """
+    Writes synthetic videos and calibration files in the same folder layout as the downloaded dataset.
+    Existing videos are kept, such that repeated benchmark runs do not pay for the generation again.
+
+    Returns
+    -------
+        The serials of the generated cameras
+    """
+
+    rng = np.random.default_rng(seed)
+    sequences = ["EXP-1-head"] if sequences is None else sequences
+    serials = SERIALS[:n_cameras]
+
+    for seq_name in sequences:
+        for serial in serials:
+            relative_path = ASSETS['per_cam']['images'].format(p_id=participant_id, seq_name=seq_name, serial=serial)
+            video_path = f"{nersemble_folder}/{relative_path}"
+            if not Path(video_path).exists():
+                create_synthetic_video(video_path, n_frames, width, height, fps, rng)
+
+    color_calibration_path = Path(f"{nersemble_folder}/{ASSETS['per_person']['color_calibration'].format(p_id=participant_id)}")
+    color_calibration_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(color_calibration_path, 'w') as f:
+        json.dump({serial: create_synthetic_ccm(rng).tolist() for serial in serials}, f)
+
+    camera_calibration_path = Path(f"{nersemble_folder}/{ASSETS['per_person']['calibration'].format(p_id=participant_id)}")
+    intrinsics = [[2 * width, 0, width / 2], [0, 2 * width, height / 2], [0, 0, 1]]
+    with open(camera_calibration_path, 'w') as f:
+        json.dump({"world_2_cam": {serial: np.eye(4).tolist() for serial in serials}, "intrinsics": intrinsics}, f)
+
+    return serials
+
+
+def create_random_file(path: str, size: int, seed: int = 0):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    if Path(path).exists() and Path(path).stat().st_size == size:
+        return
+
+    rng = np.random.default_rng(seed)
+    with open(path, 'wb') as f:
+        for start in range(0, size, 8 << 20):
+            f.write(rng.integers(0, 256, size=min(8 << 20, size - start), dtype=np.uint8).tobytes())
@@ -0,0 +1,212 @@
+import json
+import os
+import tarfile
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Optional, Iterable, Tuple, Callable
+
+from nersemble_data.data.participant_index import ParticipantIndex, SequenceInfo, CameraInfo
+from nersemble_data.util.files import write_atomic
+
+# An exported archive is a folder with uncompressed tar shards and one index that stores where each file's bytes start
+# inside its shard. Since tar stores file contents unmodified and contiguously, any file can be read with a single
+# offset read, and videos can be decoded directly from the shard without unpacking it
+ARCHIVE_INDEX_NAME = "nersemble_archive.json"
+ARCHIVE_SHARD_NAME = "shard-{shard_id:05d}.tar"
+ARCHIVE_VERSION = 1
+DEFAULT_SHARD_SIZE = 16 << 30  # 16 GB
+
+
+@dataclass
+class ArchiveMember:
+    shard_id: int
+    offset: int  # Start of the file's data inside the shard
+    size: int
+
+
+class ShardedArchive:
+    """
+    Read access to the files of an archive that was written with export_archive(). Files are addressed by their
+    relative path inside the NeRSemble folder, e.g., `001/calibration/camera_params.json`.
+    """
+
+    def __init__(self,
+                 archive_folder: str,
+                 members: Dict[str, ArchiveMember],
+                 participants: Dict[int, Dict[str, SequenceInfo]],
+                 index_mtime_ns: int):
+        self._archive_folder = archive_folder
+        self._members = members
+        self._participants = participants
+        self.index_mtime_ns = index_mtime_ns
+
+    @staticmethod
+    def open(archive_folder: str) -> Optional['ShardedArchive']:
+        """
+        Opens the archive in archive_folder, or returns None if the folder does not contain an archive index.
+        The index is only parsed once per process (and again after it changed).
+        """
+
+        index_path = f"{archive_folder}/{ARCHIVE_INDEX_NAME}"
+        try:
+            mtime_ns = os.stat(index_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        return _load_archive(str(Path(archive_folder).resolve()), mtime_ns)
+
+    @staticmethod
+    def is_archive(folder: str) -> bool:
+        return Path(f"{folder}/{ARCHIVE_INDEX_NAME}").exists()
+
+    def list_participants(self) -> List[int]:
+        return sorted(self._participants.keys())
+
+    def get_participant_index(self, participant_id: int) -> ParticipantIndex:
+        """
+        Index of the exported sequences and cameras of a participant. Stored in the archive, i.e., videos do not have
+        to be probed.
+        """
+
+        return ParticipantIndex(self._participants.get(participant_id, dict()))
+
+    def exists(self, relative_path: str) -> bool:
+        return relative_path in self._members
+
+    def get_member(self, relative_path: str) -> ArchiveMember:
+        assert relative_path in self._members, f"{relative_path} is not contained in the archive {self._archive_folder}"
+        return self._members[relative_path]
+
+    def get_shard_path(self, shard_id: int) -> str:
+        return f"{self._archive_folder}/{ARCHIVE_SHARD_NAME.format(shard_id=shard_id)}"
+
+    def read_bytes(self, relative_path: str) -> bytes:
+        member = self.get_member(relative_path)
+        with open(self.get_shard_path(member.shard_id), 'rb') as f:
+            f.seek(member.offset)
+            data = f.read(member.size)
+
+        assert len(data) == member.size, f"Shard {self.get_shard_path(member.shard_id)} is truncated"
+        return data
+
+    def load_json(self, relative_path: str):
+        return json.loads(self.read_bytes(relative_path))
+
+    def get_video_url(self, relative_path: str) -> str:
+        """
+        FFmpeg URL that reads the file directly from its byte range in the shard. Both video backends (OpenCV and
+        PyAV) open it like a regular video file and seek within that byte range.
+        """
+
+        member = self.get_member(relative_path)
+        return f"subfile,,start,{member.offset},end,{member.offset + member.size},,:{self.get_shard_path(member.shard_id)}"
+
+
+@lru_cache(maxsize=8)
+def _load_archive(archive_folder: str, mtime_ns: int) -> ShardedArchive:
+    with open(f"{archive_folder}/{ARCHIVE_INDEX_NAME}") as f:
+        index = json.load(f)
+    assert index['version'] == ARCHIVE_VERSION, \
+        f"Archive {archive_folder} has version {index['version']}, expected {ARCHIVE_VERSION}. Re-run export"
+
+    members = {relative_path: ArchiveMember(*member) for relative_path, member in index['members'].items()}
+    participants = {int(p_id): {seq_name: SequenceInfo(cameras={serial: CameraInfo(**camera_info)
+                                                                for serial, camera_info in cameras.items()})
+                                for seq_name, cameras in sequences.items()}
+                    for p_id, sequences in index['participants'].items()}
+
+    return ShardedArchive(archive_folder, members, participants, mtime_ns)
+
+
+def export_archive(nersemble_folder: str,
+                   relative_paths: Iterable[str],
+                   archive_folder: str,
+                   participants: Dict[int, Dict[str, Dict[str, CameraInfo]]],
+                   max_shard_size: int = DEFAULT_SHARD_SIZE,
+                   on_file_written: Optional[Callable[[str], None]] = None) -> Tuple[int, int]:
+    """
+    Streams local files into uncompressed tar shards of at most max_shard_size bytes (a single file larger than that
+    gets a shard on its own). Files keep their relative path as name, hence the shards can also be unpacked with
+    regular tar or consumed by tar-based loaders such as WebDataset. Files of the same participant should be passed
+    consecutively, such that they end up in as few shards as possible.
+    The index is written last, i.e., an archive folder without index is incomplete.
+
+    Parameters
+    ----------
+    nersemble_folder:
+        Local NeRSemble folder that contains the files
+    relative_paths:
+        Which files to export, relative to nersemble_folder
+    archive_folder:
+        Where to write the shards and the index
+    participants:
+        For each exported participant, the exported cameras of each sequence with their frame counts, resolution and
+        fps. Stored in the index such that readers do not have to probe the videos
+    max_shard_size:
+        Shards are closed once they would exceed this size
+    on_file_written:
+        Optional callback that receives the relative path of every file once it was written
+
+    Returns
+    -------
+        The number of shards and the total number of exported bytes
+    """
+
+    Path(archive_folder).mkdir(parents=True, exist_ok=True)
+    index_path = f"{archive_folder}/{ARCHIVE_INDEX_NAME}"
+    if Path(index_path).exists():
+        # Readers must not see an index that points into shards that are being overwritten
+        os.remove(index_path)
+
+    members = dict()
+    n_bytes = 0
+    shard_id = -1
+    tar = None
+    try:
+        for relative_path in relative_paths:
+            local_path = f"{nersemble_folder}/{relative_path}"
+            tar_info = tarfile.TarInfo(relative_path)
+            stat = os.stat(local_path)
+            tar_info.size = stat.st_size
+            tar_info.mtime = int(stat.st_mtime)
+            tar_info.mode = 0o644
+
+            if tar is None or (tar.offset > 0 and tar.offset + tar_info.size > max_shard_size):
+                if tar is not None:
+                    tar.close()
+                shard_id += 1
+                tar = tarfile.open(f"{archive_folder}/{ARCHIVE_SHARD_NAME.format(shard_id=shard_id)}", 'w', format=tarfile.PAX_FORMAT)
+
+            with open(local_path, 'rb') as f:
+                tar.addfile(tar_info, f)
+
+            # addfile() advances the offset past the header, the data, and the padding to the next 512-byte block
+            n_data_blocks = -(-tar_info.size // tarfile.BLOCKSIZE)
+            members[relative_path] = [shard_id, tar.offset - n_data_blocks * tarfile.BLOCKSIZE, tar_info.size]
+            n_bytes += tar_info.size
+
+            if on_file_written is not None:
+                on_file_written(relative_path)
+    finally:
+        if tar is not None:
+            tar.close()
+
+    # Shards of a previous export with more shards would otherwise linger around
+    for stale_shard_id in range(shard_id + 1, 1 << 20):
+        stale_shard_path = Path(f"{archive_folder}/{ARCHIVE_SHARD_NAME.format(shard_id=stale_shard_id)}")
+        if not stale_shard_path.exists():
+            break
+        stale_shard_path.unlink()
+
+    index = {
+        'version': ARCHIVE_VERSION,
+        'n_shards': shard_id + 1,
+        'members': members,
+        'participants': {str(p_id): {seq_name: {serial: asdict(camera_info) for serial, camera_info in cameras.items()}
+                                     for seq_name, cameras in sequences.items()}
+                         for p_id, sequences in participants.items()},
+    }
+    write_atomic(index_path, json.dumps(index))
+
+    return shard_id + 1, n_bytes
@@ -0,0 +1,369 @@
+import hashlib
+import os
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import List, Dict, Optional, Tuple, Callable, TYPE_CHECKING
+
+import numpy as np
+
+from nersemble_data.data.nersemble_data import NeRSembleParticipantDataManager
+from nersemble_data.util.color_correction import ColorCorrector
+
+if TYPE_CHECKING:
+    from multiprocessing.shared_memory import SharedMemory
+    from nersemble_data.data.cameras import CameraArrays
+
+# Shared memory segments start with a header of int64 values [is_ready, n_cams, height, width, owner_pid], followed by
+# the (n_cams, height, width, 3) uint8 backgrounds. is_ready is set last, such that processes that attach to the segment
+# never see a partially written array. owner_pid allows to detect segments whose creator crashed while loading
+_HEADER_SIZE = 64
+_HEADER_LENGTH = 5
+_SHARED_MEMORY_TIMEOUT = 120  # Seconds to wait for another process to finish loading a shared segment
+_SHARED_MEMORY_OWNER_TIMEOUT = 1  # Seconds after which a segment without owner_pid is considered stale
+
+
+@dataclass
+class ParticipantAssets:
+    participant_id: int
+    serials: List[str]
+    backgrounds: np.ndarray  # (n_cams, H, W, 3) uint8 RGB in the order of serials
+    camera_calibration: Optional['CameraArrays']  # None if the calibration was not downloaded
+    color_calibration: Dict[str, np.ndarray]  # Empty if the color calibration was not downloaded
+    _color_correctors: Dict[str, ColorCorrector] = field(default_factory=dict, repr=False)
+    _shared_memory: Optional['SharedMemory'] = field(default=None, repr=False)
+    _shared_memory_creator_pid: Optional[int] = field(default=None, repr=False)
+
+    def get_background(self, serial: str) -> np.ndarray:
+        return self.backgrounds[self.serials.index(serial)]
+
+    def get_color_corrector(self, serial: str) -> ColorCorrector:
+        color_corrector = self._color_correctors.get(serial)
+        if color_corrector is None:
+            color_corrector = ColorCorrector(self.color_calibration[serial])
+            self._color_correctors[serial] = color_corrector
+
+        return color_corrector
+
+    @property
+    def nbytes(self) -> int:
+        return self.backgrounds.nbytes
+
+    @property
+    def is_shared(self) -> bool:
+        return self._shared_memory is not None
+
+    def _release(self, close: bool = False):
+        # Only the creator removes the segment. Arrays that are still referenced stay valid until they are dropped
+        if self._shared_memory is None:
+            return
+
+        if self._shared_memory_creator_pid == os.getpid():
+            try:
+                self._shared_memory.unlink()
+            except FileNotFoundError:
+                pass
+
+        if close:
+            # The handle is closed as soon as no array points into the segment anymore, see _share_backgrounds()
+            self.backgrounds = np.empty((0, *self.backgrounds.shape[1:]), dtype=np.uint8)
+            self._shared_memory = None
+
+
+class AssetCache:
+    """
+    Participant-level cache of the assets that are identical for all frames of a participant: the background images of
+    all cameras (stacked into one contiguous array), the camera calibration and the color correction matrices.
+    Once the cached backgrounds exceed `max_bytes`, participants are evicted in least-recently-used order.
+
+    With shared_memory=True, backgrounds are stored in named shared memory segments. The first process that requests a
+    participant loads the backgrounds, all other processes on the same machine (e.g., DataLoader workers) map the same
+    segment instead of holding their own copy. A segment is removed when the process that created it evicts it or
+    closes the cache. Calling get() for all participants in the main process before the workers are started keeps the
+    segments alive for the whole training.
+    """
+
+    def __init__(self,
+                 nersemble_folder: str,
+                 max_bytes: Optional[int] = 4 << 30,
+                 downscale_factor: Optional[float] = None,
+                 n_workers: int = 16,
+                 shared_memory: bool = False):
+        """
+        Parameters
+        ----------
+        nersemble_folder:
+            Local folder that contains the downloaded NeRSemble data
+        max_bytes:
+            Upper bound for the size of all cached backgrounds. The most recently used participant is always kept,
+            even if it alone exceeds the bound. None disables eviction
+        downscale_factor:
+            If given, backgrounds are cached downscaled by this factor
+        n_workers:
+            Number of threads that decode the background images of a participant in parallel
+        shared_memory:
+            Whether backgrounds are placed in shared memory such that all processes on the machine use the same copy
+        """
+
+        self._nersemble_folder = nersemble_folder
+        self._max_bytes = max_bytes
+        self._downscale_factor = downscale_factor
+        self._n_workers = n_workers
+        self._shared_memory = shared_memory
+
+        self._assets: Dict[int, ParticipantAssets] = OrderedDict()  # In least-recently-used order
+        self._lock = Lock()
+
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_evictions = 0
+        self.n_shared_attaches = 0
+
+    def get(self, participant_id: int) -> ParticipantAssets:
+        """
+        Returns the cached assets of the participant, loading them first if needed.
+        """
+
+        with self._lock:
+            assets = self._assets.get(participant_id)
+            if assets is not None:
+                self._assets.move_to_end(participant_id)
+                self.n_hits += 1
+                return assets
+
+            self.n_misses += 1
+            assets = self._load(participant_id)
+            self._assets[participant_id] = assets
+            while self._max_bytes is not None and len(self._assets) > 1 \
+                    and sum(cached_assets.nbytes for cached_assets in self._assets.values()) > self._max_bytes:
+                _, evicted_assets = self._assets.popitem(last=False)
+                evicted_assets._release()
+                self.n_evictions += 1
+
+            return assets
+
+    def evict(self, participant_id: int) -> bool:
+        with self._lock:
+            assets = self._assets.pop(participant_id, None)
+            if assets is None:
+                return False
+            assets._release()
+            self.n_evictions += 1
+            return True
+
+    def close(self):
+        with self._lock:
+            for assets in self._assets.values():
+                assets._release(close=True)
+            self._assets.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "n_participants": len(self._assets),
+            "n_bytes": sum(assets.nbytes for assets in self._assets.values()),
+            "n_hits": self.n_hits,
+            "n_misses": self.n_misses,
+            "n_evictions": self.n_evictions,
+            "n_shared_attaches": self.n_shared_attaches,
+        }
+
+    def __enter__(self) -> 'AssetCache':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getstate__(self) -> dict:
+        # Cached arrays are not sent to other processes. In shared memory mode, they attach to the segments by name
+        state = self.__dict__.copy()
+        state['_assets'] = OrderedDict()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    # ----------------------------------------------------------
+    # Loading
+    # ----------------------------------------------------------
+
+    def _load(self, participant_id: int) -> ParticipantAssets:
+        data_manager = NeRSembleParticipantDataManager(self._nersemble_folder, participant_id)
+        serials = data_manager.list_backgrounds()
+
+        camera_calibration = None
+        if data_manager.has_camera_calibration():
+            camera_calibration = data_manager.load_camera_calibration().as_arrays(serials)
+        color_calibration = dict()
+        if data_manager.has_color_calibration():
+            color_calibration = data_manager.load_color_calibration()
+
+        shared_memory = None
+        is_creator = False
+        if self._shared_memory and serials:
+            backgrounds, shared_memory, is_creator = self._load_shared_backgrounds(data_manager, serials)
+        else:
+            backgrounds = self._load_backgrounds(data_manager, serials)
+
+        return ParticipantAssets(participant_id, serials, backgrounds,
+                                 camera_calibration=camera_calibration,
+                                 color_calibration=color_calibration,
+                                 _shared_memory=shared_memory,
+                                 _shared_memory_creator_pid=os.getpid() if is_creator else None)
+
+    def _load_backgrounds(self,
+                          data_manager: NeRSembleParticipantDataManager,
+                          serials: List[str],
+                          allocate: Optional[Callable[[Tuple[int, ...]], np.ndarray]] = None) -> np.ndarray:
+        if not serials:
+            return np.empty((0, 0, 0, 3), dtype=np.uint8)
+
+        # The image size is only known after decoding the first background
+        first_background = data_manager.load_background(serials[0], downscale_factor=self._downscale_factor)
+        shape = (len(serials), *first_background.shape)
+        backgrounds = np.empty(shape, dtype=np.uint8) if allocate is None else allocate(shape)
+        backgrounds[0] = first_background
+
+        def load_background(i_serial: int):
+            data_manager.load_background(serials[i_serial], downscale_factor=self._downscale_factor, out=backgrounds[i_serial])
+
+        # JPEG decoding releases the GIL, every thread decodes directly into its slice of the contiguous array
+        with ThreadPoolExecutor(max_workers=self._n_workers) as executor:
+            list(executor.map(load_background, range(1, len(serials))))
+
+        return backgrounds
+
+    def _load_shared_backgrounds(self,
+                                 data_manager: NeRSembleParticipantDataManager,
+                                 serials: List[str]) -> Tuple[np.ndarray, Optional['SharedMemory'], bool]:
+        from multiprocessing import shared_memory
+
+        name = self._get_shared_memory_name(data_manager, serials)
+        try:
+            segment = _attach_shared_memory(name)
+        except FileNotFoundError:
+            segment = None
+        except ValueError:
+            # The creator crashed before it could even size the segment
+            print(f"[Warning] Cannot use the shared backgrounds of participant {data_manager.participant_id} "
+                  f"(empty segment). Loading them without shared memory")
+            return self._load_backgrounds(data_manager, serials), None, False
+
+        if segment is None:
+            created_segments = []
+
+            def allocate(shape: Tuple[int, ...]) -> np.ndarray:
+                created_segment = shared_memory.SharedMemory(name=name, create=True, size=_HEADER_SIZE + int(np.prod(shape)))
+                created_segments.append(created_segment)
+                header = np.ndarray((_HEADER_LENGTH,), dtype=np.int64, buffer=created_segment.buf)
+                header[4] = os.getpid()
+                header[1:4] = shape[:3]
+                return np.ndarray(shape, dtype=np.uint8, buffer=created_segment.buf, offset=_HEADER_SIZE)
+
+            try:
+                backgrounds = self._load_backgrounds(data_manager, serials, allocate=allocate)
+                np.ndarray((_HEADER_LENGTH,), dtype=np.int64, buffer=created_segments[0].buf)[0] = 1  # Ready
+                return _share_backgrounds(backgrounds, created_segments[0]), created_segments[0], True
+            except FileExistsError:
+                # Another process created the segment in the meantime
+                segment = _attach_shared_memory(name)
+            except Exception:
+                if created_segments:
+                    created_segments[0].unlink()
+                raise
+
+        backgrounds, error = _wait_for_backgrounds(segment)
+        if backgrounds is None:
+            print(f"[Warning] Cannot use the shared backgrounds of participant {data_manager.participant_id} "
+                  f"({error}). Loading them without shared memory")
+            if error != "timed out":
+                # Nobody will finish the segment anymore. Removing it allows later requests to create a new one
+                try:
+                    segment.unlink()
+                except FileNotFoundError:
+                    pass
+            segment.close()
+            return self._load_backgrounds(data_manager, serials), None, False
+
+        self.n_shared_attaches += 1
+        return _share_backgrounds(backgrounds, segment), segment, False
+
+    def _get_shared_memory_name(self, data_manager: NeRSembleParticipantDataManager, serials: List[str]) -> str:
+        # Backgrounds that were replaced on disk must not be served from an old segment
+        archive = data_manager.get_archive()
+        if archive is not None:
+            # Files inside an archive only change if the whole archive is exported again
+            mtimes = [archive.index_mtime_ns]
+        else:
+            mtimes = [os.stat(data_manager.get_background_path(serial)).st_mtime_ns for serial in serials]
+        key = f"{Path(self._nersemble_folder).resolve()}|{data_manager.participant_id}|{serials}|{mtimes}|{self._downscale_factor}"
+        # Short names, macOS only allows 31 characters
+        return f"nersemble_{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+
+
+def _attach_shared_memory(name: str) -> 'SharedMemory':
+    from multiprocessing import shared_memory
+
+    # NB: Attaching also registers the segment with the resource tracker. DataLoader workers share the tracker of the
+    # main process, hence this does not change when the segment is removed. Processes with their own tracker remove
+    # the segment when they exit, later requests then simply create a new one
+    return shared_memory.SharedMemory(name=name)
+
+
+def _share_backgrounds(backgrounds: np.ndarray, segment: 'SharedMemory') -> np.ndarray:
+    # Arrays do not keep the mapping alive: closing the segment while they are still used would crash the process.
+    # Hence, the handle is closed once the backgrounds and all views of them were dropped. This also keeps the segment
+    # from being closed by garbage collection earlier
+    weakref.finalize(backgrounds, segment.close)
+    return backgrounds
+
+
+def _is_process_alive(pid: int) -> bool:
+    if os.name == 'nt':
+        # os.kill() terminates the process on Windows. Segments of crashed processes vanish there anyway
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Process of another user
+    return True
+
+
+def _wait_for_backgrounds(segment: 'SharedMemory') -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """
+    Waits until the creator of the segment finished loading the backgrounds.
+
+    Returns
+    -------
+        The backgrounds, or None and the reason why the segment cannot be used
+    """
+
+    if segment.size < _HEADER_SIZE:
+        return None, "stale segment"
+
+    header = np.ndarray((_HEADER_LENGTH,), dtype=np.int64, buffer=segment.buf)
+    start = time.monotonic()
+    while header[0] != 1:
+        waited = time.monotonic() - start
+        owner_pid = int(header[4])
+        if header[0] != 0 or (owner_pid == 0 and waited > _SHARED_MEMORY_OWNER_TIMEOUT):
+            return None, "stale segment"
+        if owner_pid != 0 and not _is_process_alive(owner_pid):
+            return None, f"creator process {owner_pid} crashed"
+        if waited > _SHARED_MEMORY_TIMEOUT:
+            return None, "timed out"
+        time.sleep(0.01)
+
+    shape = (*header[1:4].tolist(), 3)
+    if min(shape) <= 0 or segment.size < _HEADER_SIZE + int(np.prod(shape)):
+        return None, "stale segment"
+
+    return np.ndarray(shape, dtype=np.uint8, buffer=segment.buf, offset=_HEADER_SIZE), None
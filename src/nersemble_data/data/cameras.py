@@ -0,0 +1,181 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from dreifus.matrix import Pose, Intrinsics
+from elias.config import Config
+
+from nersemble_data.constants import SERIALS
+from nersemble_data.util.image import get_downscaled_size
+
+# Resolution of the videos that the intrinsics refer to
+IMAGE_WIDTH = 3208
+IMAGE_HEIGHT = 2200
+
+
+@dataclass
+class CameraParams(Config):
+    world_2_cam: Dict[str, Pose]
+    intrinsics: Intrinsics
+
+    def as_arrays(self, serials: Optional[List[str]] = None) -> 'CameraArrays':
+        """
+        Stacks the calibration of all cameras into arrays for vectorized processing.
+
+        Parameters
+        ----------
+        serials:
+            Camera order of the stacked arrays. Defaults to all calibrated cameras in the canonical order of SERIALS
+        """
+
+        if serials is None:
+            serials = [serial for serial in SERIALS if serial in self.world_2_cam]
+
+        world_2_cam = np.stack([np.asarray(self.world_2_cam[serial], dtype=np.float64) for serial in serials])
+        intrinsics = np.repeat(np.asarray(self.intrinsics, dtype=np.float64)[None], len(serials), axis=0)
+        return CameraArrays(serials, world_2_cam, intrinsics)
+
+
+class CameraArrays:
+    """
+    Array-backed view of a camera calibration. All arrays share the same camera order given by `serials`.
+    Extrinsics follow the OpenCV camera coordinate convention (x right, y down, z forward).
+    """
+
+    def __init__(self, serials: List[str], world_2_cam: np.ndarray, intrinsics: np.ndarray):
+        """
+        Parameters
+        ----------
+        serials:
+            Camera order of all arrays
+        world_2_cam:
+            (n_cams, 4, 4) extrinsic matrices in W2C direction
+        intrinsics:
+            (n_cams, 3, 3) intrinsic matrices for IMAGE_WIDTH x IMAGE_HEIGHT images
+        """
+
+        assert world_2_cam.shape == (len(serials), 4, 4), f"Expected world_2_cam of shape ({len(serials)}, 4, 4), got {world_2_cam.shape}"
+        assert intrinsics.shape == (len(serials), 3, 3), f"Expected intrinsics of shape ({len(serials)}, 3, 3), got {intrinsics.shape}"
+
+        self.serials = serials
+        self.world_2_cam = world_2_cam
+        self.intrinsics = intrinsics
+
+        # Inverting rigid transformations analytically is exact and cheaper than a general matrix inverse
+        rotations_c2w = world_2_cam[:, :3, :3].transpose(0, 2, 1)
+        self.cam_2_world = np.zeros_like(world_2_cam)
+        self.cam_2_world[:, :3, :3] = rotations_c2w
+        self.cam_2_world[:, :3, 3] = -np.matmul(rotations_c2w, world_2_cam[:, :3, 3:])[..., 0]
+        self.cam_2_world[:, 3, 3] = 1
+
+        self.projection = np.matmul(intrinsics, world_2_cam[:, :3, :])  # (n_cams, 3, 4)
+
+    def get_intrinsics(self, downscale_factor: Optional[float] = None) -> np.ndarray:
+        """
+        (n_cams, 3, 3) intrinsics for images that were downscaled by downscale_factor with load_image().
+        Pixel centers lie on integer coordinates. Area downscaling maps the center of downscaled pixel x to
+        (x + 0.5) * s - 0.5 in the full-resolution image, hence the principal point moves by half a pixel in addition
+        to the scaling. s is the exact ratio of the image sizes, which differs slightly from downscale_factor if the
+        downscaled size had to be rounded.
+        """
+
+        if downscale_factor is None or downscale_factor == 1:
+            return self.intrinsics
+
+        width, height = get_downscaled_size(IMAGE_WIDTH, IMAGE_HEIGHT, downscale_factor)
+        scale = np.array([width / IMAGE_WIDTH, height / IMAGE_HEIGHT])
+        intrinsics = self.intrinsics.copy()
+        intrinsics[:, :2] *= scale[None, :, None]
+        intrinsics[:, :2, 2] += 0.5 * scale - 0.5
+        return intrinsics
+
+    def get_projection(self, downscale_factor: Optional[float] = None) -> np.ndarray:
+        """
+        (n_cams, 3, 4) projection matrices K @ [R | t] for images that were downscaled by downscale_factor.
+        """
+
+        if downscale_factor is None or downscale_factor == 1:
+            return self.projection
+
+        return np.matmul(self.get_intrinsics(downscale_factor), self.world_2_cam[:, :3, :])
+
+    def project(self, points: np.ndarray, downscale_factor: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Projects 3D points into all cameras at once.
+
+        Parameters
+        ----------
+        points:
+            (N, 3) points in world space
+        downscale_factor:
+            If given, pixel coordinates refer to images that were downscaled by this factor
+
+        Returns
+        -------
+            (n_cams, N, 2) pixel coordinates (x, y) and (n_cams, N) depths along the cameras' viewing directions.
+            Points behind a camera have non-positive depth
+        """
+
+        assert points.ndim == 2 and points.shape[1] == 3, f"Expected points of shape (N, 3), got {points.shape}"
+        projection = self.get_projection(downscale_factor)
+
+        # (n_cams, 3, 3) @ (3, N) + (n_cams, 3, 1) -> (n_cams, 3, N)
+        projected = np.matmul(projection[:, :, :3], points.T) + projection[:, :, 3:]
+        depths = projected[:, 2]
+        pixels = (projected[:, :2] / depths[:, None]).transpose(0, 2, 1)
+
+        return pixels, depths
+
+    def get_rays(self,
+                 downscale_factor: Optional[float] = None,
+                 normalize: bool = True,
+                 dtype: Union[str, np.dtype] = np.float32) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Computes one ray per pixel for all cameras at once.
+
+        Parameters
+        ----------
+        downscale_factor:
+            If given, rays are computed for the pixel grid of images that were downscaled by this factor
+        normalize:
+            Whether ray directions are normalized to unit length. Otherwise, directions have unit depth (z = 1 in
+            camera space), such that origin + depth * direction is the 3D point at that depth
+        dtype:
+            dtype of the returned arrays
+
+        Returns
+        -------
+            (n_cams, 3) ray origins (the camera centers, shared by all rays of a camera) and (n_cams, H, W, 3) ray
+            directions in world space
+        """
+
+        # Same image size as load_image() with this downscale_factor
+        width, height = get_downscaled_size(IMAGE_WIDTH, IMAGE_HEIGHT, downscale_factor)
+        intrinsics = self.get_intrinsics(downscale_factor)
+
+        # Directions in camera space via the inverse intrinsics. Pixel centers lie on integer coordinates
+        fx = intrinsics[:, 0, 0, None, None]
+        fy = intrinsics[:, 1, 1, None, None]
+        cx = intrinsics[:, 0, 2, None, None]
+        cy = intrinsics[:, 1, 2, None, None]
+        skew = intrinsics[:, 0, 1, None, None]
+        xs = np.arange(width, dtype=np.float64)[None, None, :]
+        ys = np.arange(height, dtype=np.float64)[None, :, None]
+
+        n_cams = len(self.serials)
+        directions_cam = np.empty((n_cams, height, width, 3), dtype=np.float64)
+        directions_cam[..., 1] = (ys - cy) / fy
+        directions_cam[..., 0] = (xs - cx - skew * directions_cam[..., 1]) / fx
+        directions_cam[..., 2] = 1
+
+        # (n_cams, H * W, 3) @ (n_cams, 3, 3) rotates all directions of a camera in a single matrix product
+        directions = np.matmul(directions_cam.reshape(n_cams, -1, 3), self.cam_2_world[:, :3, :3].transpose(0, 2, 1))
+        directions = directions.reshape(n_cams, height, width, 3)
+        if normalize:
+            directions /= np.linalg.norm(directions, axis=-1, keepdims=True)
+
+        origins = self.cam_2_world[:, :3, 3]
+        return origins.astype(dtype), directions.astype(dtype, copy=False)
+
+    def __len__(self) -> int:
+        return len(self.serials)
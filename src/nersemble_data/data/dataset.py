@@ -0,0 +1,466 @@
+import multiprocessing
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional, Dict, Iterator, Union, Tuple
+
+import numpy as np
+
+from nersemble_data.data.nersemble_data import NeRSembleDataManager, NeRSembleParticipantDataManager
+from nersemble_data.util.image import Interpolation
+
+try:
+    from torch.utils.data import Dataset, IterableDataset, get_worker_info
+except ImportError:
+    # Without torch, the datasets can be used with SimpleDataLoader
+    Dataset = object
+    IterableDataset = object
+    get_worker_info = None
+
+
+@dataclass
+class WorkerInfo:
+    id: int
+    num_workers: int
+
+
+_worker_info: Optional[WorkerInfo] = None  # Set in the worker processes of SimpleDataLoader
+
+
+def get_nersemble_worker_info() -> Optional[WorkerInfo]:
+    """
+    Which worker the current process is, either within a torch DataLoader or a SimpleDataLoader.
+    None in the main process.
+    """
+
+    if get_worker_info is not None:
+        torch_worker_info = get_worker_info()
+        if torch_worker_info is not None:
+            return WorkerInfo(torch_worker_info.id, torch_worker_info.num_workers)
+
+    return _worker_info
+
+
+@dataclass
+class _SequenceUnit:
+    participant_id: int
+    sequence_name: str
+    serials: List[str]
+    timesteps: List[int]
+
+
+class _NeRSembleDatasetBase:
+
+    def __init__(self,
+                 nersemble_folder: str,
+                 participant_ids: Optional[List[int]] = None,
+                 sequences: Optional[List[str]] = None,
+                 serials: Optional[List[str]] = None,
+                 timestep_stride: int = 1,
+                 shuffle: bool = False,
+                 seed: int = 0,
+                 as_uint8: bool = False,
+                 apply_color_correction: bool = False,
+                 downscale_factor: Optional[float] = None,
+                 dtype: Optional[Union[str, np.dtype]] = None,
+                 interpolation: Interpolation = 'bilinear',
+                 max_open_videos: int = 32,
+                 video_backend: str = 'opencv'):
+        self._nersemble_folder = nersemble_folder
+        self._shuffle = shuffle
+        self._seed = seed
+        self._epoch = 0
+        self._load_kwargs = dict(as_uint8=as_uint8,
+                                 apply_color_correction=apply_color_correction,
+                                 downscale_factor=downscale_factor,
+                                 dtype=dtype,
+                                 interpolation=interpolation)
+        self._max_open_videos = max_open_videos
+        self._video_backend = video_backend
+
+        self._units = self._index_sequences(participant_ids, sequences, serials, timestep_stride)
+
+        # Data managers (and their video decoders) belong to the process that created them. Decoder handles must not
+        # be shared across fork(), hence every worker lazily creates its own managers
+        self._data_managers: Dict[int, NeRSembleParticipantDataManager] = dict()
+        self._data_managers_pid: Optional[int] = None
+
+    def set_epoch(self, epoch: int):
+        """
+        Shuffled orders are derived from seed and epoch, i.e., the same (seed, epoch) always gives the same order.
+        """
+
+        self._epoch = epoch
+
+    def _index_sequences(self,
+                         participant_ids: Optional[List[int]],
+                         sequences: Optional[List[str]],
+                         serials: Optional[List[str]],
+                         timestep_stride: int) -> List[_SequenceUnit]:
+        if participant_ids is None:
+            participant_ids = sorted(NeRSembleDataManager(self._nersemble_folder).list_participants())
+
+        units = []
+        for p_id in participant_ids:
+            # Only used for indexing, closed before any worker is started
+            with NeRSembleParticipantDataManager(self._nersemble_folder, p_id) as data_manager:
+                for seq_name in sorted(data_manager.list_sequences()):
+                    if sequences is not None and seq_name not in sequences:
+                        continue
+
+                    available_serials = data_manager.list_default_serials(seq_name)
+                    selected_serials = [serial for serial in available_serials if serials is None or serial in serials]
+                    if not selected_serials:
+                        # E.g., BACKGROUND which has no videos
+                        continue
+
+                    n_timesteps = data_manager.get_n_timesteps(seq_name)
+                    units.append(_SequenceUnit(p_id, seq_name, selected_serials, list(range(0, n_timesteps, timestep_stride))))
+
+        return units
+
+    def _get_data_manager(self, participant_id: int) -> NeRSembleParticipantDataManager:
+        if self._data_managers_pid != os.getpid():
+            # Managers that were inherited from the parent process are dropped without touching their decoders
+            self._data_managers = dict()
+            self._data_managers_pid = os.getpid()
+
+        data_manager = self._data_managers.get(participant_id)
+        if data_manager is None:
+            data_manager = NeRSembleParticipantDataManager(self._nersemble_folder, participant_id,
+                                                           max_open_videos=self._max_open_videos,
+                                                           video_backend=self._video_backend)
+            self._data_managers[participant_id] = data_manager
+
+        return data_manager
+
+    def _get_rng(self) -> np.random.Generator:
+        return np.random.default_rng([self._seed, self._epoch])
+
+    def close(self):
+        if self._data_managers_pid == os.getpid():
+            for data_manager in self._data_managers.values():
+                data_manager.close()
+        self._data_managers = dict()
+
+    def __getstate__(self) -> dict:
+        # Workers that are started via spawn receive the dataset without any open decoders
+        state = self.__dict__.copy()
+        state['_data_managers'] = dict()
+        state['_data_managers_pid'] = None
+        return state
+
+
+class NeRSembleDataset(_NeRSembleDatasetBase, Dataset):
+    """
+    Map-style dataset over single frames: one sample per (participant, sequence, camera, timestep).
+    Works with torch.utils.data.DataLoader as well as with SimpleDataLoader. Every worker process opens its own
+    video decoders.
+    Samples are dicts with keys image, participant_id, sequence_name, serial and timestep.
+    """
+
+    def __init__(self,
+                 nersemble_folder: str,
+                 participant_ids: Optional[List[int]] = None,
+                 sequences: Optional[List[str]] = None,
+                 serials: Optional[List[str]] = None,
+                 timestep_stride: int = 1,
+                 shuffle: bool = False,
+                 seed: int = 0,
+                 as_uint8: bool = False,
+                 apply_color_correction: bool = False,
+                 downscale_factor: Optional[float] = None,
+                 dtype: Optional[Union[str, np.dtype]] = None,
+                 interpolation: Interpolation = 'bilinear',
+                 max_open_videos: int = 32,
+                 video_backend: str = 'opencv'):
+        """
+        Parameters
+        ----------
+        nersemble_folder:
+            Local folder that contains the downloaded NeRSemble data
+        participant_ids:
+            Which participants to use. Defaults to all downloaded participants
+        sequences:
+            Which sequences to use. Defaults to all downloaded sequences
+        serials:
+            Which cameras to use. Defaults to all downloaded cameras
+        timestep_stride:
+            Only use every n-th timestep
+        shuffle:
+            Whether indices are mapped to samples via a random permutation that is derived from seed and epoch
+            (see set_epoch()). Useful for loaders without a sampler. With a torch DataLoader, shuffle=True of the
+            DataLoader can be used instead
+        seed:
+            Seed for shuffling
+        as_uint8, apply_color_correction, downscale_factor, dtype, interpolation:
+            See NeRSembleParticipantDataManager.load_image()
+        max_open_videos:
+            How many video decoders every worker keeps open
+        video_backend:
+            Which library decodes the videos, see NeRSembleParticipantDataManager
+        """
+
+        super().__init__(nersemble_folder,
+                         participant_ids=participant_ids,
+                         sequences=sequences,
+                         serials=serials,
+                         timestep_stride=timestep_stride,
+                         shuffle=shuffle,
+                         seed=seed,
+                         as_uint8=as_uint8,
+                         apply_color_correction=apply_color_correction,
+                         downscale_factor=downscale_factor,
+                         dtype=dtype,
+                         interpolation=interpolation,
+                         max_open_videos=max_open_videos,
+                         video_backend=video_backend)
+
+        # Samples are not materialized. An index is resolved via the cumulative number of samples per sequence
+        n_samples_per_unit = [len(unit.serials) * len(unit.timesteps) for unit in self._units]
+        self._cumulative_n_samples = np.cumsum(n_samples_per_unit, dtype=np.int64)
+        self._permutation: Optional[np.ndarray] = None
+        self._permutation_epoch: Optional[int] = None
+
+    def get_sample_info(self, index: int) -> Tuple[int, str, str, int]:
+        """
+        (participant_id, sequence_name, serial, timestep) of the sample at index.
+        """
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Index {index} is out of range for dataset with {len(self)} samples")
+
+        if self._shuffle:
+            index = int(self._get_permutation()[index])
+
+        i_unit = int(np.searchsorted(self._cumulative_n_samples, index, side='right'))
+        unit = self._units[i_unit]
+        index_in_unit = index - (int(self._cumulative_n_samples[i_unit - 1]) if i_unit > 0 else 0)
+        # Cameras are the fastest running dimension, such that consecutive indices hit the same timestep
+        i_timestep, i_serial = divmod(index_in_unit, len(unit.serials))
+
+        return unit.participant_id, unit.sequence_name, unit.serials[i_serial], unit.timesteps[i_timestep]
+
+    def _get_permutation(self) -> np.ndarray:
+        if self._permutation is None or self._permutation_epoch != self._epoch:
+            self._permutation = self._get_rng().permutation(len(self))
+            self._permutation_epoch = self._epoch
+
+        return self._permutation
+
+    def __getitem__(self, index: int) -> dict:
+        participant_id, sequence_name, serial, timestep = self.get_sample_info(index)
+        image = self._get_data_manager(participant_id).load_image(sequence_name, serial, timestep, **self._load_kwargs)
+
+        return {
+            "image": image,
+            "participant_id": participant_id,
+            "sequence_name": sequence_name,
+            "serial": serial,
+            "timestep": timestep,
+        }
+
+    def __len__(self) -> int:
+        return int(self._cumulative_n_samples[-1]) if len(self._cumulative_n_samples) > 0 else 0
+
+
+class NeRSembleIterableDataset(_NeRSembleDatasetBase, IterableDataset):
+    """
+    Iterable dataset over multi-view timesteps: one sample per (participant, sequence, timestep) with the images of
+    all selected cameras.
+    Sequences are sharded across workers, and every worker decodes its sequences front to back while the next
+    `prefetch` timesteps are already being decoded in the background. This is much faster than random access into
+    the videos.
+    Samples are dicts with keys images (n_cams, H, W, 3), serials, participant_id, sequence_name and timestep.
+    """
+
+    def __init__(self,
+                 nersemble_folder: str,
+                 participant_ids: Optional[List[int]] = None,
+                 sequences: Optional[List[str]] = None,
+                 serials: Optional[List[str]] = None,
+                 timestep_stride: int = 1,
+                 shuffle: bool = False,
+                 seed: int = 0,
+                 prefetch: int = 2,
+                 as_uint8: bool = False,
+                 apply_color_correction: bool = False,
+                 downscale_factor: Optional[float] = None,
+                 dtype: Optional[Union[str, np.dtype]] = None,
+                 interpolation: Interpolation = 'bilinear',
+                 max_open_videos: int = 32,
+                 video_backend: str = 'opencv'):
+        """
+        Parameters
+        ----------
+        shuffle:
+            Whether the order of sequences is shuffled. The order is derived from seed and epoch (see set_epoch())
+            and identical in all workers, such that every sequence is visited by exactly one worker per epoch.
+            Timesteps within a sequence are always visited in order to avoid seeking in the videos
+        prefetch:
+            How many timesteps are decoded ahead of the one that is currently consumed
+        For the remaining parameters, see NeRSembleDataset
+        """
+
+        super().__init__(nersemble_folder,
+                         participant_ids=participant_ids,
+                         sequences=sequences,
+                         serials=serials,
+                         timestep_stride=timestep_stride,
+                         shuffle=shuffle,
+                         seed=seed,
+                         as_uint8=as_uint8,
+                         apply_color_correction=apply_color_correction,
+                         downscale_factor=downscale_factor,
+                         dtype=dtype,
+                         interpolation=interpolation,
+                         max_open_videos=max_open_videos,
+                         video_backend=video_backend)
+        self._prefetch = prefetch
+
+    def get_worker_units(self) -> List[_SequenceUnit]:
+        """
+        The sequences that the current worker iterates over.
+        """
+
+        units = self._units
+        if self._shuffle:
+            units = [units[i] for i in self._get_rng().permutation(len(units))]
+
+        worker_info = get_nersemble_worker_info()
+        if worker_info is not None:
+            units = units[worker_info.id::worker_info.num_workers]
+
+        return units
+
+    def __iter__(self) -> Iterator[dict]:
+        for unit in self.get_worker_units():
+            data_manager = self._get_data_manager(unit.participant_id)
+            for timestep, images in data_manager.iter_timesteps(unit.sequence_name,
+                                                                timesteps=unit.timesteps,
+                                                                serials=unit.serials,
+                                                                prefetch=self._prefetch,
+                                                                **self._load_kwargs):
+                yield {
+                    "images": images,
+                    "serials": unit.serials,
+                    "participant_id": unit.participant_id,
+                    "sequence_name": unit.sequence_name,
+                    "timestep": timestep,
+                }
+
+            # Decoders of finished sequences are not needed anymore
+            data_manager.evict_video(unit.sequence_name)
+
+    def __len__(self) -> int:
+        return sum(len(unit.timesteps) for unit in self._units)
+
+
+class SimpleDataLoader:
+    """
+    Minimal multiprocessing loader for environments without torch.
+    Map-style datasets are loaded in index order with at most `prefetch` samples in flight. Iterable datasets are
+    sharded across the workers, samples then arrive in the order they are finished.
+    """
+
+    def __init__(self,
+                 dataset: Union[NeRSembleDataset, NeRSembleIterableDataset],
+                 n_workers: int = 4,
+                 prefetch: Optional[int] = None,
+                 indices: Optional[List[int]] = None):
+        """
+        Parameters
+        ----------
+        dataset:
+            The dataset to load
+        n_workers:
+            Number of worker processes. With 0, samples are loaded in the main process
+        prefetch:
+            Maximum number of samples that are loaded but not yet consumed. Defaults to 2 per worker
+        indices:
+            Which samples of a map-style dataset to load. Defaults to all
+        """
+
+        self._dataset = dataset
+        self._n_workers = n_workers
+        self._prefetch = 2 * max(n_workers, 1) if prefetch is None else prefetch
+        self._indices = indices
+
+    def __iter__(self) -> Iterator[dict]:
+        if isinstance(self._dataset, NeRSembleIterableDataset):
+            yield from self._iter_iterable()
+        else:
+            yield from self._iter_map_style()
+
+    def _iter_map_style(self) -> Iterator[dict]:
+        indices = range(len(self._dataset)) if self._indices is None else self._indices
+        if self._n_workers == 0:
+            for index in indices:
+                yield self._dataset[index]
+            return
+
+        with multiprocessing.Pool(self._n_workers, initializer=_init_map_style_worker, initargs=(self._dataset,)) as pool:
+            pending = deque()
+            for index in indices:
+                pending.append(pool.apply_async(_load_map_style_sample, (index,)))
+                if len(pending) >= self._prefetch:
+                    yield pending.popleft().get()
+
+            while pending:
+                yield pending.popleft().get()
+
+    def _iter_iterable(self) -> Iterator[dict]:
+        if self._n_workers == 0:
+            yield from self._dataset
+            return
+
+        # The bounded queue blocks workers once `prefetch` samples are waiting
+        queue = multiprocessing.Queue(maxsize=self._prefetch)
+        workers = [multiprocessing.Process(target=_run_iterable_worker,
+                                           args=(self._dataset, WorkerInfo(worker_id, self._n_workers), queue),
+                                           daemon=True)
+                   for worker_id in range(self._n_workers)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            n_finished_workers = 0
+            while n_finished_workers < len(workers):
+                sample = queue.get()
+                if sample is None:
+                    n_finished_workers += 1
+                elif isinstance(sample, BaseException):
+                    raise sample
+                else:
+                    yield sample
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+
+
+_worker_dataset: Optional[NeRSembleDataset] = None
+
+
+def _init_map_style_worker(dataset: NeRSembleDataset):
+    global _worker_dataset
+    _worker_dataset = dataset
+
+
+def _load_map_style_sample(index: int) -> dict:
+    return _worker_dataset[index]
+
+
+def _run_iterable_worker(dataset: NeRSembleIterableDataset, worker_info: WorkerInfo, queue: multiprocessing.Queue):
+    global _worker_info
+    _worker_info = worker_info
+    try:
+        for sample in dataset:
+            queue.put(sample)
+    except Exception as e:
+        queue.put(e)
+    finally:
+        queue.put(None)
@@ -0,0 +1,176 @@
+import json
+import os
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from nersemble_data.util.color_correction import ColorCorrector
+from nersemble_data.util.image import CropBox, Interpolation, crop_image, downscale_crop_box
+from nersemble_data.util.instrumentation import timer
+
+# Decoded frames of one camera are stored as a single (n_frames, H, W, 3) uint8 .npy file next to the videos.
+# Every frame is one contiguous block in that file, such that random access is a single read from a memory-mapped view
+FRAME_STORE_PATH = "{p_id:03d}/sequences/{seq_name:}/frames/cam_{serial:}.npy"
+
+
+@dataclass
+class FrameStoreInfo:
+    n_frames: int
+    height: int
+    width: int
+    downscale_factor: Optional[float]  # None if frames are stored in the original resolution
+    color_corrected: bool
+    source_size: int  # Size of the video file that the frames were extracted from
+    interpolation: Interpolation = 'area'  # How the frames were downscaled. Older frame stores were always area-downscaled
+
+    @staticmethod
+    def get_path(frames_path: str) -> str:
+        return f"{Path(frames_path).with_suffix('.json')}"
+
+    @staticmethod
+    def load(frames_path: str) -> 'FrameStoreInfo':
+        with open(FrameStoreInfo.get_path(frames_path)) as f:
+            return FrameStoreInfo(**json.load(f))
+
+    def save(self, frames_path: str):
+        with open(FrameStoreInfo.get_path(frames_path), 'w') as f:
+            json.dump(asdict(self), f, indent=4)
+
+
+class FrameStore:
+    """
+    Read-only, memory-mapped access to the frames of one camera that were extracted with extract_frames().
+    Frames are returned as zero-copy views, i.e., only the pages of the requested frame are read from disk.
+    """
+
+    def __init__(self, frames_path: str):
+        self._frames_path = frames_path
+        self.info = FrameStoreInfo.load(frames_path)
+        self.frames = np.load(frames_path, mmap_mode='r')
+
+    @staticmethod
+    def open(frames_path: str, video_path: Optional[str] = None) -> Optional['FrameStore']:
+        """
+        Opens the frame store at frames_path if it exists. If the video that the frames were extracted from still
+        exists but has changed in the meantime, the frame store is considered outdated and None is returned as well.
+        """
+
+        if not Path(frames_path).exists():
+            return None
+
+        frame_store = FrameStore(frames_path)
+        if video_path is not None and Path(video_path).exists() \
+                and os.path.getsize(video_path) != frame_store.info.source_size:
+            print(f"[Warning] {frames_path} is outdated and will be ignored. Re-run extract to update it")
+            return None
+
+        return frame_store
+
+    def can_serve(self,
+                  downscale_factor: Optional[float],
+                  apply_color_correction: bool,
+                  crop_box: Optional[CropBox] = None,
+                  interpolation: Interpolation = 'bilinear') -> bool:
+        """
+        Whether the stored frames can be used for a load_image() request with the given options.
+        Stored frames that are not color-corrected can still be corrected after loading, but not vice versa.
+        Crops of downscaled frames can only be served if the frames were downscaled with area interpolation and the
+        crop box is aligned with the downscaled pixel grid.
+        """
+
+        downscale_factor = _normalize_downscale_factor(downscale_factor)
+        return downscale_factor == self.info.downscale_factor \
+            and (downscale_factor is None or interpolation == self.info.interpolation) \
+            and (apply_color_correction or not self.info.color_corrected) \
+            and (crop_box is None or downscale_crop_box(crop_box, downscale_factor, self.info.interpolation) is not None)
+
+    def get_frame(self, frame_id: int, crop_box: Optional[CropBox] = None) -> np.ndarray:
+        """
+        Zero-copy view of a stored frame. crop_box is given in full-resolution pixels, see can_serve().
+        """
+
+        frame = self.frames[frame_id]
+        if crop_box is not None:
+            frame = crop_image(frame, downscale_crop_box(crop_box, self.info.downscale_factor, self.info.interpolation))
+
+        return frame
+
+    def __len__(self) -> int:
+        return self.info.n_frames
+
+
+def extract_frames(video_path: str,
+                   frames_path: str,
+                   downscale_factor: Optional[float] = None,
+                   color_corrector: Optional[ColorCorrector] = None,
+                   video_backend: str = 'opencv',
+                   interpolation: Interpolation = 'bilinear'):
+    """
+    Decodes all frames of a video in a single sequential pass and writes them into a frame store.
+    The frames are first written to `frames_path.part` which is only renamed once all frames were decoded.
+
+    Parameters
+    ----------
+    video_path:
+        The video to extract
+    frames_path:
+        Where to store the .npy file with the decoded frames
+    downscale_factor:
+        If given, frames are stored downscaled by this factor
+    color_corrector:
+        If given, frames are stored color-corrected
+    video_backend:
+        Which video backend decodes the frames, see open_video()
+    interpolation:
+        How frames are downscaled, see downscale_image(). Crops of downscaled frames can only be served from the frame
+        store with area interpolation
+    """
+
+    from nersemble_data.util.video import open_video
+
+    downscale_factor = _normalize_downscale_factor(downscale_factor)
+    Path(frames_path).parent.mkdir(parents=True, exist_ok=True)
+    part_path = f"{frames_path}.part"
+
+    frames = None
+    try:
+        with open_video(video_path, backend=video_backend) as video_loader:
+            n_frames = video_loader.get_n_frames()
+            frame_iterator = video_loader.iter_frames(stop=n_frames, downscale_factor=downscale_factor, interpolation=interpolation)
+            for frame_id, image in enumerate(frame_iterator):
+                if frames is None:
+                    # Frame size is only known after downscaling the first frame
+                    frames = np.lib.format.open_memmap(part_path, mode='w+', dtype=np.uint8, shape=(n_frames, *image.shape))
+
+                with timer("extract.write"):
+                    if color_corrector is not None:
+                        color_corrector(image, out=frames[frame_id])
+                    else:
+                        frames[frame_id] = image
+
+        assert frames is not None, f"Could not read any frames from {video_path}"
+        frames.flush()
+    except BaseException:
+        # Unmap before removing the incomplete frames, they would only waste disk space
+        frames = None
+        if Path(part_path).exists():
+            os.remove(part_path)
+        raise
+    del frames
+
+    frame_store_info = FrameStoreInfo(n_frames=n_frames,
+                                      height=image.shape[0],
+                                      width=image.shape[1],
+                                      downscale_factor=downscale_factor,
+                                      color_corrected=color_corrector is not None,
+                                      source_size=os.path.getsize(video_path),
+                                      interpolation=interpolation)
+    # The .npy file only appears once its info is complete, hence an existing .npy file is always a complete store
+    frame_store_info.save(frames_path)
+    os.replace(part_path, frames_path)
+
+
+def _normalize_downscale_factor(downscale_factor: Optional[float]) -> Optional[float]:
+    return None if downscale_factor is None or downscale_factor == 1 else float(downscale_factor)
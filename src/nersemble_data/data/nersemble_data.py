@@ -1,70 +1,231 @@
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Optional
+from queue import Queue, Full
+from threading import Event, Lock
+from typing import List, Dict, Optional, Iterator, Tuple, Union, ContextManager, TYPE_CHECKING
 
 import numpy as np
-from dreifus.camera import CameraCoordinateConvention, PoseType
-from dreifus.matrix import Pose, Intrinsics
-from elias.config import Config
-from elias.util import load_json
-from elias.util.io import resize_img
 
-from nersemble_data.constants import ASSETS
-from nersemble_data.util.color_correction import correct_color
-from nersemble_data.util.video import VideoFrameLoader
+from nersemble_data.constants import ASSETS, SERIALS
+from nersemble_data.data.archive import ShardedArchive
+from nersemble_data.data.frame_store import FrameStore, FRAME_STORE_PATH, extract_frames
+from nersemble_data.data.participant_index import ParticipantIndex, CameraInfo, load_participant_ids
+from nersemble_data.util.color_correction import ColorCorrector
+from nersemble_data.util.image import CropBox, Interpolation, downscale_image
+from nersemble_data.util.instrumentation import timer, count
 
+# NB: Heavy dependencies (OpenCV, dreifus, elias, colour-science) are only imported once a feature that needs them is
+# used. That way, path helpers and listing of downloaded data stay cheap to import
+if TYPE_CHECKING:
+    from nersemble_data.data.cameras import CameraParams
+    from nersemble_data.util.video import VideoFrameLoader, VideoFrameLoaderPool
 
-@dataclass
-class CameraParams(Config):
-    world_2_cam: Dict[str, Pose]
-    intrinsics: Intrinsics
+
+def __getattr__(name: str):
+    # CameraParams used to be defined in this module
+    if name == 'CameraParams':
+        from nersemble_data.data.cameras import CameraParams
+        return CameraParams
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class NeRSembleParticipantDataManager:
-    def __init__(self, nersemble_folder: str, participant_id: int):
+    def __init__(self,
+                 nersemble_folder: str,
+                 participant_id: int,
+                 max_open_videos: int = 32,
+                 n_decode_workers: Optional[int] = None,
+                 video_backend: str = 'opencv'):
+        """
+        Parameters
+        ----------
+        nersemble_folder:
+            Local folder that contains the downloaded NeRSemble data, or an archive folder written by `export`. Files
+            of an archive are read directly from the tar shards
+        participant_id:
+            Which participant to load data for
+        max_open_videos:
+            How many video decoders are kept open at the same time. Decoders are reused across load_image() calls
+            for the same (sequence, serial) and the least recently used one is closed once the limit is reached
+        n_decode_workers:
+            Number of threads that decode camera streams in parallel in load_timestep() and iter_timesteps().
+            Defaults to one thread per camera
+        video_backend:
+            Which library decodes the videos:
+                - opencv: cv2.VideoCapture
+                - pyav: FFmpeg via PyAV with multi-threaded decoding, timestamp-exact frame access and direct RGB output.
+                  Requires av (pip install nersemble_data[pyav])
+        """
+
         self._location = nersemble_folder
         self._participant_id = participant_id
+        self._archive = ShardedArchive.open(nersemble_folder)
+
+        self._max_open_videos = max_open_videos
+        self._video_backend = video_backend
+        self._video_loader_pool: Optional['VideoFrameLoaderPool'] = None
+        self._video_loader_pool_lock = Lock()  # Decoding threads may create the pool concurrently
+        self._camera_calibration: Optional['CameraParams'] = None
+        self._color_calibration: Optional[Dict[str, np.ndarray]] = None
+        self._color_correctors: Dict[str, ColorCorrector] = dict()
+        self._frame_stores: Dict[Tuple[str, str], Optional[FrameStore]] = dict()
+        self._participant_index: Optional[ParticipantIndex] = None
+        self._n_calibration_loads = 0
+
+        self._n_decode_workers = len(SERIALS) if n_decode_workers is None else n_decode_workers
+        self._decode_executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def participant_id(self) -> int:
+        return self._participant_id
 
     # ----------------------------------------------------------
     # Assets
     # ----------------------------------------------------------
 
-    def load_camera_calibration(self) -> CameraParams:
-        camera_params = load_json(self.get_camera_calibration_path())
-        world_2_cam = camera_params['world_2_cam']
-        world_2_cam = {serial: Pose(pose, camera_coordinate_convention=CameraCoordinateConvention.OPEN_CV, pose_type=PoseType.WORLD_2_CAM)
-                       for serial, pose in world_2_cam.items()}
-        intrinsics = Intrinsics(camera_params['intrinsics'])
-        camera_params = CameraParams(world_2_cam, intrinsics)
-        return camera_params
+    def load_camera_calibration(self) -> 'CameraParams':
+        # Calibration is the same for all sequences of a participant, hence it only has to be parsed once
+        if self._camera_calibration is None:
+            from dreifus.camera import CameraCoordinateConvention, PoseType
+            from dreifus.matrix import Pose, Intrinsics
+            from nersemble_data.data.cameras import CameraParams
+
+            camera_params = self._load_json(self.get_camera_calibration_path())
+            world_2_cam = camera_params['world_2_cam']
+            world_2_cam = {serial: Pose(pose, camera_coordinate_convention=CameraCoordinateConvention.OPEN_CV, pose_type=PoseType.WORLD_2_CAM)
+                           for serial, pose in world_2_cam.items()}
+            intrinsics = Intrinsics(camera_params['intrinsics'])
+            self._camera_calibration = CameraParams(world_2_cam, intrinsics)
+            self._n_calibration_loads += 1
+
+        return self._camera_calibration
 
     def load_color_calibration(self) -> Dict[str, np.ndarray]:
-        color_calibration = load_json(self.get_color_calibration_path())
-        color_calibration = {serial: np.array(ccm) for serial, ccm in color_calibration.items()}
-        return color_calibration
+        if self._color_calibration is None:
+            color_calibration = self._load_json(self.get_color_calibration_path())
+            self._color_calibration = {serial: np.array(ccm) for serial, ccm in color_calibration.items()}
+            self._n_calibration_loads += 1
+
+        return self._color_calibration
+
+    def get_color_corrector(self, serial: str) -> ColorCorrector:
+        color_corrector = self._color_correctors.get(serial)
+        if color_corrector is None:
+            color_corrector = ColorCorrector(self.load_color_calibration()[serial])
+            self._color_correctors[serial] = color_corrector
+
+        return color_corrector
+
+    def list_backgrounds(self) -> List[str]:
+        """
+        Serials of all cameras whose background image was downloaded, in the canonical order of SERIALS.
+        """
+
+        return [serial for serial in SERIALS if self._exists(self.get_background_path(serial))]
+
+    def has_camera_calibration(self) -> bool:
+        return self._exists(self.get_camera_calibration_path())
+
+    def has_color_calibration(self) -> bool:
+        return self._exists(self.get_color_calibration_path())
+
+    def load_background(self,
+                        serial: str,
+                        downscale_factor: Optional[float] = None,
+                        out: Optional[np.ndarray] = None,
+                        interpolation: Interpolation = 'bilinear') -> np.ndarray:
+        """
+        Loads the background image of the specified camera, i.e., the empty capture setup without the participant.
+        Use AssetCache to keep the backgrounds of all cameras in memory.
+
+        Parameters
+        ----------
+        serial:
+            Which camera to load the background for
+        downscale_factor:
+            If given, the background is downscaled by this factor
+        out:
+            Optional preallocated (H, W, 3) uint8 array that the background is written into
+        interpolation:
+            How the background is downscaled, see load_image()
+
+        Returns
+        -------
+            The background as RGB uint8 image of shape (H, W, 3)
+        """
+
+        import cv2
+
+        background_path = self.get_background_path(serial)
+        if self._archive is not None:
+            image_bytes = self._archive.read_bytes(self._get_relative_path(background_path))
+            image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        else:
+            image = cv2.imread(background_path)
+        assert image is not None, f"Could not read background image {background_path}"
+        if downscale_factor is not None:
+            image = downscale_image(image, downscale_factor, interpolation)
+
+        if out is not None:
+            assert out.shape == image.shape and out.dtype == np.uint8, \
+                f"out has to be a uint8 array of shape {image.shape}, got {out.dtype} {out.shape}"
+            if out.flags.c_contiguous:
+                return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=out)
+            out[:] = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            return out
+
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
     def list_timesteps(self, sequence_name: str) -> List[int]:
         return list(range(self.get_n_timesteps(sequence_name)))
 
     def list_cameras(self, sequence_name: str) -> List[str]:
-        # TODO: Untested
-        images_folder = Path(self.get_images_path(sequence_name, "serial")).parent
-        serials = [camera_file.stem.split('_')[1] for camera_file in images_folder.iterdir()]
-        return serials
+        # Cameras are available if either their video was downloaded or their frames were extracted
+        return self.get_participant_index().list_cameras(sequence_name)
+
+    def list_default_serials(self, sequence_name: str) -> List[str]:
+        """
+        The available cameras of the sequence in the canonical order of SERIALS. This is the camera order of the stacked
+        images of load_timestep() and iter_timesteps() if no serials are given.
+        """
+
+        available_serials = self.list_cameras(sequence_name)
+        # Stick to the canonical camera order such that stacked images are comparable across sequences
+        return [serial for serial in SERIALS if serial in available_serials]
 
     def list_sequences(self) -> List[str]:
-        sequences_folder = Path(f"{self._location}/{self._participant_id:03d}/sequences")
-        if not sequences_folder.exists():
-            return []
-        else:
-            return [folder.name for folder in sequences_folder.iterdir()]
+        return self.get_participant_index().list_sequences()
 
     def get_n_timesteps(self, sequence_name: str) -> int:
         serials = self.list_cameras(sequence_name)
         serial = serials[0]
-        video_capture = VideoFrameLoader(self.get_images_path(sequence_name, serial))
-        n_frames = video_capture.get_n_frames()
-        return n_frames
+        return self.get_camera_info(sequence_name, serial).n_frames
+
+    def get_camera_info(self, sequence_name: str, serial: str) -> CameraInfo:
+        """
+        Exact frame count, resolution and fps of the specified camera's video.
+        """
+
+        return self.get_participant_index().get_camera_info(sequence_name, serial)
+
+    def get_participant_index(self) -> ParticipantIndex:
+        """
+        Index of all downloaded sequences and cameras. Loaded once per data manager and only re-scanned for sequences
+        whose folders changed since the index was stored. Use refresh_index() to pick up changes afterwards.
+        """
+
+        if self._participant_index is None and self._archive is not None:
+            self._participant_index = self._archive.get_participant_index(self._participant_id)
+        elif self._participant_index is None:
+            self._participant_index = ParticipantIndex.load_or_build(f"{self._location}/{self._participant_id:03d}",
+                                                                     self.get_images_path,
+                                                                     self.get_frame_store_path)
+
+        return self._participant_index
+
+    def refresh_index(self):
+        self._participant_index = None
 
     def load_image(self,
                    sequence_name: str,
@@ -72,23 +233,406 @@ class NeRSembleParticipantDataManager:
                    timestep: int,
                    as_uint8: bool = False,
                    apply_color_correction: bool = False,
-                   downscale_factor: Optional[float] = None) -> np.ndarray:
-        video_capture = VideoFrameLoader(self.get_images_path(sequence_name, serial))
-        image = video_capture.load_frame(timestep)
+                   downscale_factor: Optional[float] = None,
+                   dtype: Optional[Union[str, np.dtype]] = None,
+                   out: Optional[np.ndarray] = None,
+                   crop_box: Optional[CropBox] = None,
+                   interpolation: Interpolation = 'bilinear') -> np.ndarray:
+        """
+        Loads a single frame of the specified camera.
+        If the frames of the camera were extracted with extract_frames() using the same downscale_factor and interpolation,
+        the frame is read from the memory-mapped frame store instead of decoding the video. In that case, uint8 frames
+        without `out` are returned as read-only views into the frame store.
+        Cropping and downscaling happen on the decoded uint8 frame before color conversion, normalization and color
+        correction, which are then fused into a single pass that directly writes the requested output dtype.
 
-        if downscale_factor is not None:
-            image = resize_img(image, 1 / downscale_factor)
+        Parameters
+        ----------
+        sequence_name:
+            Which sequence to load the frame from
+        serial:
+            Which camera to load the frame from
+        timestep:
+            Which frame to load
+        as_uint8:
+            Shorthand for dtype=uint8. Otherwise, images are returned as float64 in [0, 1] unless `dtype` is given
+        apply_color_correction:
+            Whether to apply the camera's color correction matrix
+        downscale_factor:
+            If given, the image is downscaled by this factor
+        dtype:
+            Output dtype, one of uint8 (values in [0, 255]), float16, float32 or float64 (values in [0, 1])
+        out:
+            Optional preallocated (H, W, 3) array that the image is written into. Determines the output dtype. Can also be
+            a non-contiguous view, e.g., a region of a larger canvas
+        crop_box:
+            If given, only the (left, top, right, bottom) region of the frame is loaded, e.g., a head bounding box.
+            Coordinates refer to the full-resolution frame, downscaling is applied to the crop
+        interpolation:
+            How the image is downscaled. 'bilinear' (default) uses Pillow's bilinear filter, 'area' uses OpenCV's area
+            interpolation, which is faster and an exact block average for integer downscale factors
+
+        Returns
+        -------
+            The loaded image of shape (H, W, 3)
+        """
 
-        if not as_uint8:
-            image = image / 255.
+        dtype = self._resolve_dtype(as_uint8, dtype, out)
 
-        if apply_color_correction:
-            color_calibration = self.load_color_calibration()
-            ccm = color_calibration[serial]
-            image = correct_color(image, ccm)
+        with timer("load_image"):
+            frame_store = self._get_frame_store(sequence_name, serial)
+            if frame_store is not None and frame_store.can_serve(downscale_factor, apply_color_correction, crop_box, interpolation):
+                # Zero-copy view into the memory-mapped frames
+                count("load_image.n_frame_store_hits")
+                image = frame_store.get_frame(timestep, crop_box)
+                apply_color_correction = apply_color_correction and not frame_store.info.color_corrected
+            else:
+                with self._lease_video_loader(sequence_name, serial) as video_capture:
+                    # uint8 frames are directly decoded into out
+                    image = video_capture.load_frame(timestep,
+                                                     crop_box=crop_box,
+                                                     downscale_factor=downscale_factor,
+                                                     out=out if dtype == np.uint8 and not apply_color_correction else None,
+                                                     interpolation=interpolation)
+
+            if apply_color_correction:
+                # Decodes uint8 values via lookup table and writes the requested dtype directly
+                with timer("load_image.color_correction"):
+                    image = self.get_color_corrector(serial)(image, out=out, dtype=None if out is not None else dtype)
+            elif dtype == np.uint8:
+                if out is not None and image is not out:
+                    with timer("load_image.copy"):
+                        out[:] = image
+                    image = out
+            else:
+                # float16 is only a storage format, compute in float32 in that case
+                compute_dtype = np.float64 if dtype == np.float64 else np.float32
+                if out is None:
+                    out = np.empty(image.shape, dtype=dtype)
+                with timer("load_image.normalize"):
+                    image = np.multiply(image, 1 / 255., out=out, dtype=compute_dtype)
 
         return image
 
+    def load_timestep(self,
+                      sequence_name: str,
+                      timestep: int,
+                      serials: Optional[List[str]] = None,
+                      as_uint8: bool = False,
+                      apply_color_correction: bool = False,
+                      downscale_factor: Optional[float] = None,
+                      dtype: Optional[Union[str, np.dtype]] = None,
+                      out: Optional[np.ndarray] = None,
+                      crop_boxes: Optional[Union[CropBox, Dict[str, CropBox]]] = None,
+                      interpolation: Interpolation = 'bilinear') -> np.ndarray:
+        """
+        Loads the images of all specified cameras for a single timestep. The camera streams are decoded in parallel.
+        See load_image() for the remaining parameters.
+
+        Parameters
+        ----------
+        out:
+            Optional preallocated (n_cams, H, W, 3) array. Each camera is directly decoded into its slice
+        crop_boxes:
+            Either a single crop box that is used for all cameras, or one crop box per serial. All crop boxes need to
+            have the same size, such that the crops can be stacked
+
+        Returns
+        -------
+            The stacked images in the order of `serials` (default: all cameras that are available for the sequence)
+            with shape (n_cams, H, W, 3)
+        """
+
+        if serials is None:
+            serials = self.list_default_serials(sequence_name)
+
+        with timer("load_timestep"):
+            futures = self._submit_timestep(sequence_name, timestep, serials,
+                                            as_uint8=as_uint8,
+                                            apply_color_correction=apply_color_correction,
+                                            downscale_factor=downscale_factor,
+                                            dtype=dtype,
+                                            out=out,
+                                            crop_boxes=crop_boxes,
+                                            interpolation=interpolation)
+            return self._collect_timestep(futures, out=out)
+
+    def iter_timesteps(self,
+                       sequence_name: str,
+                       timesteps: Optional[List[int]] = None,
+                       serials: Optional[List[str]] = None,
+                       prefetch: int = 2,
+                       as_uint8: bool = False,
+                       apply_color_correction: bool = False,
+                       downscale_factor: Optional[float] = None,
+                       dtype: Optional[Union[str, np.dtype]] = None,
+                       crop_boxes: Optional[Union[CropBox, Dict[str, CropBox]]] = None,
+                       interpolation: Interpolation = 'bilinear') -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Streams (timestep, images) pairs where images has shape (n_cams, H, W, 3), see load_timestep().
+        Every camera is decoded by a single background thread that walks through the timesteps in order, such that its
+        video decoder only ever seeks forward. While the caller consumes one timestep, the next `prefetch` timesteps are
+        already being decoded.
+        """
+
+        timesteps = list(self.list_timesteps(sequence_name) if timesteps is None else timesteps)
+        if serials is None:
+            serials = self.list_default_serials(sequence_name)
+        serial_crop_boxes = self._get_crop_boxes(serials, crop_boxes)
+
+        # Cameras are distributed round-robin over at most n_decode_workers threads
+        n_workers = max(1, min(self._n_decode_workers, len(serials)))
+        worker_serials = [list(range(i_worker, len(serials), n_workers)) for i_worker in range(n_workers)]
+        queues = [Queue(maxsize=max(prefetch, 1)) for _ in range(n_workers)]
+        stop_event = Event()
+
+        def decode(i_serials: List[int], queue: Queue):
+            try:
+                for timestep in timesteps:
+                    if stop_event.is_set():
+                        return
+                    images = [self.load_image(sequence_name, serials[i_serial], timestep,
+                                              as_uint8=as_uint8,
+                                              apply_color_correction=apply_color_correction,
+                                              downscale_factor=downscale_factor,
+                                              dtype=dtype,
+                                              crop_box=serial_crop_boxes[i_serial],
+                                              interpolation=interpolation)
+                              for i_serial in i_serials]
+                    _put_unless_stopped(queue, images, stop_event)
+            except Exception as e:
+                _put_unless_stopped(queue, e, stop_event)
+
+        # Dedicated threads, since they block on full queues until the caller catches up. In the shared decode executor
+        # they could starve load_timestep() calls or other iterators
+        executor = ThreadPoolExecutor(max_workers=n_workers)
+        try:
+            for i_serials, queue in zip(worker_serials, queues):
+                executor.submit(decode, i_serials, queue)
+
+            for timestep in timesteps:
+                images = [None] * len(serials)
+                # Time that the consumer has to wait for decoding, i.e., is not hidden by prefetching
+                with timer("iter_timesteps.wait"):
+                    for i_serials, queue in zip(worker_serials, queues):
+                        worker_images = queue.get()
+                        if isinstance(worker_images, Exception):
+                            raise worker_images
+                        for i_serial, image in zip(i_serials, worker_images):
+                            images[i_serial] = image
+
+                yield timestep, np.stack(images)
+        finally:
+            # Also reached when the caller stops iterating early
+            stop_event.set()
+            executor.shutdown()
+
+    def extract_frames(self,
+                       sequence_name: str,
+                       serial: str,
+                       downscale_factor: Optional[float] = None,
+                       apply_color_correction: bool = False,
+                       overwrite: bool = False,
+                       interpolation: Interpolation = 'bilinear') -> str:
+        """
+        Decodes the whole video of the specified camera once and stores the frames in a memory-mappable frame store.
+        Subsequent load_image() calls with the same downscale_factor and interpolation are then served from the frame store.
+
+        Parameters
+        ----------
+        downscale_factor:
+            If given, frames are stored downscaled by this factor
+        apply_color_correction:
+            Whether the camera's color correction is baked into the stored frames
+        overwrite:
+            Re-extract frames even if a frame store already exists
+        interpolation:
+            How frames are downscaled, see load_image(). Crops of downscaled frames are only served from frame stores
+            with 'area' interpolation
+
+        Returns
+        -------
+            The path of the frame store
+        """
+
+        assert self._archive is None, f"Frames cannot be extracted into the archive {self._location}"
+
+        frames_path = self.get_frame_store_path(sequence_name, serial)
+        if overwrite or not Path(frames_path).exists():
+            color_corrector = self.get_color_corrector(serial) if apply_color_correction else None
+            extract_frames(self.get_images_path(sequence_name, serial), frames_path,
+                           downscale_factor=downscale_factor,
+                           color_corrector=color_corrector,
+                           video_backend=self._video_backend,
+                           interpolation=interpolation)
+            self._frame_stores.pop((sequence_name, serial), None)
+            self.refresh_index()
+
+        return frames_path
+
+    def _submit_timestep(self,
+                         sequence_name: str,
+                         timestep: int,
+                         serials: List[str],
+                         out: Optional[np.ndarray] = None,
+                         crop_boxes: Optional[Union[CropBox, Dict[str, CropBox]]] = None,
+                         **kwargs) -> list:
+        if self._decode_executor is None:
+            self._decode_executor = ThreadPoolExecutor(max_workers=self._n_decode_workers)
+
+        if out is not None:
+            assert len(out) == len(serials), f"out has space for {len(out)} cameras, but {len(serials)} serials were requested"
+
+        serial_crop_boxes = self._get_crop_boxes(serials, crop_boxes)
+
+        return [self._decode_executor.submit(self.load_image, sequence_name, serial, timestep,
+                                             out=None if out is None else out[i_serial],
+                                             crop_box=serial_crop_boxes[i_serial],
+                                             **kwargs)
+                for i_serial, serial in enumerate(serials)]
+
+    @staticmethod
+    def _get_crop_boxes(serials: List[str],
+                        crop_boxes: Optional[Union[CropBox, Dict[str, CropBox]]]) -> List[Optional[CropBox]]:
+        if not isinstance(crop_boxes, dict):
+            return [crop_boxes for _ in serials]
+
+        crop_box_sizes = {(crop_boxes[serial][2] - crop_boxes[serial][0], crop_boxes[serial][3] - crop_boxes[serial][1])
+                          for serial in serials}
+        assert len(crop_box_sizes) == 1, f"All crop boxes need to have the same size, got {crop_box_sizes}"
+        return [crop_boxes[serial] for serial in serials]
+
+    @staticmethod
+    def _collect_timestep(futures: list, out: Optional[np.ndarray] = None) -> np.ndarray:
+        images = [future.result() for future in futures]
+        if out is None:
+            out = np.stack(images)
+        return out
+
+    @staticmethod
+    def _resolve_dtype(as_uint8: bool, dtype: Optional[Union[str, np.dtype]], out: Optional[np.ndarray]) -> np.dtype:
+        if out is not None:
+            assert dtype is None or np.dtype(dtype) == out.dtype, f"out has dtype {out.dtype} but dtype {dtype} was requested"
+            dtype = out.dtype
+        elif dtype is None:
+            dtype = np.uint8 if as_uint8 else np.float64
+
+        dtype = np.dtype(dtype)
+        assert dtype in (np.uint8, np.float16, np.float32, np.float64), f"Unsupported dtype: {dtype}"
+        return dtype
+
+    # ----------------------------------------------------------
+    # Caching
+    # ----------------------------------------------------------
+
+    def _get_frame_store(self, sequence_name: str, serial: str) -> Optional[FrameStore]:
+        key = (sequence_name, serial)
+        if key not in self._frame_stores and self._archive is not None:
+            # Archives only contain the videos
+            self._frame_stores[key] = None
+        elif key not in self._frame_stores:
+            # Also remembers that no frame store exists, such that the file system is only checked once
+            self._frame_stores[key] = FrameStore.open(self.get_frame_store_path(sequence_name, serial),
+                                                      video_path=self.get_images_path(sequence_name, serial))
+
+        return self._frame_stores[key]
+
+    def _lease_video_loader(self, sequence_name: str, serial: str) -> ContextManager['VideoFrameLoader']:
+        video_path = self.get_images_path(sequence_name, serial)
+        if self._archive is not None:
+            # Decoded straight from the video's byte range inside the tar shard
+            video_path = self._archive.get_video_url(self._get_relative_path(video_path))
+
+        # The loader is not closed while it is in use, even if other decoding threads push it out of the pool
+        return self._get_video_loader_pool().lease((sequence_name, serial), video_path)
+
+    def _get_video_loader_pool(self) -> 'VideoFrameLoaderPool':
+        with self._video_loader_pool_lock:
+            if self._video_loader_pool is None:
+                from nersemble_data.util.video import VideoFrameLoaderPool
+                self._video_loader_pool = VideoFrameLoaderPool(max_open_videos=self._max_open_videos,
+                                                               backend=self._video_backend)
+
+        return self._video_loader_pool
+
+    def evict_video(self, sequence_name: str, serial: Optional[str] = None):
+        """
+        Closes the open video decoder and frame store for the given sequence and camera.
+        If no serial is given, all open decoders and frame stores of that sequence are closed.
+        """
+
+        for key in [key for key in self._frame_stores.keys() if key[0] == sequence_name and (serial is None or key[1] == serial)]:
+            del self._frame_stores[key]
+
+        if self._video_loader_pool is None:
+            return
+
+        for key in self._video_loader_pool.keys():
+            if key[0] == sequence_name and (serial is None or key[1] == serial):
+                self._video_loader_pool.evict(key)
+
+    def clear_calibration_cache(self):
+        self._camera_calibration = None
+        self._color_calibration = None
+        self._color_correctors = dict()
+
+    def get_cache_stats(self) -> Dict[str, int]:
+        """
+        Hit/miss counters of the video decoder pool. A hit means that load_image() could reuse an already open video.
+        """
+
+        cache_stats = self._get_video_loader_pool().get_stats()
+        cache_stats["n_calibration_loads"] = self._n_calibration_loads
+        cache_stats["n_frame_stores"] = sum(frame_store is not None for frame_store in self._frame_stores.values())
+        return cache_stats
+
+    def close(self):
+        """
+        Closes all open video decoders and drops cached calibrations.
+        """
+
+        if self._decode_executor is not None:
+            self._decode_executor.shutdown()
+            self._decode_executor = None
+        if self._video_loader_pool is not None:
+            self._video_loader_pool.close()
+        self._frame_stores = dict()
+        self.clear_calibration_cache()
+
+    def __enter__(self) -> 'NeRSembleParticipantDataManager':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # ----------------------------------------------------------
+    # Archives
+    # ----------------------------------------------------------
+
+    def get_archive(self) -> Optional[ShardedArchive]:
+        """
+        The archive that the data is read from, or None if the data manager reads from a regular NeRSemble folder.
+        """
+
+        return self._archive
+
+    def _exists(self, path: str) -> bool:
+        if self._archive is not None:
+            return self._archive.exists(self._get_relative_path(path))
+
+        return Path(path).exists()
+
+    def _load_json(self, path: str):
+        if self._archive is not None:
+            return self._archive.load_json(self._get_relative_path(path))
+
+        from elias.util import load_json
+        return load_json(path)
+
+    def _get_relative_path(self, path: str) -> str:
+        # All paths are built as f"{self._location}/{relative_path}"
+        return path[len(self._location) + 1:]
+
     # ----------------------------------------------------------
     # Paths
     # ----------------------------------------------------------
@@ -105,6 +649,14 @@ class NeRSembleParticipantDataManager:
         relative_path = ASSETS['per_cam']['images'].format(p_id=self._participant_id, seq_name=sequence_name, serial=serial)
         return f"{self._location}/{relative_path}"
 
+    def get_background_path(self, serial: str) -> str:
+        relative_path = ASSETS['per_person_cam']['backgrounds'].format(p_id=self._participant_id, serial=serial)
+        return f"{self._location}/{relative_path}"
+
+    def get_frame_store_path(self, sequence_name: str, serial: str) -> str:
+        relative_path = FRAME_STORE_PATH.format(p_id=self._participant_id, seq_name=sequence_name, serial=serial)
+        return f"{self._location}/{relative_path}"
+
 
 class NeRSembleDataManager:
 
@@ -112,5 +664,19 @@ class NeRSembleDataManager:
         self._nersemble_folder = nersemble_folder
 
     def list_participants(self) -> List[int]:
-        participant_ids = [int(file.name) for file in Path(self._nersemble_folder).iterdir() if file.is_dir()]
+        archive = ShardedArchive.open(self._nersemble_folder)
+        if archive is not None:
+            return archive.list_participants()
+
+        participant_ids = load_participant_ids(self._nersemble_folder)
         return participant_ids
+
+
+def _put_unless_stopped(queue: Queue, item, stop_event: Event):
+    # A plain put() would block forever once the consumer stopped taking items
+    while not stop_event.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return
+        except Full:
+            pass
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import Dict, List, Optional, Callable
+
+from nersemble_data.data.frame_store import FrameStoreInfo
+from nersemble_data.env import NERSEMBLE_CACHE_DIR
+from nersemble_data.util.files import write_atomic
+
+INDEX_VERSION = 1
+
+
+@dataclass
+class CameraInfo:
+    n_frames: int
+    width: int
+    height: int
+    fps: Optional[float]
+    source_size: int  # Size and modification time of the file the information was read from
+    source_mtime_ns: int
+
+
+@dataclass
+class SequenceInfo:
+    cameras: Dict[str, CameraInfo] = field(default_factory=dict)
+    folder_mtimes_ns: Dict[str, Optional[int]] = field(default_factory=dict)  # images/ and frames/ folders
+
+
+class ParticipantIndex:
+    """
+    Cached listing of the downloaded sequences and cameras of a participant, with frame counts, resolution and fps.
+    Stored as `{participant_folder}/.nersemble_index.json`. Validating the index only requires a stat() of the
+    sequences folder and of each sequence's images/ and frames/ folders. Only sequences whose folders changed are
+    re-scanned, and only videos that changed are probed again.
+    """
+
+    FILE_NAME = ".nersemble_index.json"
+
+    def __init__(self, sequences: Dict[str, SequenceInfo]):
+        self.sequences = sequences
+
+    @staticmethod
+    def load_or_build(participant_folder: str,
+                      get_images_path: Callable[[str, str], str],
+                      get_frame_store_path: Callable[[str, str], str]) -> 'ParticipantIndex':
+        """
+        Parameters
+        ----------
+        participant_folder:
+            The downloaded folder of the participant
+        get_images_path:
+            (sequence_name, serial) -> path of the video
+        get_frame_store_path:
+            (sequence_name, serial) -> path of the extracted frames
+        """
+
+        index_path = f"{participant_folder}/{ParticipantIndex.FILE_NAME}"
+        sequences_folder = Path(f"{participant_folder}/sequences")
+        if not sequences_folder.exists():
+            return ParticipantIndex(dict())
+
+        cached_sequences = dict()
+        if Path(index_path).exists():
+            try:
+                with open(index_path) as f:
+                    index = json.load(f)
+                if index['version'] == INDEX_VERSION:
+                    cached_sequences = {seq_name: SequenceInfo(cameras={serial: CameraInfo(**camera_info)
+                                                                        for serial, camera_info in sequence_info['cameras'].items()},
+                                                               folder_mtimes_ns=sequence_info['folder_mtimes_ns'])
+                                        for seq_name, sequence_info in index['sequences'].items()}
+            except (OSError, ValueError, KeyError, TypeError):
+                # Corrupted or outdated index, will be rebuilt
+                cached_sequences = dict()
+
+        sequences = dict()
+        has_changed = False
+        for seq_name in sorted(folder.name for folder in sequences_folder.iterdir() if folder.is_dir()):
+            folders = {
+                "images": Path(get_images_path(seq_name, "serial")).parent,
+                "frames": Path(get_frame_store_path(seq_name, "serial")).parent,
+            }
+            folder_mtimes_ns = {name: _get_mtime_ns(folder) for name, folder in folders.items()}
+
+            cached_sequence_info = cached_sequences.get(seq_name)
+            if cached_sequence_info is not None and cached_sequence_info.folder_mtimes_ns == folder_mtimes_ns:
+                sequences[seq_name] = cached_sequence_info
+            else:
+                cached_cameras = dict() if cached_sequence_info is None else cached_sequence_info.cameras
+                cameras = _scan_cameras(seq_name, folders, cached_cameras, get_images_path, get_frame_store_path)
+                sequences[seq_name] = SequenceInfo(cameras=cameras, folder_mtimes_ns=folder_mtimes_ns)
+                has_changed = True
+
+        has_changed = has_changed or sequences.keys() != cached_sequences.keys()
+        participant_index = ParticipantIndex(sequences)
+        if has_changed:
+            participant_index.save(index_path)
+
+        return participant_index
+
+    def save(self, index_path: str):
+        index = {
+            'version': INDEX_VERSION,
+            'sequences': {seq_name: asdict(sequence_info) for seq_name, sequence_info in self.sequences.items()},
+        }
+        try:
+            write_atomic(index_path, json.dumps(index))
+        except OSError as e:
+            # E.g., read-only dataset folders. The index then only lives in memory
+            print(f"[Warning] Could not store index at {index_path}: {e}")
+
+    def list_sequences(self) -> List[str]:
+        return list(self.sequences.keys())
+
+    def list_cameras(self, sequence_name: str) -> List[str]:
+        sequence_info = self.sequences.get(sequence_name)
+        return [] if sequence_info is None else list(sequence_info.cameras.keys())
+
+    def get_camera_info(self, sequence_name: str, serial: str) -> CameraInfo:
+        assert sequence_name in self.sequences, f"Sequence {sequence_name} was not downloaded"
+        assert serial in self.sequences[sequence_name].cameras, f"Camera {serial} was not downloaded for sequence {sequence_name}"
+        return self.sequences[sequence_name].cameras[serial]
+
+
+def _scan_cameras(sequence_name: str,
+                  folders: Dict[str, Path],
+                  cached_cameras: Dict[str, CameraInfo],
+                  get_images_path: Callable[[str, str], str],
+                  get_frame_store_path: Callable[[str, str], str]) -> Dict[str, CameraInfo]:
+    from nersemble_data.util.video import probe_video
+
+    serials = []
+    # Cameras are available if either their video was downloaded or their frames were extracted
+    for folder, suffix in ((folders['images'], '.mp4'), (folders['frames'], '.npy')):
+        if folder.exists():
+            serials.extend(camera_file.stem.split('_')[1] for camera_file in sorted(folder.iterdir())
+                           if camera_file.suffix == suffix)
+
+    cameras = dict()
+    for serial in dict.fromkeys(serials):
+        source_path = get_images_path(sequence_name, serial)
+        is_video = Path(source_path).exists()
+        if not is_video:
+            source_path = get_frame_store_path(sequence_name, serial)
+        stat = os.stat(source_path)
+
+        camera_info = cached_cameras.get(serial)
+        if camera_info is not None and camera_info.source_size == stat.st_size and camera_info.source_mtime_ns == stat.st_mtime_ns:
+            cameras[serial] = camera_info
+        elif is_video:
+            video_info = probe_video(source_path)
+            cameras[serial] = CameraInfo(video_info.n_frames, video_info.width, video_info.height, video_info.fps,
+                                         source_size=stat.st_size, source_mtime_ns=stat.st_mtime_ns)
+        else:
+            frame_store_info = FrameStoreInfo.load(source_path)
+            cameras[serial] = CameraInfo(frame_store_info.n_frames, frame_store_info.width, frame_store_info.height, None,
+                                         source_size=stat.st_size, source_mtime_ns=stat.st_mtime_ns)
+
+    return cameras
+
+
+def _get_mtime_ns(folder: Path) -> Optional[int]:
+    try:
+        return os.stat(folder).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def load_participant_ids(nersemble_folder: str, cache_folder: str = NERSEMBLE_CACHE_DIR) -> List[int]:
+    """
+    IDs of all downloaded participants. Cached in cache_folder and only re-listed once the folder's modification time
+    changes, i.e., once a participant folder was added or removed. The cache is not stored inside nersemble_folder,
+    since replacing a file there would change the very modification time it is validated with.
+    """
+
+    folder = Path(nersemble_folder).resolve()
+    index_path = f"{cache_folder}/participants_{hashlib.sha1(str(folder).encode()).hexdigest()[:16]}.json"
+    if Path(index_path).exists():
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            if index['version'] == INDEX_VERSION and index['folder'] == str(folder) \
+                    and index['folder_mtime_ns'] == _get_mtime_ns(folder):
+                return index['participant_ids']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    # Recorded before listing, such that participants that are added in the meantime are picked up next time
+    folder_mtime_ns = _get_mtime_ns(folder)
+    participant_ids = sorted(int(file.name) for file in folder.iterdir() if file.is_dir())
+    index = {'version': INDEX_VERSION, 'folder': str(folder), 'folder_mtime_ns': folder_mtime_ns, 'participant_ids': participant_ids}
+    try:
+        Path(cache_folder).mkdir(parents=True, exist_ok=True)
+        write_atomic(index_path, json.dumps(index))
+    except OSError as e:
+        print(f"[Warning] Could not store index at {index_path}: {e}")
+
+    return participant_ids
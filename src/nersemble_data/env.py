@@ -9,5 +9,9 @@ if env_file_path.exists():
 
 with env.prefixed("NERSEMBLE_"):
     NERSEMBLE_DATA_URL = env("DATA_URL", f"<<<Define NERSEMBLE_DATA_URL in {env_file_path}>>>")
+    NERSEMBLE_CACHE_DIR = env("CACHE_DIR", f"{Path.home()}/.cache/nersemble_data")
+    NERSEMBLE_OFFLINE = env.bool("OFFLINE", False)  # Only use cached metadata, never contact the server
+    NERSEMBLE_METADATA_MAX_AGE = env.float("METADATA_MAX_AGE", 24 * 60 * 60)  # Seconds until cached metadata is revalidated
+    NERSEMBLE_MIRRORS = env.list("MIRRORS", [])  # Comma-separated local folders or http(s):// URLs tried before NERSEMBLE_DATA_URL
 
 REPO_ROOT = f"{Path(__file__).parent.resolve()}/../.."
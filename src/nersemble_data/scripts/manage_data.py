@@ -1,20 +1,20 @@
-from multiprocessing.pool import ThreadPool
+import os
+from collections import defaultdict
 from pathlib import Path
-from typing import Union, Literal, Tuple, Optional
+from typing import Union, Literal, Tuple, Optional, Iterable, Iterator
 
-from tqdm import tqdm
 from tyro.extras import SubcommandApp
 
-from nersemble_data.constants import SERIALS, ASSETS, AVERAGE_GB_PER_VIDEO
-from nersemble_data.env import NERSEMBLE_DATA_URL
-from nersemble_data.util.download import download_file
+from nersemble_data.constants import SERIALS
+from nersemble_data.env import NERSEMBLE_DATA_URL, NERSEMBLE_MIRRORS
 from nersemble_data.util.metadata import NeRSembleMetadata
 from nersemble_data.util.security import validate_nersemble_data_url
+from nersemble_data.util.selection import AssetType, DownloadSelection, select_participants, select_names, plan_download
 
+# NB: Heavier dependencies (requests, tqdm, aiohttp, ...) are imported inside the subcommands that need them to keep
+# the startup time of the CLI low
 app = SubcommandApp()
 
-AssetType = Literal["calibration", "color_calibration", "images", "backgrounds", "metadata_participants", "metadata_sequences"]
-
 
 @app.command
 def download(
@@ -24,7 +24,15 @@ def download(
         sequence: Union[str] = 'all',
         camera: Union[str] = 'all',
         assets: Union[Literal['all'], Tuple[AssetType, ...]] = 'all',
-        n_workers: int = 1):
+        n_workers: int = 1,
+        n_connections_per_file: int = 1,
+        engine: Literal['thread', 'async'] = 'thread',
+        connections_per_host: int = 64,
+        max_bandwidth: Optional[float] = None,
+        compute_hash: bool = False,
+        exact_sizes: bool = False,
+        mirrors: Tuple[str, ...] = tuple(NERSEMBLE_MIRRORS),
+        stats_output: Optional[Path] = None):
     """
     Download parts of the NeRSemble dataset
 
@@ -33,142 +41,541 @@ def download(
     nersemble_folder:
         Where to store the downloaded NeRSemble data
     participant:
-        Select which participant(s) to download. Possible values:
+        Select which participant(s) to download. Comma-separated list of:
             - all: Download all participants
             - range: E.g., "50-100" will only download participants whose ID fall into the specified range
-            - comma-separated IDs: E.g., "33,55,77" will only download those 3 participants
+            - IDs: E.g., "33,55,77" will only download those 3 participants
+            - exclusions: IDs or ranges prefixed with ^, e.g., "1-100,^50-59" skips participants 50 to 59
     sequence:
-        Select which sequence(s) to download  for the specified participant(s). Possible values:
+        Select which sequence(s) to download  for the specified participant(s). Comma-separated list of:
             - all: Download all sequences
-            - comma-separated sequence names: E.g., "EXP-1-head,EMO-1-shout+laugh" will only download those 2 sequences
+            - sequence names: E.g., "EXP-1-head,EMO-1-shout+laugh" will only download those 2 sequences
+            - glob patterns: E.g., "EXP-*" will download all EXP sequences
+            - exclusions: Names or patterns prefixed with ^, e.g., "EXP-*,^EXP-1-head"
     camera:
-        Select which camera(s) to download for the specified participant(s) and sequence(s). Possible values:
+        Select which camera(s) to download for the specified participant(s) and sequence(s). Comma-separated list of:
             - all: Download all cameras
-            - comma-separated camera serials: E.g., "222200037,222200042" will only download those 2 cameras
+            - camera serials: E.g., "222200037,222200042" will only download those 2 cameras
+            - exclusions: Serials prefixed with ^, e.g., "^221501007"
     assets:
         Which assets to download
+    n_workers:
+        How many files are downloaded in parallel. With --engine async, this can be in the thousands
+    n_connections_per_file:
+        Large files are additionally split into this many byte ranges that are downloaded in parallel (thread engine only)
+    engine:
+        How parallel downloads are executed:
+            - thread: One thread per parallel download
+            - async: All downloads run in a single thread via asyncio. Requires aiohttp (pip install nersemble_data[async])
+    connections_per_host:
+        Maximum number of open connections to the download server (async engine only)
+    max_bandwidth:
+        If specified, limits the total download speed to this many MB/s (async engine only)
+    compute_hash:
+        Store the SHA-256 hash of every downloaded file in the download manifest, such that `verify` can detect
+        corrupted files later on
+    exact_sizes:
+        Query the exact size of every file that has not been downloaded before from the server for the overview.
+        Otherwise, video sizes are estimated
+    mirrors:
+        Ordered list of sources that every file is first requested from before falling back to the origin server
+        (NERSEMBLE_DATA_URL). Each is either a local folder (e.g., a copy on a shared file system) or an http(s):// URL
+        (e.g., a site-wide cache or another node that runs `serve`). Mirrors that repeatedly fail are skipped until a
+        health check succeeds again (thread engine only). Defaults to NERSEMBLE_MIRRORS
+    stats_output:
+        If specified, timings and counters of the download (bytes, retries, time-to-first-byte, skipped files) are
+        recorded, printed at the end and written to this JSON file every minute
     """
 
+    from nersemble_data.util.manifest import DownloadManifest
+
     nersemble_metadata = NeRSembleMetadata()
-    sequences_per_participant = nersemble_metadata.list_sequences_for_all_participants()
-
-    # ----------------------------------------------------------
-    # Filter participants to download
-    # ----------------------------------------------------------
-    available_participant_ids = nersemble_metadata.list_participants()
-    if participant == 'all':
-        selected_participant_ids = available_participant_ids
-    elif '-' in participant:
-        parts = participant.split('-')
-        assert len(parts) == 2, f"Invalid --participant specifier, expected a range such as 50-100 but got {participant}"
-        id_from = int(parts[0])
-        id_to = int(parts[1])
-        selected_participant_ids = [p_id for p_id in available_participant_ids if id_from <= p_id <= id_to]
-    else:
-        parts = participant.split(',')
-        selected_participant_ids = [int(p_id) for p_id in parts]
-        unavailable_participant_ids = [p_id for p_id in selected_participant_ids if p_id not in available_participant_ids]
-        assert len(unavailable_participant_ids) == 0, f"Specified participant_ids do not exist: {unavailable_participant_ids}"
-
-    # ----------------------------------------------------------
-    # Filter sequences to download
-    # ----------------------------------------------------------
-    available_sequences = nersemble_metadata.list_sequences()
-    if sequence == 'all':
-        selected_sequences = available_sequences
-    else:
-        selected_sequences = sequence.split(',')
-        unavailable_sequences = [seq_name for seq_name in selected_sequences if seq_name not in available_sequences]
-        assert len(unavailable_sequences) == 0, f"Specified sequences do not exist: {unavailable_sequences}"
-
-    # ----------------------------------------------------------
-    # Filter cameras to download
-    # ----------------------------------------------------------
-    available_cameras = SERIALS
-    if camera == 'all':
-        selected_cameras = available_cameras
-    else:
-        selected_cameras = camera.split(',')
-        unavailable_cameras = [serial for serial in selected_cameras if serial not in available_cameras]
-        assert len(unavailable_cameras) == 0, f"Specified cameras do not exist: {unavailable_cameras}"
+    selection = DownloadSelection.from_selectors(nersemble_metadata, participant, sequence, camera, assets)
+
+    with DownloadManifest(str(nersemble_folder)) as manifest:
+        download_plan = plan_download(selection, manifest=manifest, base_url=NERSEMBLE_DATA_URL if exact_sizes else None)
 
     print("=== DOWNLOAD OVERVIEW ===")
-    print(f"Selected {len(selected_participant_ids)} participants: {selected_participant_ids}")
-    print(f"Selected {len(selected_sequences)} sequences:")
-    for seq_name in selected_sequences:
+    print(f"Selected {len(selection.participant_ids)} participants: {selection.participant_ids}")
+    print(f"Selected {len(selection.sequences)} sequences:")
+    for seq_name in selection.sequences:
         print(f" - {seq_name}")
-    print(f"Selected {len(selected_cameras)} cameras: {selected_cameras}")
-    print(f"Estimated download size: {len(selected_participant_ids) * len(selected_sequences) * len(selected_cameras) * AVERAGE_GB_PER_VIDEO:.1f} GB")
+    print(f"Selected {len(selection.serials)} cameras: {selection.serials}")
+    download_plan.print_summary()
     print(f"Download folder: {nersemble_folder}")
     print("-------------------------")
 
     answer = input("Proceed? [y/n]")
     if answer == 'y':
         print('Downloading data...')
+        _download_relative_urls(nersemble_folder, (job.relative_path for job in selection.iter_jobs()), len(selection),
+                                n_workers=n_workers,
+                                n_connections_per_file=n_connections_per_file,
+                                engine=engine,
+                                connections_per_host=connections_per_host,
+                                max_bandwidth=max_bandwidth,
+                                compute_hash=compute_hash,
+                                mirrors=mirrors,
+                                stats_output=stats_output)
+
+
+@app.command
+def sync(
+        nersemble_folder: Path,
+        /,
+        participant: Union[str] = 'all',
+        sequence: Union[str] = 'all',
+        camera: Union[str] = 'all',
+        assets: Union[Literal['all'], Tuple[AssetType, ...]] = 'all',
+        n_workers: int = 1,
+        n_connections_per_file: int = 1,
+        engine: Literal['thread', 'async'] = 'thread',
+        connections_per_host: int = 64,
+        max_bandwidth: Optional[float] = None,
+        compute_hash: bool = False,
+        mirrors: Tuple[str, ...] = tuple(NERSEMBLE_MIRRORS),
+        stats_output: Optional[Path] = None):
+    """
+    Incrementally bring a local NeRSemble folder up-to-date with the selected parts of the dataset without asking for
+    confirmation. Files that are recorded as complete in the download manifest are skipped without contacting the
+    server. See `download` for a description of the options.
+    """
+
+    nersemble_metadata = NeRSembleMetadata()
+    selection = DownloadSelection.from_selectors(nersemble_metadata, participant, sequence, camera, assets)
+    _download_relative_urls(nersemble_folder, (job.relative_path for job in selection.iter_jobs()), len(selection),
+                            n_workers=n_workers,
+                            n_connections_per_file=n_connections_per_file,
+                            engine=engine,
+                            connections_per_host=connections_per_host,
+                            max_bandwidth=max_bandwidth,
+                            compute_hash=compute_hash,
+                            mirrors=mirrors,
+                            stats_output=stats_output)
+
+
+@app.command
+def plan(
+        nersemble_folder: Path,
+        /,
+        participant: Union[str] = 'all',
+        sequence: Union[str] = 'all',
+        camera: Union[str] = 'all',
+        assets: Union[Literal['all'], Tuple[AssetType, ...]] = 'all',
+        exact_sizes: bool = False,
+        n_workers: int = 32,
+        per_participant: bool = False,
+        output: Optional[Path] = None):
+    """
+    Report how much data a selection amounts to before downloading it, broken down per asset (and per participant).
+    Sizes of files that were downloaded before are taken from the download manifest. See `download` for the selector
+    syntax.
+
+    Parameters
+    ----------
+    nersemble_folder:
+        The local NeRSemble folder
+    exact_sizes:
+        Query the exact size of every file that has not been downloaded before from the server via HEAD requests.
+        Otherwise, video sizes are estimated
+    n_workers:
+        How many HEAD requests are sent in parallel
+    per_participant:
+        Also print the breakdown per participant
+    output:
+        If specified, the full report is additionally stored as JSON
+    """
+
+    import json
+    from nersemble_data.util.manifest import DownloadManifest
+
+    nersemble_metadata = NeRSembleMetadata()
+    selection = DownloadSelection.from_selectors(nersemble_metadata, participant, sequence, camera, assets)
+    print(f"Selected {len(selection)} files of {len(selection.participant_ids)} participants, "
+          f"{len(selection.sequences)} sequences and {len(selection.serials)} cameras")
+
+    with DownloadManifest(str(nersemble_folder)) as manifest:
+        download_plan = plan_download(selection,
+                                      manifest=manifest,
+                                      base_url=NERSEMBLE_DATA_URL if exact_sizes else None,
+                                      n_workers=n_workers)
+
+    download_plan.print_summary(per_participant=per_participant)
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(download_plan.to_dict(), f, indent=4)
+        print(f"Stored report in {output}")
+
+
+@app.command
+def verify(nersemble_folder: Path, /, n_workers: int = 8, repair: bool = False):
+    """
+    Check all files in the download manifest for corruption.
+
+    Parameters
+    ----------
+    nersemble_folder:
+        The local NeRSemble folder
+    n_workers:
+        How many files are hashed in parallel
+    repair:
+        Delete missing or corrupted files from the manifest and from disk, such that the next `sync` downloads them again
+    """
+
+    from multiprocessing.pool import ThreadPool
+    from tqdm import tqdm
+    from nersemble_data.util.manifest import DownloadManifest, ManifestEntry, compute_sha256
+
+    manifest = DownloadManifest(str(nersemble_folder))
+    entries = manifest.list_entries()
 
-        # ----------------------------------------------------------
-        # Collect download links
-        # ----------------------------------------------------------
-
-        if assets == 'all':
-            assets = [asset_name for asset_set in ASSETS.values() for asset_name in asset_set.keys()]
-
-        relative_urls = []
-        for p_id in selected_participant_ids:
-            single_available_sequences = sequences_per_participant[p_id]
-            single_selected_sequences = [seq_name for seq_name in selected_sequences if seq_name in single_available_sequences]
-
-            # Assets per-person
-            for asset in assets:
-                if asset in ASSETS['per_person']:
-                    relative_url = ASSETS['per_person'][asset]
-                    relative_url = relative_url.format(p_id=p_id)
-                    relative_urls.append(relative_url)
-
-            # Assets per-camera
-            for seq_name in single_selected_sequences:
-                for serial in selected_cameras:
-                    for asset in assets:
-                        if asset in ASSETS['per_cam']:
-                            relative_url = ASSETS['per_cam'][asset]
-                            relative_url = relative_url.format(p_id=p_id, seq_name=seq_name, serial=serial)
-                            relative_urls.append(relative_url)
-
-            # Assets per-person camera (backgrounds basically)
-            for serial in selected_cameras:
-                for asset in assets:
-                    if asset in ASSETS['per_person_cam']:
-                        relative_url = ASSETS['per_person_cam'][asset]
-                        relative_url = relative_url.format(p_id=p_id, serial=serial)
-                        relative_urls.append(relative_url)
-
-        # Global assets
-        for asset in assets:
-            if asset in ASSETS['global']:
-                relative_url = ASSETS['global'][asset]
-                relative_urls.append(relative_url)
-
-        # -------------
-        # Download data
-        # -------------
-        if n_workers == 1:
-            print(f"[Warning] Downloading data with a single worker which may be slow. Consider setting --n_workers to a number greater than 1")
-            for relative_url in tqdm(relative_urls):
-                absolute_url = f"{NERSEMBLE_DATA_URL}/{relative_url}"
-                target_path = f"{nersemble_folder}/{relative_url}"
-                download_file(absolute_url, target_path)
+    def verify_entry(entry: ManifestEntry) -> Tuple[ManifestEntry, str]:
+        local_path = manifest.get_local_path(entry.relative_path)
+        if not Path(local_path).exists():
+            return entry, 'missing'
+        if os.path.getsize(local_path) != entry.size:
+            return entry, 'corrupted'
+
+        sha256 = compute_sha256(local_path)
+        if entry.sha256 is None:
+            # First verification establishes the reference hash
+            manifest.set_hash(entry.relative_path, sha256)
+            return entry, 'hashed'
+        elif sha256 != entry.sha256:
+            return entry, 'corrupted'
         else:
-            print(f"Downloading data with {n_workers} workers")
-            pool = ThreadPool(processes=n_workers)
-            futures = []
-            for relative_url in relative_urls:
-                absolute_url = f"{NERSEMBLE_DATA_URL}/{relative_url}"
-                target_path = f"{nersemble_folder}/{relative_url}"
-                future = pool.apply_async(download_file, (absolute_url, target_path))
-                futures.append(future)
-
-            for future in tqdm(futures):
-                future.get()
+            return entry, 'ok'
+
+    print(f"Verifying {len(entries)} files with {n_workers} workers")
+    statuses = defaultdict(int)
+    broken_entries = []
+    with ThreadPool(processes=n_workers) as pool:
+        for entry, status in tqdm(pool.imap_unordered(verify_entry, entries), total=len(entries)):
+            statuses[status] += 1
+            if status in ('missing', 'corrupted'):
+                broken_entries.append((entry, status))
+
+    for entry, status in broken_entries:
+        print(f"[{status.upper()}] {entry.relative_path}")
+        if repair:
+            manifest.remove(entry.relative_path)
+            local_path = manifest.get_local_path(entry.relative_path)
+            if Path(local_path).exists():
+                os.remove(local_path)
+
+    manifest.close()
+    print(f"{statuses['ok']} ok, {statuses['hashed']} hashed for the first time, "
+          f"{statuses['missing']} missing, {statuses['corrupted']} corrupted")
+
+
+@app.command
+def extract(
+        nersemble_folder: Path,
+        /,
+        participant: Union[str] = 'all',
+        sequence: Union[str] = 'all',
+        camera: Union[str] = 'all',
+        downscale_factor: Optional[float] = None,
+        interpolation: Literal['bilinear', 'area'] = 'bilinear',
+        apply_color_correction: bool = False,
+        n_workers: int = 4,
+        overwrite: bool = False,
+        video_backend: Literal['opencv', 'pyav'] = 'opencv',
+        stats_output: Optional[Path] = None):
+    """
+    Decode downloaded videos once into memory-mappable frame stores (`{sequence}/frames/cam_{serial}.npy`).
+    The data manager reads frames from these stores instead of the videos, which makes random access to frames cheap.
+    Note that frame stores need much more disk space than the compressed videos.
+
+    Parameters
+    ----------
+    nersemble_folder:
+        The local NeRSemble folder
+    participant:
+        Select which downloaded participant(s) to extract. Same format as for `download`
+    sequence:
+        Select which downloaded sequence(s) to extract. Same format as for `download`
+    camera:
+        Select which downloaded camera(s) to extract. Same format as for `download`
+    downscale_factor:
+        If specified, frames are stored downscaled by this factor
+    interpolation:
+        How frames are downscaled. Frame stores only serve load_image() calls with the same interpolation. Crops of
+        downscaled frames can only be served with area interpolation
+    apply_color_correction:
+        Whether color correction is baked into the stored frames
+    n_workers:
+        How many videos are decoded in parallel
+    overwrite:
+        Re-extract videos that already have a frame store
+    video_backend:
+        Which library decodes the videos. pyav decodes with multiple threads per video and requires av
+        (pip install nersemble_data[pyav])
+    stats_output:
+        If specified, per-stage timings of the extraction (container open, seek, decode, color conversion, ...) are
+        recorded, printed at the end and written to this JSON file
+    """
+
+    from multiprocessing.pool import ThreadPool
+    from tqdm import tqdm
+    from nersemble_data.data.nersemble_data import NeRSembleDataManager, NeRSembleParticipantDataManager
+    from nersemble_data.util import instrumentation
+
+    if stats_output is not None:
+        instrumentation.enable_instrumentation(log_interval=60, log=False, dump_path=str(stats_output))
+
+    available_participant_ids = NeRSembleDataManager(str(nersemble_folder)).list_participants()
+    data_managers = {p_id: NeRSembleParticipantDataManager(str(nersemble_folder), p_id, video_backend=video_backend)
+                     for p_id in available_participant_ids}
+    available_sequences = sorted({seq_name for data_manager in data_managers.values() for seq_name in data_manager.list_sequences()})
+    selected_participant_ids = select_participants(participant, available_participant_ids)
+    selected_sequences = select_names(sequence, available_sequences, kind='sequences')
+    selected_cameras = select_names(camera, SERIALS, kind='cameras')
+
+    jobs = []
+    for p_id in selected_participant_ids:
+        data_manager = data_managers[p_id]
+        for seq_name in data_manager.list_sequences():
+            if seq_name not in selected_sequences or not Path(data_manager.get_images_path(seq_name, "serial")).parent.exists():
+                # BACKGROUND only contains images, no videos
+                continue
+
+            for serial in data_manager.list_cameras(seq_name):
+                if serial in selected_cameras and Path(data_manager.get_images_path(seq_name, serial)).exists():
+                    jobs.append((p_id, seq_name, serial))
+
+    def extract_job(job: Tuple[int, str, str]):
+        p_id, seq_name, serial = job
+        data_managers[p_id].extract_frames(seq_name, serial,
+                                           downscale_factor=downscale_factor,
+                                           apply_color_correction=apply_color_correction,
+                                           overwrite=overwrite,
+                                           interpolation=interpolation)
+
+    print(f"Extracting frames of {len(jobs)} videos with {n_workers} workers")
+    # Video decoding releases the GIL, hence threads are sufficient to decode several videos in parallel
+    with ThreadPool(processes=n_workers) as pool:
+        for _ in tqdm(pool.imap_unordered(extract_job, jobs), total=len(jobs)):
+            pass
+
+    for data_manager in data_managers.values():
+        data_manager.close()
+
+    if stats_output is not None:
+        instrumentation.print_stats()
+        instrumentation.disable_instrumentation()
+        print(f"Stored extraction statistics in {stats_output}")
+
+
+@app.command
+def export(
+        nersemble_folder: Path,
+        output_folder: Path,
+        /,
+        participant: Union[str] = 'all',
+        sequence: Union[str] = 'all',
+        camera: Union[str] = 'all',
+        assets: Union[Literal['all'], Tuple[AssetType, ...]] = 'all',
+        shard_size: float = 16):
+    """
+    Pack selected parts of a local NeRSemble folder into a few large, uncompressed tar shards, e.g., to copy them to
+    compute nodes. Next to the shards, `nersemble_archive.json` stores where every file starts inside its shard. The
+    data manager can be pointed directly at the output folder and then reads videos, calibrations and backgrounds from
+    the shards without unpacking them.
+
+    Parameters
+    ----------
+    nersemble_folder:
+        The local NeRSemble folder
+    output_folder:
+        Where to write the shards and the archive index
+    participant:
+        Select which downloaded participant(s) to export. Same format as for `download`
+    sequence:
+        Select which downloaded sequence(s) to export. Same format as for `download`
+    camera:
+        Select which downloaded camera(s) to export. Same format as for `download`
+    assets:
+        Which assets to export
+    shard_size:
+        Maximum size of a single shard in GB
+    """
+
+    from tqdm import tqdm
+    from nersemble_data.constants import ASSETS
+    from nersemble_data.data.archive import export_archive
+    from nersemble_data.data.nersemble_data import NeRSembleDataManager, NeRSembleParticipantDataManager
+
+    if assets == 'all':
+        assets = [asset_name for asset_set in ASSETS.values() for asset_name in asset_set.keys()]
+
+    available_participant_ids = NeRSembleDataManager(str(nersemble_folder)).list_participants()
+    selected_participant_ids = select_participants(participant, available_participant_ids)
+    data_managers = {p_id: NeRSembleParticipantDataManager(str(nersemble_folder), p_id) for p_id in selected_participant_ids}
+    available_sequences = sorted({seq_name for data_manager in data_managers.values() for seq_name in data_manager.list_sequences()})
+    selected_sequences = select_names(sequence, available_sequences, kind='sequences')
+    selected_cameras = select_names(camera, SERIALS, kind='cameras')
+
+    # Files of a participant are listed consecutively, such that they end up in the same shard(s)
+    relative_paths = [relative_path for asset_name, relative_path in ASSETS['global'].items()
+                      if asset_name in assets and Path(f"{nersemble_folder}/{relative_path}").exists()]
+    participants = dict()
+    for p_id, data_manager in data_managers.items():
+        for asset_name, relative_path_template in ASSETS['per_person'].items():
+            relative_path = relative_path_template.format(p_id=p_id)
+            if asset_name in assets and Path(f"{nersemble_folder}/{relative_path}").exists():
+                relative_paths.append(relative_path)
+
+        if 'backgrounds' in assets:
+            relative_paths.extend(ASSETS['per_person_cam']['backgrounds'].format(p_id=p_id, serial=serial)
+                                  for serial in data_manager.list_backgrounds() if serial in selected_cameras)
+
+        participants[p_id] = dict()
+        for seq_name in data_manager.list_sequences():
+            if 'images' not in assets or seq_name not in selected_sequences:
+                continue
+
+            cameras = dict()
+            for serial in data_manager.list_cameras(seq_name):
+                if serial in selected_cameras and Path(data_manager.get_images_path(seq_name, serial)).exists():
+                    relative_paths.append(ASSETS['per_cam']['images'].format(p_id=p_id, seq_name=seq_name, serial=serial))
+                    cameras[serial] = data_manager.get_camera_info(seq_name, serial)
+            if cameras:
+                participants[p_id][seq_name] = cameras
+
+        data_manager.close()
+
+    total_size = sum(os.path.getsize(f"{nersemble_folder}/{relative_path}") for relative_path in relative_paths)
+    print(f"Exporting {len(relative_paths)} files of {len(participants)} participants "
+          f"({total_size / (1 << 30):.2f} GB) to {output_folder}")
+    with tqdm(total=len(relative_paths)) as progress:
+        n_shards, _ = export_archive(str(nersemble_folder), relative_paths, str(output_folder), participants,
+                                     max_shard_size=int(shard_size * (1 << 30)),
+                                     on_file_written=lambda _: progress.update())
+
+    print(f"Wrote {n_shards} shards to {output_folder}")
+
+
+def _download_relative_urls(nersemble_folder: Path,
+                            relative_urls: Iterable[str],
+                            n_relative_urls: int,
+                            n_workers: int = 1,
+                            n_connections_per_file: int = 1,
+                            engine: Literal['thread', 'async'] = 'thread',
+                            connections_per_host: int = 64,
+                            max_bandwidth: Optional[float] = None,
+                            compute_hash: bool = False,
+                            mirrors: Tuple[str, ...] = (),
+                            stats_output: Optional[Path] = None):
+    from multiprocessing.pool import ThreadPool
+    from tqdm import tqdm
+    from nersemble_data.util import instrumentation
+    from nersemble_data.util.manifest import DownloadManifest
+    from nersemble_data.util.sources import DownloadSources
+
+    if stats_output is not None:
+        instrumentation.enable_instrumentation(log_interval=60, log=False, dump_path=str(stats_output))
+
+    manifest = DownloadManifest(str(nersemble_folder))
+    download_sources = DownloadSources.from_specs(mirrors, NERSEMBLE_DATA_URL)
+    if mirrors and engine == 'async':
+        print("[Warning] Mirrors are only used by the thread engine. Downloading everything from the origin server")
+    elif mirrors:
+        download_sources.check_health()
+    n_up_to_date = 0
+
+    def iter_outdated_relative_urls() -> Iterator[str]:
+        # Files that were completely downloaded before and have not been touched since need no request at all
+        nonlocal n_up_to_date
+        for relative_url in relative_urls:
+            if manifest.is_up_to_date(relative_url):
+                instrumentation.count("download.n_up_to_date")
+                n_up_to_date += 1
+            else:
+                yield relative_url
+
+    def download_and_record(relative_url: str) -> bool:
+        if manifest.is_up_to_date(relative_url):
+            instrumentation.count("download.n_up_to_date")
+            return True
+
+        target_path = f"{nersemble_folder}/{relative_url}"
+        result = download_sources.download(relative_url, target_path, n_connections=n_connections_per_file)
+        if result is not None:
+            manifest.record(relative_url, result, compute_hash=compute_hash)
+        return False
+
+    # -------------
+    # Download data
+    # -------------
+    # Jobs are streamed from the selection, hence the number of up-to-date files is only known at the end
+    if engine == 'async':
+        from nersemble_data.util.async_download import AsyncDownloader
+
+        print(f"Downloading data with {n_workers} concurrent requests")
+        downloader = AsyncDownloader(max_concurrency=n_workers,
+                                     limit_per_host=connections_per_host,
+                                     max_bytes_per_second=None if max_bandwidth is None else max_bandwidth * 1024 * 1024)
+        # Up-to-date files are filtered out upfront, such that the progress bar knows how many files remain
+        jobs = [(f"{NERSEMBLE_DATA_URL}/{relative_url}", f"{nersemble_folder}/{relative_url}")
+                for relative_url in iter_outdated_relative_urls()]
+        downloader.download(jobs,
+                            n_jobs=len(jobs),
+                            on_complete=lambda result: manifest.record(
+                                Path(result.target_path).relative_to(nersemble_folder).as_posix(), result,
+                                compute_hash=compute_hash))
+    elif n_workers == 1:
+        print("[Warning] Downloading data with a single worker which may be slow. Consider setting --n_workers to a number greater than 1")
+        for relative_url in tqdm(relative_urls, total=n_relative_urls):
+            n_up_to_date += download_and_record(relative_url)
+    else:
+        print(f"Downloading data with {n_workers} workers")
+        with ThreadPool(processes=n_workers) as pool:
+            # Progress advances whenever any download finishes, not only in submission order
+            for is_up_to_date in tqdm(pool.imap_unordered(download_and_record, relative_urls), total=n_relative_urls):
+                n_up_to_date += is_up_to_date
+
+    print(f"{n_up_to_date} of {n_relative_urls} files were already up-to-date")
+    if mirrors and engine == 'thread':
+        print("Files per download source:")
+        download_sources.print_summary()
+    manifest.close()
+
+    if stats_output is not None:
+        instrumentation.print_stats()
+        instrumentation.disable_instrumentation()
+        print(f"Stored download statistics in {stats_output}")
+
+
+@app.command
+def serve(nersemble_folder: Path, /, host: str = '127.0.0.1', port: int = 8000):
+    """
+    Serve the completely downloaded files of a local NeRSemble folder to other nodes via HTTP, such that the dataset
+    only has to be fetched from the origin server once per site. Other nodes then download with
+    `--mirrors http://{this_node}:{port}`. Files that are not recorded as complete in the download manifest are not
+    served. Only expose the server in trusted internal networks.
+
+    Parameters
+    ----------
+    nersemble_folder:
+        The local NeRSemble folder
+    host:
+        Interface to listen on. Use 0.0.0.0 to make the files available to other machines
+    port:
+        Port to listen on
+    """
+
+    from nersemble_data.util.file_server import PeerFileServer
+
+    server = PeerFileServer(str(nersemble_folder), host=host, port=port)
+    print(f"Serving {nersemble_folder} at {server.url}. Press Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"Answered {server.n_requests} requests, sent {server.n_bytes_sent / (1 << 30):.2f} GB")
 
 
 @app.command
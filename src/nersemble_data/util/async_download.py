@@ -0,0 +1,246 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Iterable, Tuple, Optional, List, Callable
+
+from tqdm import tqdm
+
+from nersemble_data.util.download import DownloadResult, CHUNK_SIZE, get_total_size, get_validator, save_validator, \
+    load_validator, remove_partial_download
+from nersemble_data.util.instrumentation import observe, count
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class _BandwidthLimiter:
+    """
+    Token bucket that is shared by all concurrent downloads.
+    """
+
+    def __init__(self, max_bytes_per_second: float):
+        self._max_bytes_per_second = max_bytes_per_second
+        self._n_available_bytes = max_bytes_per_second
+        self._last_update = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, n_bytes: int):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._n_available_bytes = min(self._max_bytes_per_second,
+                                              self._n_available_bytes + (now - self._last_update) * self._max_bytes_per_second)
+                self._last_update = now
+                if self._n_available_bytes >= n_bytes or self._n_available_bytes >= self._max_bytes_per_second:
+                    self._n_available_bytes -= n_bytes
+                    return
+                await asyncio.sleep((n_bytes - self._n_available_bytes) / self._max_bytes_per_second)
+
+
+class AsyncDownloader:
+    """
+    Downloads many files concurrently from a single thread via asyncio.
+    Follows the same conventions as download_file(): existing files with the correct size are skipped, data is written
+    to a .part file first and interrupted downloads are resumed via HTTP Range requests.
+    Requires the optional aiohttp dependency (pip install nersemble_data[async]).
+    """
+
+    def __init__(self,
+                 max_concurrency: int = 256,
+                 limit_per_host: int = 64,
+                 max_bytes_per_second: Optional[float] = None,
+                 n_retries: int = 5,
+                 backoff_factor: float = 1.,
+                 timeout: float = 60):
+        """
+        Parameters
+        ----------
+        max_concurrency:
+            Maximum number of requests that are in flight at the same time
+        limit_per_host:
+            Maximum number of open connections to the same host
+        max_bytes_per_second:
+            If given, the aggregated download speed is capped to this many bytes per second
+        n_retries:
+            How often a failed request is retried. Subsequent retries wait backoff_factor * 2^i seconds
+        backoff_factor:
+            Base waiting time for retries
+        timeout:
+            Timeout for connecting to the server and for receiving data in seconds
+        """
+
+        if aiohttp is None:
+            raise ImportError("The asyncio download engine requires aiohttp. Install it via pip install nersemble_data[async]")
+
+        self._max_concurrency = max_concurrency
+        self._limit_per_host = limit_per_host
+        self._max_bytes_per_second = max_bytes_per_second
+        self._n_retries = n_retries
+        self._backoff_factor = backoff_factor
+        self._timeout = timeout
+
+    def download(self,
+                 jobs: Iterable[Tuple[str, str]],
+                 n_jobs: Optional[int] = None,
+                 on_complete: Optional[Callable[[DownloadResult], None]] = None) -> List[Optional[DownloadResult]]:
+        """
+        Parameters
+        ----------
+        jobs:
+            (url, target_path) pairs. Consumed lazily, i.e., can also be a generator
+        n_jobs:
+            Number of jobs, only used for progress reporting
+        on_complete:
+            Called with the DownloadResult of every successfully downloaded (or skipped) file as soon as it is done.
+            Runs in a worker thread, such that slow callbacks (e.g., hashing the file) do not stall the other transfers
+
+        Returns
+        -------
+            For each job, the DownloadResult or None if the download failed
+        """
+
+        return asyncio.run(self._download_all(jobs, n_jobs, on_complete))
+
+    async def _download_all(self,
+                            jobs: Iterable[Tuple[str, str]],
+                            n_jobs: Optional[int],
+                            on_complete: Optional[Callable[[DownloadResult], None]]) -> List[Optional[DownloadResult]]:
+        bandwidth_limiter = None if self._max_bytes_per_second is None else _BandwidthLimiter(self._max_bytes_per_second)
+        connector = aiohttp.TCPConnector(limit=self._max_concurrency, limit_per_host=self._limit_per_host)
+        timeout = aiohttp.ClientTimeout(sock_connect=self._timeout, sock_read=self._timeout)
+
+        results = dict()
+        jobs_iter = enumerate(jobs)
+        byte_progress = tqdm(total=0, unit='B', unit_scale=True, unit_divisor=1024, desc="Downloaded", position=0)
+        file_progress = tqdm(total=n_jobs, unit='file', desc="Files", position=1)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            loop = asyncio.get_running_loop()
+
+            async def worker():
+                # Every worker pulls the next job once it is done. That way, only max_concurrency tasks exist at any time
+                for i_job, (url, target_path) in jobs_iter:
+                    try:
+                        result = await self._download_file(session, url, target_path, byte_progress, bandwidth_limiter)
+                        if result is not None and on_complete is not None:
+                            await loop.run_in_executor(None, on_complete, result)
+                    except OSError as e:
+                        # E.g., a full disk or missing permissions. Only fails this job instead of the whole gather()
+                        byte_progress.write(f"Error occurred downloading {url}: {e}")
+                        count("download.n_failed")
+                        result = None
+                    results[i_job] = result
+                    file_progress.update(1)
+
+            await asyncio.gather(*[worker() for _ in range(self._max_concurrency)])
+
+        byte_progress.close()
+        file_progress.close()
+
+        return [results[i_job] for i_job in range(len(results))]
+
+    async def _download_file(self,
+                             session: 'aiohttp.ClientSession',
+                             url: str,
+                             target_path: str,
+                             byte_progress: tqdm,
+                             bandwidth_limiter: Optional[_BandwidthLimiter]) -> Optional[DownloadResult]:
+        Path(target_path).parent.mkdir(parents=True, exist_ok=True)
+        part_path = f"{target_path}.part"
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+
+        n_bytes_downloaded = 0
+        i_retry = 0
+        while True:
+            try:
+                if Path(target_path).exists():
+                    # Unlike session.get(), session.head() does not follow redirects by default
+                    async with session.head(url, allow_redirects=True) as response:
+                        response.raise_for_status()
+                        download_size = get_total_size(response.headers)
+                        # Without a Content-Length, there is no evidence that the existing file is incomplete
+                        if download_size is None or download_size == os.path.getsize(target_path):
+                            count("download.n_skipped")
+                            return DownloadResult(url, target_path, os.path.getsize(target_path),
+                                                  etag=response.headers.get('etag'),
+                                                  last_modified=response.headers.get('last-modified'),
+                                                  n_retries=i_retry,
+                                                  skipped=True)
+                    os.remove(target_path)
+
+                if Path(f"{part_path}.ranges").exists():
+                    # Preallocated by an interrupted multi-connection download of the thread engine. Its size says
+                    # nothing about how much data arrived, and the async engine cannot continue individual ranges
+                    remove_partial_download(target_path)
+
+                n_bytes_local = os.path.getsize(part_path) if Path(part_path).exists() else 0
+                headers = dict()
+                if n_bytes_local > 0:
+                    count("download.n_resumed")
+                    headers["Range"] = f"bytes={n_bytes_local}-"
+                    validator = load_validator(part_path)
+                    if validator is not None:
+                        headers["If-Range"] = validator
+
+                request_start = time.perf_counter()
+                async with session.get(url, headers=headers) as response:
+                    observe("download.time_to_first_byte", time.perf_counter() - request_start)
+                    if response.status == 416:
+                        # The .part file is only complete if it has exactly the size of the remote file
+                        if get_total_size(response.headers) != n_bytes_local:
+                            byte_progress.write(f"{part_path} does not match {url}. Restarting download...")
+                            os.remove(part_path)
+                            continue
+                        total_size = n_bytes_local
+                    else:
+                        response.raise_for_status()
+                        if response.status == 206:
+                            mode = 'ab'
+                        else:
+                            # Server ignored the Range header or the file changed since the .part file was started
+                            mode = 'wb'
+                            n_bytes_local = 0
+                            save_validator(part_path, get_validator(response.headers))
+                        total_size = get_total_size(response.headers, n_bytes_offset=n_bytes_local)
+                        if total_size is not None:
+                            byte_progress.total += total_size - n_bytes_local
+                            byte_progress.refresh()
+
+                        with open(part_path, mode) as f:
+                            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                                if bandwidth_limiter is not None:
+                                    await bandwidth_limiter.acquire(len(chunk))
+                                # Disk writes happen in the default executor to not block the event loop
+                                await loop.run_in_executor(None, f.write, chunk)
+                                n_bytes_downloaded += len(chunk)
+                                byte_progress.update(len(chunk))
+
+                    if total_size is not None and os.path.getsize(part_path) != total_size:
+                        raise aiohttp.ClientPayloadError(f"Connection closed before {url} was fully received")
+
+                    total_size = os.path.getsize(part_path)
+                    os.replace(part_path, target_path)
+                    remove_partial_download(target_path)
+                    count("download.n_downloaded")
+                    observe("download.duration", time.perf_counter() - start)
+                    observe("download.bytes", n_bytes_downloaded, unit='bytes')
+                    return DownloadResult(url, target_path, total_size,
+                                          etag=response.headers.get('etag'),
+                                          last_modified=response.headers.get('last-modified'),
+                                          n_bytes_downloaded=n_bytes_downloaded,
+                                          n_retries=i_retry)
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # Client errors (e.g., 404) will not go away by retrying
+                is_client_error = isinstance(e, aiohttp.ClientResponseError) and e.status < 500
+                if is_client_error or i_retry == self._n_retries:
+                    byte_progress.write(f"Error occurred downloading {url}: {e}")
+                    count("download.n_failed")
+                    return None
+                count("download.n_retries")
+                await asyncio.sleep(self._backoff_factor * 2 ** i_retry)
+                i_retry += 1
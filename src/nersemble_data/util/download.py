@@ -1,31 +1,469 @@
+import json
 import os
-import urllib
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from urllib.error import HTTPError, URLError
+from threading import Lock
+from typing import Optional, List, Tuple, Mapping
 
 import requests
-from elias.util import ensure_directory_exists_for_file
+from requests.adapters import HTTPAdapter
 
+from nersemble_data.util.files import write_atomic
+from nersemble_data.util.instrumentation import timer, observe, count
 
-def download_file(url: str, target_path: str) -> None:
-    ensure_directory_exists_for_file(target_path)
+CHUNK_SIZE = 1 << 20  # 1 MB
+PARALLEL_DOWNLOAD_MIN_SIZE = 64 << 20  # Only files larger than 64 MB are fetched with multiple connections
 
-    if Path(target_path).exists():
-        response = requests.head(url)
-        download_size = int(response.headers['content-length'])
-        local_file_size = os.path.getsize(target_path)
+_RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout, requests.HTTPError, requests.exceptions.ChunkedEncodingError)
 
-        if download_size == local_file_size:
-            print(f"{target_path} already exists, skipping")
-            return
-        else:
-            print(f"{target_path} seems to be incomplete. Re-downloading...")
+_session: Optional[requests.Session] = None
+_session_lock = Lock()
 
-    print(f"Downloading file from {url} to {target_path}")
+
+@dataclass
+class DownloadResult:
+    url: str
+    target_path: str
+    size: int
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    n_bytes_downloaded: int = 0
+    n_retries: int = 0
+    skipped: bool = False
+
+
+class _RangeState:
+    """
+    Progress of a download with multiple connections. Persisted next to the .part file such that an interrupted
+    download can continue each range where it stopped.
+    """
+
+    def __init__(self, path: str, ranges: List[List[int]]):
+        self._path = path
+        self.ranges = ranges  # [start, end (exclusive), n_bytes_done] per range
+        self._lock = Lock()
+
+    @staticmethod
+    def create(path: str, total_size: int, n_ranges: int) -> '_RangeState':
+        range_size = -(-total_size // n_ranges)
+        ranges = [[start, min(start + range_size, total_size), 0] for start in range(0, total_size, range_size)]
+        range_state = _RangeState(path, ranges)
+        range_state.save()
+        return range_state
+
+    @staticmethod
+    def load(path: str) -> Optional['_RangeState']:
+        try:
+            with open(path) as f:
+                return _RangeState(path, json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def add_progress(self, i_range: int, n_bytes: int):
+        with self._lock:
+            self.ranges[i_range][2] += n_bytes
+
+    def save(self):
+        with self._lock:
+            # Written atomically, a progress file that was cut off would make the whole .part file unusable
+            write_atomic(self._path, json.dumps(self.ranges))
+
+    @property
+    def total_size(self) -> int:
+        return self.ranges[-1][1]
+
+
+class _RemoteFileChanged(requests.RequestException):
+    """
+    The file on the server is not the one that the .part file was started from (If-Range did not match).
+    """
+
+
+def get_session(pool_size: int = 64) -> requests.Session:
+    """
+    Shared HTTP session such that connections (and TLS handshakes) are reused across all downloads.
+    """
+
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+
+        return _session
+
+
+def download_file(url: str,
+                  target_path: str,
+                  session: Optional[requests.Session] = None,
+                  n_retries: int = 5,
+                  backoff_factor: float = 1.,
+                  n_connections: int = 1,
+                  timeout: float = 60,
+                  raise_errors: bool = False) -> Optional[DownloadResult]:
+    """
+    Downloads a file to target_path.
+    The data is first written to `target_path.part` which is only renamed once the download is complete. If a .part
+    file from an interrupted run exists, the download continues where it stopped via an HTTP Range request. The
+    ETag (or Last-Modified) of the original response is sent along as If-Range, such that a file that changed on the
+    server in the meantime is downloaded from scratch instead of being stitched together from two versions.
+
+    Parameters
+    ----------
+    url:
+        The URL to download
+    target_path:
+        Where to store the downloaded file
+    session:
+        HTTP session to use. Defaults to a shared session with connection pooling
+    n_retries:
+        How often a failed request is retried. Subsequent retries wait backoff_factor * 2^i seconds
+    backoff_factor:
+        Base waiting time for retries
+    n_connections:
+        Files larger than PARALLEL_DOWNLOAD_MIN_SIZE are fetched in this many byte ranges in parallel
+    timeout:
+        Timeout for connecting to the server and for receiving data in seconds
+    raise_errors:
+        Raise the requests exception of a failed download instead of returning None, e.g., to tell a missing file (404)
+        apart from an unreachable server
+
+    Returns
+    -------
+        Information about the downloaded file, or None if the download failed
+    """
+
+    if session is None:
+        session = get_session()
+
+    start = time.perf_counter()
+    Path(target_path).parent.mkdir(parents=True, exist_ok=True)
+    part_path = f"{target_path}.part"
+    range_state_path = f"{target_path}.part.ranges"
+    if Path(range_state_path).exists() and not Path(part_path).exists():
+        os.remove(range_state_path)
 
     try:
-        urllib.request.urlretrieve(url, target_path)
-    except HTTPError as e:
+        # A .part file with range progress was preallocated by an interrupted multi-connection download. Its size says
+        # nothing about how much data arrived, hence it can only be continued via its range progress, even if this run
+        # uses a single connection
+        if Path(target_path).exists() or n_connections > 1 or Path(range_state_path).exists():
+            response, n_retries_head = _request_with_retries(session, 'HEAD', url, n_retries, backoff_factor, timeout)
+            download_size = get_total_size(response.headers)
+            etag = response.headers.get('etag')
+            last_modified = response.headers.get('last-modified')
+
+            if Path(target_path).exists():
+                local_file_size = os.path.getsize(target_path)
+                if download_size == local_file_size:
+                    print(f"{target_path} already exists, skipping")
+                    count("download.n_skipped")
+                    return DownloadResult(url, target_path, download_size,
+                                          etag=etag, last_modified=last_modified, n_retries=n_retries_head, skipped=True)
+                else:
+                    print(f"{target_path} seems to be incomplete. Re-downloading...")
+                    os.remove(target_path)
+
+            range_state = None
+            if Path(range_state_path).exists():
+                range_state = _RangeState.load(range_state_path)
+                if range_state is None or range_state.total_size != download_size:
+                    print(f"{part_path} does not match {url}. Restarting download...")
+                    remove_partial_download(target_path)
+                    range_state = None
+
+            supports_ranges = response.headers.get('accept-ranges') == 'bytes'
+            if range_state is None \
+                    and n_connections > 1 \
+                    and supports_ranges \
+                    and download_size is not None \
+                    and download_size >= PARALLEL_DOWNLOAD_MIN_SIZE \
+                    and not Path(part_path).exists():
+                range_state = _RangeState.create(range_state_path, download_size, n_connections)
+                save_validator(part_path, get_validator(response.headers))
+
+            if range_state is not None:
+                print(f"Downloading file from {url} to {target_path} with {len(range_state.ranges)} connections")
+                try:
+                    result = _download_ranges(session, url, part_path, range_state, n_retries, backoff_factor, timeout)
+                except _RemoteFileChanged:
+                    print(f"{url} changed since the download was started. Restarting download...")
+                    remove_partial_download(target_path)
+                else:
+                    result.n_retries += n_retries_head
+                    os.replace(part_path, target_path)
+                    remove_partial_download(target_path)
+                    result.target_path = target_path
+                    _record_download(result, start)
+                    return result
+
+        if Path(part_path).exists():
+            count("download.n_resumed")
+        print(f"Downloading file from {url} to {target_path}")
+        result = _download_stream(session, url, part_path, n_retries, backoff_factor, timeout)
+        os.replace(part_path, target_path)
+        remove_partial_download(target_path)
+        result.target_path = target_path
+        _record_download(result, start)
+        return result
+
+    except requests.HTTPError as e:
+        if raise_errors:
+            raise
         print(f"HTTP error occurred reaching {url}: {e}")
-    except URLError as e:
+    except requests.RequestException as e:
+        if raise_errors:
+            raise
         print(f"URL error occurred reaching {url}: {e}")
+
+    count("download.n_failed")
+    return None
+
+
+def remove_partial_download(target_path: str):
+    """
+    Removes the .part file of an unfinished download of target_path together with its range progress and validator.
+    """
+
+    part_path = f"{target_path}.part"
+    for path in (part_path, f"{part_path}.ranges", f"{part_path}.validator"):
+        if Path(path).exists():
+            os.remove(path)
+
+
+def get_total_size(headers: Mapping[str, str], n_bytes_offset: int = 0) -> Optional[int]:
+    """
+    Size of the complete remote file, taken from Content-Range ("bytes 0-99/1000" or "bytes */1000") if present and
+    from Content-Length otherwise. n_bytes_offset is added to the Content-Length of partial responses.
+    None if the server did not tell.
+    """
+
+    content_range = headers.get('content-range')
+    if content_range is not None:
+        match = re.fullmatch(r'bytes (?:\d+-\d+|\*)/(\d+)', content_range.strip())
+        if match is not None:
+            return int(match[1])
+
+    content_length = headers.get('content-length')
+    return None if content_length is None else n_bytes_offset + int(content_length)
+
+
+def get_validator(headers: Mapping[str, str]) -> Optional[str]:
+    """
+    Value for If-Range that identifies the version of the remote file: its ETag, or Last-Modified for servers without
+    strong ETags (If-Range does not accept weak ones).
+    """
+
+    etag = headers.get('etag')
+    if etag is not None and not etag.startswith('W/'):
+        return etag
+    return headers.get('last-modified')
+
+
+def save_validator(part_path: str, validator: Optional[str]):
+    """
+    Remembers which version of the remote file the .part file belongs to, see get_validator().
+    """
+
+    validator_path = f"{part_path}.validator"
+    if validator is None:
+        if Path(validator_path).exists():
+            os.remove(validator_path)
+        return
+
+    with open(validator_path, 'w') as f:
+        f.write(validator)
+
+
+def load_validator(part_path: str) -> Optional[str]:
+    try:
+        with open(f"{part_path}.validator") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def get_remote_size(url: str,
+                    session: Optional[requests.Session] = None,
+                    n_retries: int = 5,
+                    backoff_factor: float = 1.,
+                    timeout: float = 60) -> Optional[int]:
+    """
+    Size of the file behind url in bytes as reported by a HEAD request, or None if the server could not tell.
+    """
+
+    if session is None:
+        session = get_session()
+
+    try:
+        response, _ = _request_with_retries(session, 'HEAD', url, n_retries, backoff_factor, timeout)
+    except requests.RequestException as e:
+        print(f"Could not query size of {url}: {e}")
+        return None
+
+    return get_total_size(response.headers)
+
+
+def _request_with_retries(session: requests.Session,
+                          method: str,
+                          url: str,
+                          n_retries: int,
+                          backoff_factor: float,
+                          timeout: float,
+                          **kwargs) -> Tuple[requests.Response, int]:
+    for i_retry in range(n_retries + 1):
+        try:
+            with timer(f"download.{method.lower()}"):
+                response = session.request(method, url, timeout=timeout, **kwargs)
+            response.raise_for_status()
+            return response, i_retry
+        except _RETRYABLE_ERRORS as e:
+            _backoff_or_raise(e, i_retry, n_retries, backoff_factor)
+
+
+def _backoff_or_raise(error: Exception, i_retry: int, n_retries: int, backoff_factor: float):
+    # Client errors (e.g., 404) will not go away by retrying
+    response = getattr(error, 'response', None)
+    is_client_error = isinstance(error, requests.HTTPError) and response is not None and response.status_code < 500
+    if is_client_error or i_retry == n_retries:
+        raise error
+    count("download.n_retries")
+    time.sleep(backoff_factor * 2 ** i_retry)
+
+
+def _record_download(result: DownloadResult, start: float):
+    count("download.n_downloaded")
+    observe("download.duration", time.perf_counter() - start)
+    observe("download.bytes", result.n_bytes_downloaded, unit='bytes')
+
+
+def _download_stream(session: requests.Session,
+                     url: str,
+                     part_path: str,
+                     n_retries: int,
+                     backoff_factor: float,
+                     timeout: float) -> DownloadResult:
+    n_bytes_downloaded = 0
+    i_retry = 0
+    while True:
+        n_bytes_local = os.path.getsize(part_path) if Path(part_path).exists() else 0
+        headers = dict()
+        if n_bytes_local > 0:
+            headers["Range"] = f"bytes={n_bytes_local}-"
+            validator = load_validator(part_path)
+            if validator is not None:
+                headers["If-Range"] = validator
+
+        try:
+            request_start = time.perf_counter()
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                # With stream=True, get() returns as soon as the response headers arrived
+                observe("download.time_to_first_byte", time.perf_counter() - request_start)
+                if response.status_code == 416:
+                    # Requested range starts behind the end of the file. The .part file is only complete if it has
+                    # exactly the size of the remote file, otherwise it belongs to some other file
+                    if get_total_size(response.headers) == n_bytes_local:
+                        return DownloadResult(url, part_path, n_bytes_local, n_retries=i_retry)
+                    print(f"{part_path} does not match {url}. Restarting download...")
+                    os.remove(part_path)
+                    continue
+                response.raise_for_status()
+
+                if response.status_code == 206:
+                    mode = 'ab'
+                else:
+                    # Server ignored the Range header or the file changed since the .part file was started (If-Range),
+                    # and sends the whole file
+                    mode = 'wb'
+                    n_bytes_local = 0
+                    save_validator(part_path, get_validator(response.headers))
+                total_size = get_total_size(response.headers, n_bytes_offset=n_bytes_local)
+
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        n_bytes_downloaded += len(chunk)
+
+                if total_size is not None and os.path.getsize(part_path) != total_size:
+                    raise requests.ConnectionError(f"Connection closed before {url} was fully received")
+
+                return DownloadResult(url, part_path, os.path.getsize(part_path),
+                                      etag=response.headers.get('etag'),
+                                      last_modified=response.headers.get('last-modified'),
+                                      n_bytes_downloaded=n_bytes_downloaded,
+                                      n_retries=i_retry)
+
+        except _RETRYABLE_ERRORS as e:
+            _backoff_or_raise(e, i_retry, n_retries, backoff_factor)
+            i_retry += 1
+
+
+def _download_ranges(session: requests.Session,
+                     url: str,
+                     part_path: str,
+                     range_state: _RangeState,
+                     n_retries: int,
+                     backoff_factor: float,
+                     timeout: float) -> DownloadResult:
+    total_size = range_state.total_size
+    if not Path(part_path).exists():
+        with open(part_path, 'wb') as f:
+            f.truncate(total_size)
+    validator = load_validator(part_path)
+
+    def download_range(i_range: int) -> Tuple[int, int, Optional[str], Optional[str]]:
+        n_bytes_downloaded = 0
+        for i_retry in range(n_retries + 1):
+            start, end, n_bytes_done = range_state.ranges[i_range]
+            if start + n_bytes_done >= end:
+                return n_bytes_downloaded, i_retry, None, None
+
+            headers = {"Range": f"bytes={start + n_bytes_done}-{end - 1}"}
+            if validator is not None:
+                headers["If-Range"] = validator
+            try:
+                request_start = time.perf_counter()
+                with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                    observe("download.time_to_first_byte", time.perf_counter() - request_start)
+                    response.raise_for_status()
+                    if response.status_code != 206 and validator is not None:
+                        raise _RemoteFileChanged(f"{url} does not match If-Range {validator}")
+                    if response.status_code != 206:
+                        raise requests.HTTPError(f"Server does not support range requests for {url}", response=response)
+
+                    with open(part_path, 'r+b') as f:
+                        f.seek(start + n_bytes_done)
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            f.write(chunk)
+                            n_bytes_downloaded += len(chunk)
+                            range_state.add_progress(i_range, len(chunk))
+
+                    if range_state.ranges[i_range][0] + range_state.ranges[i_range][2] < end:
+                        raise requests.ConnectionError(f"Connection closed before {url} was fully received")
+
+                    return n_bytes_downloaded, i_retry, response.headers.get('etag'), response.headers.get('last-modified')
+
+            except _RETRYABLE_ERRORS as e:
+                _backoff_or_raise(e, i_retry, n_retries, backoff_factor)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(range_state.ranges)) as executor:
+            range_results = list(executor.map(download_range, range(len(range_state.ranges))))
+    finally:
+        # Remember which bytes already arrived, such that a later run can continue from there
+        range_state.save()
+
+    etags = [etag for _, _, etag, _ in range_results if etag is not None]
+    last_modifieds = [last_modified for _, _, _, last_modified in range_results if last_modified is not None]
+    return DownloadResult(url, part_path, total_size,
+                          etag=etags[0] if etags else None,
+                          last_modified=last_modifieds[0] if last_modifieds else None,
+                          n_bytes_downloaded=sum(n_bytes for n_bytes, _, _, _ in range_results),
+                          n_retries=sum(n_retries for _, n_retries, _, _ in range_results))
+
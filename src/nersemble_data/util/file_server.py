@@ -0,0 +1,207 @@
+import email.utils
+import os
+import re
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Optional
+from urllib.parse import unquote
+
+from nersemble_data.util.manifest import DownloadManifest
+
+CHUNK_SIZE = 1 << 20  # 1 MB
+
+
+class _ThreadingHTTPServer(ThreadingHTTPServer):
+    # Many clients download in parallel, the default listen backlog of 5 would drop their connection attempts, which
+    # are then only retried after a TCP timeout of 1s
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class FileServer:
+    """
+    Serves the files of a folder over HTTP from a background thread. Byte ranges (including If-Range) are supported,
+    hence clients can resume downloads and use multiple connections per file.
+    Subclasses decide which files are served by overriding _get_file_path().
+    Usage:
+        with FileServer(folder, port=0) as server:
+            download_file(f"{server.url}/file.bin", ...)
+    """
+
+    def __init__(self, root: str, host: str = '127.0.0.1', port: int = 0):
+        """
+        Parameters
+        ----------
+        root:
+            Folder whose files are served
+        host:
+            Interface to listen on. Use 0.0.0.0 to make the files available to other machines
+        port:
+            Port to listen on. 0 picks a free port
+        """
+
+        self._root = Path(root).resolve()
+        self.n_requests = 0
+        self.n_bytes_sent = 0
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                server._handle(self, send_body=False)
+
+            def do_GET(self):
+                server._handle(self, send_body=True)
+
+        self._http_server = _ThreadingHTTPServer((host, port), Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._http_server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve_forever(self):
+        self._http_server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._http_server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._http_server.shutdown()
+        self._http_server.server_close()
+
+    def __enter__(self) -> 'FileServer':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _get_file_path(self, relative_path: str) -> Optional[Path]:
+        """
+        Returns
+        -------
+            The local file that is served for relative_path, or None if the request is answered with 404
+        """
+
+        path = (self._root / relative_path).resolve()
+        # Paths with .. must not escape the served folder
+        if self._root not in path.parents or not path.is_file():
+            return None
+
+        return path
+
+    def _write_chunk(self, handler: BaseHTTPRequestHandler, chunk: bytes):
+        handler.wfile.write(chunk)
+
+    def _handle(self, handler: BaseHTTPRequestHandler, send_body: bool):
+        with self._lock:
+            self.n_requests += 1
+
+        path = self._get_file_path(unquote(handler.path.split('?')[0]).lstrip('/'))
+        if path is None:
+            _send_empty(handler, 404)
+            return
+
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+        last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        start, end = 0, size - 1
+        status = 200
+        range_header = handler.headers.get('Range')
+        if_range = handler.headers.get('If-Range')
+        if if_range is not None and if_range.strip() not in (etag, last_modified):
+            # The file changed since the client started its download, the whole file has to be sent again
+            range_header = None
+        if range_header is not None:
+            match = re.fullmatch(r'bytes=(\d+)-(\d*)', range_header.strip())
+            if match is None:
+                _send_empty(handler, 400)
+                return
+            start = int(match[1])
+            end = min(int(match[2]), size - 1) if match[2] else size - 1
+            if start >= size or start > end:
+                _send_empty(handler, 416, content_range=f"bytes */{size}")
+                return
+            status = 206
+
+        handler.send_response(status)
+        handler.send_header('Content-Length', str(end - start + 1))
+        handler.send_header('Accept-Ranges', 'bytes')
+        handler.send_header('ETag', etag)
+        handler.send_header('Last-Modified', last_modified)
+        if status == 206:
+            handler.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        handler.end_headers()
+        if not send_body:
+            return
+
+        with open(path, 'rb') as f:
+            f.seek(start)
+            n_remaining = end - start + 1
+            while n_remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, n_remaining))
+                if not chunk:
+                    break
+                self._write_chunk(handler, chunk)
+                n_remaining -= len(chunk)
+
+        with self._lock:
+            self.n_bytes_sent += end - start + 1 - n_remaining
+
+
+class PeerFileServer(FileServer):
+    """
+    Serves the completely downloaded files of a local NeRSemble folder over HTTP in the same layout as the origin
+    server, such that other nodes can use it as mirror (`--mirrors http://{host}:{port}`).
+    Only files that are recorded as complete in the download manifest and were not modified since are served, partial
+    downloads or other files in the folder are answered with 404.
+    """
+
+    def __init__(self, nersemble_folder: str, host: str = '127.0.0.1', port: int = 8000):
+        """
+        Parameters
+        ----------
+        nersemble_folder:
+            The local NeRSemble folder whose files are served
+        host:
+            Interface to listen on. Use 0.0.0.0 to make the files available to other machines
+        port:
+            Port to listen on. 0 picks a free port
+        """
+
+        super().__init__(nersemble_folder, host=host, port=port)
+        self._manifest = DownloadManifest(nersemble_folder)
+
+    def stop(self):
+        super().stop()
+        self._manifest.close()
+
+    def __enter__(self) -> 'PeerFileServer':
+        self.start()
+        return self
+
+    def _get_file_path(self, relative_path: str) -> Optional[Path]:
+        path = super()._get_file_path(relative_path)
+        if path is None or not self._manifest.is_up_to_date(path.relative_to(self._root).as_posix()):
+            return None
+
+        return path
+
+
+def _send_empty(handler: BaseHTTPRequestHandler, status: int, content_range: Optional[str] = None):
+    handler.send_response(status)
+    if content_range is not None:
+        handler.send_header('Content-Range', content_range)
+    handler.send_header('Content-Length', '0')
+    handler.end_headers()
@@ -0,0 +1,24 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import Union
+
+
+def write_atomic(path: str, data: Union[bytes, str]):
+    """
+    Replaces the file at path with data, such that readers only ever see the previous or the complete new content.
+    Several threads or processes may write the same file at the same time, each one uses its own temporary file in
+    the same folder.
+    """
+
+    if isinstance(data, str):
+        data = data.encode()
+
+    f = tempfile.NamedTemporaryFile(dir=Path(path).parent, prefix=f"{Path(path).name}.", suffix='.tmp', delete=False)
+    try:
+        with f:
+            f.write(data)
+        os.replace(f.name, path)
+    except BaseException:
+        os.remove(f.name)
+        raise
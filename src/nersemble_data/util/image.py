@@ -0,0 +1,72 @@
+from typing import Tuple, Optional, Literal
+
+import numpy as np
+
+# (left, top, right, bottom) in pixels of the full-resolution frame. right and bottom are exclusive
+CropBox = Tuple[int, int, int, int]
+
+# bilinear: Pillow's (antialiased) bilinear filter, which is what load_image() has always used
+# area: OpenCV's area interpolation. Faster, and exact block averages for integer factors
+Interpolation = Literal['bilinear', 'area']
+
+
+def crop_image(image: np.ndarray, crop_box: CropBox) -> np.ndarray:
+    """
+    Returns a view of the crop_box region of image without copying any pixels.
+    """
+
+    left, top, right, bottom = crop_box
+    height, width = image.shape[:2]
+    assert 0 <= left < right <= width and 0 <= top < bottom <= height, \
+        f"Crop box {crop_box} does not fit into image of size {width}x{height}"
+
+    return image[top:bottom, left:right]
+
+
+def get_downscaled_size(width: int, height: int, downscale_factor: Optional[float]) -> Tuple[int, int]:
+    if downscale_factor is None:
+        return width, height
+
+    # NB: Python's round() does round-to-even! Regular round can be implemented by int(x + 0.5)
+    return int(width / downscale_factor + 0.5), int(height / downscale_factor + 0.5)
+
+
+def downscale_image(image: np.ndarray, downscale_factor: float, interpolation: Interpolation = 'bilinear') -> np.ndarray:
+    """
+    Downscales a uint8 image.
+    With area interpolation, every output pixel is the average of the input pixels it covers. For integer factors, this
+    is an exact block average, hence downscaling commutes with crops whose coordinates are multiples of the factor.
+    """
+
+    height, width = image.shape[:2]
+    size = get_downscaled_size(width, height, downscale_factor)
+
+    if interpolation == 'area':
+        import cv2
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+    assert interpolation == 'bilinear', f"Unknown interpolation {interpolation}, expected 'bilinear' or 'area'"
+    from PIL import Image
+    return np.asarray(Image.fromarray(image).resize(size, resample=Image.Resampling.BILINEAR))
+
+
+def downscale_crop_box(crop_box: CropBox,
+                       downscale_factor: Optional[float],
+                       interpolation: Interpolation = 'area') -> Optional[CropBox]:
+    """
+    Maps a crop box from full-resolution pixels to pixels of the image downscaled by downscale_factor.
+
+    Returns
+    -------
+        The crop box in downscaled pixels, or None if cropping after downscaling would not give the same result as
+        downscaling the crop. That is the case for crop boxes that are not aligned with the downscaled pixel grid and for
+        bilinear interpolation, whose filter reaches beyond the crop borders
+    """
+
+    if downscale_factor is None:
+        return crop_box
+
+    if interpolation != 'area' or downscale_factor != int(downscale_factor) or any(coordinate % int(downscale_factor) != 0 for coordinate in crop_box):
+        return None
+
+    return tuple(coordinate // int(downscale_factor) for coordinate in crop_box)
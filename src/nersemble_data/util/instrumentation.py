@@ -0,0 +1,332 @@
+"""
+Opt-in instrumentation of the data loading and download hot paths.
+Disabled by default. While disabled, timer() returns a shared no-op context manager and count() / observe() return
+immediately, such that the hooks cost a single global lookup.
+
+Usage:
+    enable_instrumentation(log_interval=30, dump_path="stats.json")
+    ... load images / download files ...
+    print_stats()
+    disable_instrumentation()
+
+Statistics are collected per process, i.e., every DataLoader worker has its own recorder.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Union
+
+from nersemble_data.util.files import write_atomic
+
+# ----------------------------------------------------------
+# Histograms
+# ----------------------------------------------------------
+
+
+@dataclass
+class Histogram:
+    """
+    Streaming histogram with power-of-two buckets. Memory is bounded independent of the number of observations,
+    percentiles are exact up to a factor of 2 (clipped to the observed min / max).
+    """
+
+    unit: str = 's'
+    count: int = 0
+    total: float = 0.
+    min: float = math.inf
+    max: float = -math.inf
+    buckets: Dict[int, int] = field(default_factory=dict)  # exponent e -> number of values in [2^(e-1), 2^e)
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        exponent = math.frexp(value)[1] if value > 0 else None
+        self.buckets[exponent] = self.buckets.get(exponent, 0) + 1
+
+    def get_percentile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+
+        n_target = q / 100 * self.count
+        n_seen = 0
+        # Non-positive values (None bucket) come first
+        for exponent in sorted(self.buckets.keys(), key=lambda e: -math.inf if e is None else e):
+            n_seen += self.buckets[exponent]
+            if n_seen >= n_target:
+                upper_bound = 0. if exponent is None else math.ldexp(1, exponent)
+                return min(max(upper_bound, self.min), self.max)
+
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count > 0 else None
+
+    def to_dict(self) -> Dict[str, Union[str, int, float, None]]:
+        # Statistics of empty histograms are None (null in JSON) instead of NaN, which is not valid JSON
+        return {
+            "unit": self.unit,
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "min": self.min if self.count > 0 else None,
+            "p50": self.get_percentile(50),
+            "p90": self.get_percentile(90),
+            "p99": self.get_percentile(99),
+            "max": self.max if self.count > 0 else None,
+        }
+
+
+class _Recorder:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = dict()
+        self.counters: Dict[str, int] = dict()
+        self.start_time = time.time()
+
+    def observe(self, name: str, value: float, unit: str):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = Histogram(unit=unit)
+                self.histograms[name] = histogram
+            histogram.add(value)
+
+    def count(self, name: str, n: int):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "duration_s": time.time() - self.start_time,
+                "counters": dict(sorted(self.counters.items())),
+                "histograms": {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())},
+            }
+
+
+class _Timer:
+    __slots__ = ('_recorder', '_name', '_start')
+
+    def __init__(self, recorder: _Recorder, name: str):
+        self._recorder = recorder
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._recorder.observe(self._name, time.perf_counter() - self._start, 's')
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class _Reporter:
+    """
+    Background thread that periodically logs and/or dumps the statistics.
+    """
+
+    def __init__(self, log_interval: float, log: bool, dump_path: Optional[str]):
+        self._log_interval = log_interval
+        self._log = log
+        self._dump_path = dump_path
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self._log_interval):
+            self.report()
+
+    def report(self):
+        if self._log:
+            print_stats()
+        if self._dump_path is not None:
+            dump_stats(self._dump_path)
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+
+_NULL_TIMER = _NullTimer()
+_recorder: Optional[_Recorder] = None
+_reporter: Optional[_Reporter] = None
+_dump_path: Optional[str] = None
+
+# ----------------------------------------------------------
+# Configuration
+# ----------------------------------------------------------
+
+
+def enable_instrumentation(log_interval: Optional[float] = None, log: bool = True, dump_path: Optional[str] = None):
+    """
+    Starts recording timings and counters. Already recorded statistics are kept.
+
+    Parameters
+    ----------
+    log_interval:
+        If given, the statistics are reported every `log_interval` seconds from a background thread
+    log:
+        Whether the periodic report prints the statistics to the console
+    dump_path:
+        If given, the periodic report (and disable_instrumentation()) writes the statistics to this JSON file
+    """
+
+    global _recorder, _reporter, _dump_path
+    if _recorder is None:
+        _recorder = _Recorder()
+    if _reporter is not None:
+        _reporter.stop()
+        _reporter = None
+    _dump_path = dump_path
+    if log_interval is not None:
+        _reporter = _Reporter(log_interval, log, dump_path)
+
+
+def disable_instrumentation() -> Optional[dict]:
+    """
+    Stops recording. Writes a final JSON dump if a dump_path was configured.
+
+    Returns
+    -------
+        The statistics recorded until now, or None if instrumentation was not enabled
+    """
+
+    global _recorder, _reporter, _dump_path
+    if _recorder is None:
+        return None
+
+    if _reporter is not None:
+        _reporter.stop()
+        _reporter = None
+    if _dump_path is not None:
+        dump_stats(_dump_path)
+        _dump_path = None
+
+    stats = _recorder.get_stats()
+    _recorder = None
+    return stats
+
+
+def is_instrumentation_enabled() -> bool:
+    return _recorder is not None
+
+
+def reset_stats():
+    global _recorder
+    if _recorder is not None:
+        _recorder = _Recorder()
+
+
+# ----------------------------------------------------------
+# Hooks
+# ----------------------------------------------------------
+
+
+def timer(name: str) -> Union[_Timer, _NullTimer]:
+    """
+    Context manager that records the duration of its body in the histogram `name`.
+    """
+
+    recorder = _recorder
+    if recorder is None:
+        return _NULL_TIMER
+    return _Timer(recorder, name)
+
+
+def observe(name: str, value: float, unit: str = 's'):
+    """
+    Adds a single value (e.g., a duration measured elsewhere or a number of bytes) to the histogram `name`.
+    """
+
+    recorder = _recorder
+    if recorder is not None:
+        recorder.observe(name, value, unit)
+
+
+def count(name: str, n: int = 1):
+    recorder = _recorder
+    if recorder is not None:
+        recorder.count(name, n)
+
+
+# ----------------------------------------------------------
+# Reporting
+# ----------------------------------------------------------
+
+
+def get_stats() -> Optional[dict]:
+    """
+    Returns
+    -------
+        {"pid", "duration_s", "counters": {name: n}, "histograms": {name: {unit, count, total, mean, min, p50, ...}}}
+        or None if instrumentation is not enabled
+    """
+
+    recorder = _recorder
+    return None if recorder is None else recorder.get_stats()
+
+
+def dump_stats(path: str):
+    stats = get_stats()
+    if stats is None:
+        return
+
+    # Replace atomically, such that a concurrent reader never sees a half-written file
+    write_atomic(path, json.dumps(stats, indent=2, allow_nan=False))
+
+
+def format_stats(stats: Optional[dict] = None) -> str:
+    if stats is None:
+        stats = get_stats()
+    if stats is None:
+        return "Instrumentation is disabled"
+
+    lines = [f"=== Instrumentation (pid {stats['pid']}, {stats['duration_s']:.1f}s) ==="]
+    if stats['histograms']:
+        width = max(len(name) for name in stats['histograms'].keys())
+        lines.append(f"{'':<{width}}  {'count':>8}  {'total':>10}  {'mean':>10}  {'p50':>10}  {'p90':>10}  {'p99':>10}")
+        for name, histogram in stats['histograms'].items():
+            values = [_format_value(histogram[key], histogram['unit']) for key in ('total', 'mean', 'p50', 'p90', 'p99')]
+            lines.append(f"{name:<{width}}  {histogram['count']:>8}  " + "  ".join(f"{value:>10}" for value in values))
+    for name, n in stats['counters'].items():
+        lines.append(f"{name}: {n}")
+
+    return "\n".join(lines)
+
+
+def print_stats():
+    print(format_stats())
+
+
+def _format_value(value: Optional[float], unit: str) -> str:
+    if value is None:
+        return "-"
+    if unit == 's':
+        return f"{value * 1000:.2f}ms" if value < 10 else f"{value:.1f}s"
+    if unit == 'bytes':
+        for unit_prefix in ('B', 'KB', 'MB', 'GB'):
+            if abs(value) < 1024 or unit_prefix == 'GB':
+                return f"{value:.1f}{unit_prefix}"
+            value /= 1024
+    return f"{value:.3g}"
@@ -0,0 +1,145 @@
+import hashlib
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from threading import Lock
+from typing import Optional, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from nersemble_data.util.download import DownloadResult
+
+HASH_CHUNK_SIZE = 8 << 20  # 8 MB
+
+
+@dataclass
+class ManifestEntry:
+    relative_path: str
+    url: str
+    size: int
+    mtime_ns: int  # Modification time of the local file when it was recorded
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    sha256: Optional[str] = None
+    recorded_at: Optional[float] = None
+
+
+class DownloadManifest:
+    """
+    Local record of all files that were completely downloaded into a NeRSemble folder.
+    A file whose size and modification time still match its manifest entry is considered up-to-date without having to
+    ask the server. Stored as SQLite database at `{nersemble_folder}/.nersemble_manifest.sqlite`.
+    """
+
+    FILE_NAME = ".nersemble_manifest.sqlite"
+
+    def __init__(self, nersemble_folder: str):
+        self._nersemble_folder = nersemble_folder
+        os.makedirs(nersemble_folder, exist_ok=True)
+        self._connection = sqlite3.connect(f"{nersemble_folder}/{self.FILE_NAME}", check_same_thread=False)
+        self._lock = Lock()
+
+        with self._lock:
+            # Rollback journal (SQLite's default) instead of WAL, since WAL needs shared memory between all processes
+            # that open the database, which does not work on network file systems where datasets are often stored.
+            # Set explicitly to convert manifests that were created in WAL mode
+            self._connection.execute("PRAGMA journal_mode=DELETE")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS assets (
+                    relative_path TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    sha256 TEXT,
+                    recorded_at REAL
+                )""")
+            self._connection.commit()
+
+    def get(self, relative_path: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM assets WHERE relative_path = ?", (relative_path,)).fetchone()
+        return None if row is None else ManifestEntry(*row)
+
+    def list_entries(self) -> List[ManifestEntry]:
+        with self._lock:
+            rows = self._connection.execute("SELECT * FROM assets ORDER BY relative_path").fetchall()
+        return [ManifestEntry(*row) for row in rows]
+
+    def is_up_to_date(self, relative_path: str) -> bool:
+        """
+        Whether the local file was completely downloaded and has not been touched since. Does not access the network.
+        """
+
+        entry = self.get(relative_path)
+        if entry is None:
+            return False
+
+        try:
+            stat = os.stat(self.get_local_path(relative_path))
+        except FileNotFoundError:
+            return False
+
+        return stat.st_size == entry.size and stat.st_mtime_ns == entry.mtime_ns
+
+    def record(self, relative_path: str, download_result: 'DownloadResult', compute_hash: bool = False):
+        """
+        Stores a completely downloaded file in the manifest.
+        """
+
+        local_path = self.get_local_path(relative_path)
+        sha256 = compute_sha256(local_path) if compute_hash else None
+        stat = os.stat(local_path)
+        entry = ManifestEntry(relative_path=relative_path,
+                              url=download_result.url,
+                              size=stat.st_size,
+                              mtime_ns=stat.st_mtime_ns,
+                              etag=download_result.etag,
+                              last_modified=download_result.last_modified,
+                              sha256=sha256,
+                              recorded_at=time.time())
+        self._put(entry)
+
+    def set_hash(self, relative_path: str, sha256: str):
+        with self._lock:
+            self._connection.execute("UPDATE assets SET sha256 = ? WHERE relative_path = ?", (sha256, relative_path))
+            self._connection.commit()
+
+    def remove(self, relative_path: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM assets WHERE relative_path = ?", (relative_path,))
+            self._connection.commit()
+
+    def get_local_path(self, relative_path: str) -> str:
+        return f"{self._nersemble_folder}/{relative_path}"
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _put(self, entry: ManifestEntry):
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (entry.relative_path, entry.url, entry.size, entry.mtime_ns,
+                                      entry.etag, entry.last_modified, entry.sha256, entry.recorded_at))
+            self._connection.commit()
+
+    def __enter__(self) -> 'DownloadManifest':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def compute_sha256(path: str) -> str:
+    # hashlib releases the GIL for large updates, so hashing several files from a thread pool runs in parallel
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
@@ -1,35 +1,154 @@
+import json
+import os
+import time
+from pathlib import Path
 from typing import List, Optional, Dict
 
-import pandas as pd
-
-from nersemble_data.env import NERSEMBLE_DATA_URL
+from nersemble_data.env import NERSEMBLE_DATA_URL, NERSEMBLE_CACHE_DIR, NERSEMBLE_OFFLINE, NERSEMBLE_METADATA_MAX_AGE
+from nersemble_data.util.files import write_atomic
 
 
 class NeRSembleMetadata:
 
-    def __init__(self):
-        self._metadata_sequences = pd.read_csv(f"{NERSEMBLE_DATA_URL}/metadata_sequences.csv", )
+    def __init__(self,
+                 offline: Optional[bool] = None,
+                 max_age: Optional[float] = None,
+                 cache_dir: Optional[str] = None):
+        """
+        The metadata CSVs are cached locally and only revalidated with the server once they are older than `max_age`.
+        Parsing the CSV into a participant -> sequences index happens once per new version of the CSV.
+
+        Parameters
+        ----------
+        offline:
+            Never contact the server and use the cached metadata. Defaults to NERSEMBLE_OFFLINE
+        max_age:
+            Seconds after which the cached metadata is revalidated with the server. Defaults to NERSEMBLE_METADATA_MAX_AGE
+        cache_dir:
+            Where the metadata is cached. Defaults to NERSEMBLE_CACHE_DIR
+        """
+
+        offline = NERSEMBLE_OFFLINE if offline is None else offline
+        max_age = NERSEMBLE_METADATA_MAX_AGE if max_age is None else max_age
+        cache_dir = NERSEMBLE_CACHE_DIR if cache_dir is None else cache_dir
+
+        metadata_sequences_path = fetch_cached(f"{NERSEMBLE_DATA_URL}/metadata_sequences.csv",
+                                               f"{cache_dir}/metadata_sequences.csv",
+                                               max_age=max_age,
+                                               offline=offline)
+        index = _load_or_build_sequences_index(metadata_sequences_path)
+        self._participant_ids: List[int] = index['participant_ids']
+        self._sequence_names: List[str] = index['sequence_names']
+        self._sequences_per_participant: Dict[int, List[str]] = {int(p_id): sequences for p_id, sequences in
+                                                                 index['sequences_per_participant'].items()}
 
     def list_participants(self) -> List[int]:
-        participant_ids = [p_id for p_id in self._metadata_sequences['ID']]
-        return participant_ids
+        return list(self._participant_ids)
 
     def list_sequences_for_all_participants(self, include_background: bool = False) -> Dict[int, List[str]]:
-        participant_ids = self.list_participants()
-        sequences_per_participant = dict()
-        for participant_id in participant_ids:
-            available_sequences = self.list_sequences_for_participant(participant_id, include_background=include_background)
-            sequences_per_participant[participant_id] = available_sequences
-
+        sequences_per_participant = {participant_id: self.list_sequences_for_participant(participant_id, include_background=include_background)
+                                     for participant_id in self._participant_ids}
         return sequences_per_participant
 
     def list_sequences_for_participant(self, participant_id: int, include_background: bool = False) -> List[str]:
-        participant_row = self._metadata_sequences[self._metadata_sequences['ID'] == participant_id]
-        available_sequences = participant_row.apply(lambda row: row[(row == 'x') | (row == 'm')].index, axis=1).tolist()[0].tolist()
+        assert participant_id in self._sequences_per_participant, f"Participant {participant_id} does not exist"
+        available_sequences = self._sequences_per_participant[participant_id]
         if not include_background:
             available_sequences = [seq_name for seq_name in available_sequences if seq_name != 'BACKGROUND']
+        else:
+            available_sequences = list(available_sequences)
 
         return available_sequences
 
     def list_sequences(self) -> List[str]:
-        return [seq_name for seq_name in self._metadata_sequences.columns if seq_name not in ['ID', 'wears_glasses']]
+        return list(self._sequence_names)
+
+
+def fetch_cached(url: str, cache_path: str, max_age: float, offline: bool = False) -> str:
+    """
+    Returns the path to a local copy of `url`.
+    The copy is revalidated with a conditional request (If-None-Match / If-Modified-Since) once it is older than
+    `max_age` seconds, i.e., unchanged files are not transferred again. If the server cannot be reached, an existing
+    copy is used.
+    """
+
+    cache_info_path = f"{cache_path}.info.json"
+    cache_info = dict()
+    if Path(cache_path).exists() and Path(cache_info_path).exists():
+        with open(cache_info_path) as f:
+            cache_info = json.load(f)
+
+    if offline:
+        assert Path(cache_path).exists(), f"No cached copy of {Path(cache_path).name} available in offline mode. " \
+                                          f"Run once without NERSEMBLE_OFFLINE to populate the cache"
+        return cache_path
+
+    if cache_info and time.time() - cache_info['validated_at'] < max_age:
+        return cache_path
+
+    import requests
+    from nersemble_data.util.download import get_session
+
+    headers = dict()
+    if cache_info.get('etag') is not None:
+        headers['If-None-Match'] = cache_info['etag']
+    if cache_info.get('last_modified') is not None:
+        headers['If-Modified-Since'] = cache_info['last_modified']
+
+    try:
+        response = get_session().get(url, headers=headers, timeout=30)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        if Path(cache_path).exists():
+            print(f"Could not revalidate {Path(cache_path).name} ({e}), using cached copy")
+            return cache_path
+        raise
+
+    if response.status_code != 304:
+        os.makedirs(Path(cache_path).parent, exist_ok=True)
+        write_atomic(cache_path, response.content)
+        cache_info = {
+            'etag': response.headers.get('etag'),
+            'last_modified': response.headers.get('last-modified'),
+        }
+
+    cache_info['validated_at'] = time.time()
+    write_atomic(cache_info_path, json.dumps(cache_info))
+
+    return cache_path
+
+
+def _load_or_build_sequences_index(metadata_sequences_path: str) -> dict:
+    # The index is tied to the exact version of the CSV it was built from
+    index_path = f"{metadata_sequences_path}.index.json"
+    stat = os.stat(metadata_sequences_path)
+    if Path(index_path).exists():
+        with open(index_path) as f:
+            index = json.load(f)
+        if index['csv_size'] == stat.st_size and index['csv_mtime_ns'] == stat.st_mtime_ns:
+            return index
+
+    # Only needed when the CSV changed, a cached index can be loaded without pandas
+    import numpy as np
+    import pandas as pd
+
+    metadata_sequences = pd.read_csv(metadata_sequences_path)
+    sequence_names = [seq_name for seq_name in metadata_sequences.columns if seq_name not in ['ID', 'wears_glasses']]
+    # Sequences marked with 'x' or 'm' are available
+    is_available = metadata_sequences[sequence_names].isin(['x', 'm']).to_numpy()
+    sequence_names_array = np.array(sequence_names)
+    participant_ids = metadata_sequences['ID'].astype(int).tolist()
+    sequences_per_participant = {p_id: sequence_names_array[is_available_row].tolist()
+                                 for p_id, is_available_row in zip(participant_ids, is_available)}
+
+    index = {
+        'csv_size': stat.st_size,
+        'csv_mtime_ns': stat.st_mtime_ns,
+        'participant_ids': participant_ids,
+        'sequence_names': sequence_names,
+        'sequences_per_participant': sequences_per_participant,
+    }
+    write_atomic(index_path, json.dumps(index))
+
+    return index
+
@@ -1,13 +1,13 @@
 import hashlib
 from pathlib import Path
 
-from elias.util import ensure_directory_exists_for_file
-
 from nersemble_data.constants import NERSEMBLE_ACCESS_FORM_URL
 from nersemble_data.env import NERSEMBLE_DATA_URL, env, env_file_path
 
 
 def _prompt_nersemble_data_url():
+    from elias.util import ensure_directory_exists_for_file
+
     print("To download the NeRSemble dataset, please do the following:")
     print(f" 1. Request access to the NeRSemble dataset via {NERSEMBLE_ACCESS_FORM_URL}")
     print(f" 2. Once your request was approved, you will receive a mail with the download url for the dataset. Enter it here")
@@ -0,0 +1,371 @@
+from dataclasses import dataclass, field, asdict
+from fnmatch import fnmatchcase
+from typing import List, Dict, Optional, Iterator, Tuple, Union, Literal, TYPE_CHECKING
+
+from nersemble_data.constants import ASSETS, SERIALS, AVERAGE_GB_PER_VIDEO
+
+if TYPE_CHECKING:
+    from nersemble_data.util.manifest import DownloadManifest
+    from nersemble_data.util.metadata import NeRSembleMetadata
+
+AssetType = Literal["calibration", "color_calibration", "images", "backgrounds", "metadata_participants", "metadata_sequences"]
+
+# AVERAGE_GB_PER_VIDEO is in decimal GB (1490 GB for the whole dataset)
+AVERAGE_BYTES_PER_VIDEO = int(AVERAGE_GB_PER_VIDEO * 1e9)
+EXCLUDE_PREFIX = '^'
+
+
+# ==========================================================
+# Selectors
+# ==========================================================
+
+def select_participants(selector: str, available_participant_ids: List[int]) -> List[int]:
+    """
+    Resolves a participant selector against the available participants.
+
+    Parameters
+    ----------
+    selector:
+        Comma-separated list of items. Each item is one of:
+            - all: All available participants
+            - single ID: E.g., "33". Has to be available
+            - inclusive range: E.g., "50-100". Selects all available participants in that range
+            - exclusion: An ID or range prefixed with ^, e.g., "^60-70". If a selector only consists of exclusions,
+              they are applied to all available participants
+        E.g., "1-100,205,^30-39"
+    available_participant_ids:
+        The participants to select from
+
+    Returns
+    -------
+        The selected participant IDs in the order of available_participant_ids
+    """
+
+    included_items, excluded_items = _split_selector(selector)
+
+    if not included_items or 'all' in included_items:
+        selected_participant_ids = set(available_participant_ids)
+    else:
+        selected_participant_ids = set()
+        unavailable_participant_ids = []
+        for item in included_items:
+            participant_ids = _match_participants(item, available_participant_ids)
+            if '-' not in item and not participant_ids:
+                unavailable_participant_ids.append(int(item))
+            selected_participant_ids.update(participant_ids)
+        assert len(unavailable_participant_ids) == 0, f"Specified participant_ids do not exist: {unavailable_participant_ids}"
+
+    for item in excluded_items:
+        selected_participant_ids.difference_update(_match_participants(item, available_participant_ids))
+
+    return [p_id for p_id in available_participant_ids if p_id in selected_participant_ids]
+
+
+def select_names(selector: str, available_names: List[str], kind: str = 'names') -> List[str]:
+    """
+    Resolves a selector for sequence names or camera serials against the available ones.
+
+    Parameters
+    ----------
+    selector:
+        Comma-separated list of items. Each item is one of:
+            - all: All available names
+            - exact name: E.g., "EXP-1-head". Has to be available
+            - glob pattern: E.g., "EXP-*" or "SEN-0[1-5]*". Has to match at least one available name
+            - exclusion: A name or pattern prefixed with ^, e.g., "^EXP-9-*". If a selector only consists of
+              exclusions, they are applied to all available names
+        E.g., "EXP-*,EMO-*,^EXP-1-head"
+    available_names:
+        The names to select from
+    kind:
+        What is selected, only used for error messages
+
+    Returns
+    -------
+        The selected names in the order of available_names
+    """
+
+    included_items, excluded_items = _split_selector(selector)
+
+    if not included_items or 'all' in included_items:
+        selected_names = set(available_names)
+    else:
+        selected_names = set()
+        unavailable_items = []
+        for item in included_items:
+            names = _match_names(item, available_names)
+            if not names:
+                unavailable_items.append(item)
+            selected_names.update(names)
+        assert len(unavailable_items) == 0, f"Specified {kind} do not exist: {unavailable_items}"
+
+    for item in excluded_items:
+        selected_names.difference_update(_match_names(item, available_names))
+
+    return [name for name in available_names if name in selected_names]
+
+
+def _split_selector(selector: str) -> Tuple[List[str], List[str]]:
+    items = [item.strip() for item in str(selector).split(',') if item.strip()]
+    included_items = [item for item in items if not item.startswith(EXCLUDE_PREFIX)]
+    excluded_items = [item[len(EXCLUDE_PREFIX):] for item in items if item.startswith(EXCLUDE_PREFIX)]
+    return included_items, excluded_items
+
+
+def _match_participants(item: str, available_participant_ids: List[int]) -> List[int]:
+    if '-' in item:
+        parts = item.split('-')
+        assert len(parts) == 2, f"Invalid participant specifier, expected a range such as 50-100 but got {item}"
+        id_from = int(parts[0])
+        id_to = int(parts[1])
+        return [p_id for p_id in available_participant_ids if id_from <= p_id <= id_to]
+    else:
+        p_id = int(item)
+        return [p_id] if p_id in available_participant_ids else []
+
+
+def _match_names(item: str, available_names: List[str]) -> List[str]:
+    if any(c in item for c in '*?['):
+        return [name for name in available_names if fnmatchcase(name, item)]
+    else:
+        return [item] if item in available_names else []
+
+
+# ==========================================================
+# Download jobs
+# ==========================================================
+
+@dataclass
+class DownloadJob:
+    relative_path: str
+    asset: str
+    participant_id: Optional[int] = None  # None for global assets
+    sequence_name: Optional[str] = None
+    serial: Optional[str] = None
+
+
+class DownloadSelection:
+    """
+    A selection of participants, sequences, cameras and assets of the NeRSemble dataset.
+    Download jobs are only materialized while iterating over iter_jobs(), such that even selections of the whole
+    dataset do not have to be held in memory.
+    """
+
+    def __init__(self,
+                 sequences_per_participant: Dict[int, List[str]],
+                 serials: List[str],
+                 assets: List[str]):
+        """
+        Parameters
+        ----------
+        sequences_per_participant:
+            For each selected participant, the selected sequences that are available for that participant
+        serials:
+            The selected cameras
+        assets:
+            The selected assets
+        """
+
+        self.sequences_per_participant = sequences_per_participant
+        self.serials = serials
+        self.assets = assets
+
+    @staticmethod
+    def from_selectors(nersemble_metadata: 'NeRSembleMetadata',
+                       participant: str = 'all',
+                       sequence: str = 'all',
+                       camera: str = 'all',
+                       assets: Union[Literal['all'], Tuple[AssetType, ...]] = 'all') -> 'DownloadSelection':
+        """
+        Creates a selection from selector strings, see select_participants() and select_names() for their syntax.
+        """
+
+        participant_ids = select_participants(participant, nersemble_metadata.list_participants())
+        sequences = select_names(sequence, nersemble_metadata.list_sequences(), kind='sequences')
+        serials = select_names(camera, SERIALS, kind='cameras')
+        if assets == 'all':
+            assets = [asset_name for asset_set in ASSETS.values() for asset_name in asset_set.keys()]
+
+        sequences_per_participant = dict()
+        for p_id in participant_ids:
+            available_sequences = nersemble_metadata.list_sequences_for_participant(p_id)
+            sequences_per_participant[p_id] = [seq_name for seq_name in sequences if seq_name in available_sequences]
+
+        return DownloadSelection(sequences_per_participant, serials, list(assets))
+
+    @property
+    def participant_ids(self) -> List[int]:
+        return list(self.sequences_per_participant.keys())
+
+    @property
+    def sequences(self) -> List[str]:
+        # Union of the selected sequences of all participants
+        return list(dict.fromkeys(seq_name for sequences in self.sequences_per_participant.values() for seq_name in sequences))
+
+    def iter_jobs(self) -> Iterator[DownloadJob]:
+        per_person_assets = [asset for asset in self.assets if asset in ASSETS['per_person']]
+        per_cam_assets = [asset for asset in self.assets if asset in ASSETS['per_cam']]
+        per_person_cam_assets = [asset for asset in self.assets if asset in ASSETS['per_person_cam']]
+        global_assets = [asset for asset in self.assets if asset in ASSETS['global']]
+
+        for p_id, sequences in self.sequences_per_participant.items():
+            # Assets per-person
+            for asset in per_person_assets:
+                yield DownloadJob(ASSETS['per_person'][asset].format(p_id=p_id), asset, participant_id=p_id)
+
+            # Assets per-camera
+            for seq_name in sequences:
+                for serial in self.serials:
+                    for asset in per_cam_assets:
+                        relative_path = ASSETS['per_cam'][asset].format(p_id=p_id, seq_name=seq_name, serial=serial)
+                        yield DownloadJob(relative_path, asset, participant_id=p_id, sequence_name=seq_name, serial=serial)
+
+            # Assets per-person camera (backgrounds basically)
+            for serial in self.serials:
+                for asset in per_person_cam_assets:
+                    relative_path = ASSETS['per_person_cam'][asset].format(p_id=p_id, serial=serial)
+                    yield DownloadJob(relative_path, asset, participant_id=p_id, serial=serial)
+
+        # Global assets
+        for asset in global_assets:
+            yield DownloadJob(ASSETS['global'][asset], asset)
+
+    def __len__(self) -> int:
+        # Counted without enumerating all jobs
+        n_per_person = sum(asset in ASSETS['per_person'] for asset in self.assets)
+        n_per_cam = sum(asset in ASSETS['per_cam'] for asset in self.assets)
+        n_per_person_cam = sum(asset in ASSETS['per_person_cam'] for asset in self.assets)
+        n_global = sum(asset in ASSETS['global'] for asset in self.assets)
+
+        n_sequences = sum(len(sequences) for sequences in self.sequences_per_participant.values())
+        n_participants = len(self.sequences_per_participant)
+        return n_participants * (n_per_person + len(self.serials) * n_per_person_cam) \
+            + n_sequences * len(self.serials) * n_per_cam \
+            + n_global
+
+
+# ==========================================================
+# Download plan
+# ==========================================================
+
+@dataclass
+class SizeSummary:
+    n_files: int = 0
+    n_bytes: int = 0  # Exact sizes where known, estimates otherwise
+    n_files_estimated: int = 0  # Files whose size is only an estimate
+    n_files_unknown: int = 0  # Files whose size could not be determined, not included in n_bytes
+    n_files_local: int = 0  # Files that are already up-to-date in the local folder
+    n_bytes_local: int = 0
+
+    def add(self, size: Optional[int], is_estimate: bool, is_local: bool):
+        self.n_files += 1
+        if size is None:
+            self.n_files_unknown += 1
+        else:
+            self.n_bytes += size
+            self.n_files_estimated += is_estimate
+        if is_local:
+            self.n_files_local += 1
+            self.n_bytes_local += size
+
+    @property
+    def n_bytes_remaining(self) -> int:
+        return self.n_bytes - self.n_bytes_local
+
+
+@dataclass
+class DownloadPlan:
+    total: SizeSummary = field(default_factory=SizeSummary)
+    per_participant: Dict[str, SizeSummary] = field(default_factory=dict)
+    per_asset: Dict[str, SizeSummary] = field(default_factory=dict)
+
+    def add(self, job: DownloadJob, size: Optional[int], is_estimate: bool, is_local: bool):
+        participant_key = 'global' if job.participant_id is None else f"{job.participant_id:03d}"
+        self.total.add(size, is_estimate, is_local)
+        self.per_participant.setdefault(participant_key, SizeSummary()).add(size, is_estimate, is_local)
+        self.per_asset.setdefault(job.asset, SizeSummary()).add(size, is_estimate, is_local)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def print_summary(self, per_participant: bool = False):
+        print(f"{'':<22} {'files':>9} {'total':>11} {'local':>11} {'remaining':>11} {'estimated':>10} {'unknown':>8}")
+        for asset, size_summary in self.per_asset.items():
+            _print_size_summary(asset, size_summary)
+        if per_participant:
+            print()
+            for participant_key, size_summary in self.per_participant.items():
+                _print_size_summary(participant_key, size_summary)
+        print()
+        _print_size_summary('TOTAL', self.total)
+        if self.total.n_files_estimated > 0:
+            print(f"[Warning] The sizes of {self.total.n_files_estimated} videos are only estimates. "
+                  f"Use --exact_sizes to query them from the server")
+
+
+def plan_download(selection: DownloadSelection,
+                  manifest: Optional['DownloadManifest'] = None,
+                  base_url: Optional[str] = None,
+                  n_workers: int = 32) -> DownloadPlan:
+    """
+    Computes how much data a selection amounts to, with breakdowns per participant and per asset.
+    Sizes are taken from the download manifest for files that were downloaded before. The remaining sizes are queried
+    from the server via HEAD requests if base_url is given, and estimated otherwise.
+
+    Parameters
+    ----------
+    selection:
+        The selection to plan
+    manifest:
+        Download manifest of the local NeRSemble folder
+    base_url:
+        If given, sizes of files that are not in the manifest are queried from `{base_url}/{relative_path}`
+    n_workers:
+        How many HEAD requests are sent in parallel
+    """
+
+    def get_size(job: DownloadJob) -> Tuple[DownloadJob, Optional[int], bool, bool]:
+        if manifest is not None:
+            manifest_entry = manifest.get(job.relative_path)
+            if manifest_entry is not None:
+                return job, manifest_entry.size, False, manifest.is_up_to_date(job.relative_path)
+
+        if base_url is not None:
+            from nersemble_data.util.download import get_remote_size
+            size = get_remote_size(f"{base_url}/{job.relative_path}", n_retries=2)
+            if size is not None:
+                return job, size, False, False
+
+        if job.asset == 'images':
+            return job, AVERAGE_BYTES_PER_VIDEO, True, False
+        return job, None, False, False
+
+    download_plan = DownloadPlan()
+    if base_url is None:
+        for job in selection.iter_jobs():
+            download_plan.add(*get_size(job))
+    else:
+        from multiprocessing.pool import ThreadPool
+        from tqdm import tqdm
+
+        with ThreadPool(processes=n_workers) as pool:
+            for job, size, is_estimate, is_local in tqdm(pool.imap(get_size, selection.iter_jobs(), chunksize=16),
+                                                         total=len(selection), desc="Querying file sizes"):
+                download_plan.add(job, size, is_estimate, is_local)
+
+    return download_plan
+
+
+def _print_size_summary(name: str, size_summary: SizeSummary):
+    print(f"{name:<22} {size_summary.n_files:>9} {_format_bytes(size_summary.n_bytes):>11} "
+          f"{_format_bytes(size_summary.n_bytes_local):>11} {_format_bytes(size_summary.n_bytes_remaining):>11} "
+          f"{size_summary.n_files_estimated:>10} {size_summary.n_files_unknown:>8}")
+
+
+def _format_bytes(n_bytes: int) -> str:
+    # Decimal units, like the dataset size that the estimates are based on
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n_bytes < 1000:
+            return f"{n_bytes:.1f} {unit}" if unit != 'B' else f"{n_bytes} B"
+        n_bytes /= 1000
+    return f"{n_bytes:.1f} TB"
@@ -0,0 +1,245 @@
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import List, Dict, Optional, Iterable
+
+import requests
+
+from nersemble_data.util.download import DownloadResult, download_file, get_session, remove_partial_download
+from nersemble_data.util.instrumentation import count
+
+# Status codes with which a mirror tells that it does not have a file (yet). The file is then requested from the next
+# source without counting this as a failure of the mirror
+_NOT_AVAILABLE_STATUS_CODES = (403, 404, 410)
+
+
+class DownloadSource:
+    """
+    A place that files of the NeRSemble dataset can be fetched from, addressed by their path relative to the dataset root.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def fetch(self, relative_path: str, target_path: str, **download_kwargs) -> Optional[DownloadResult]:
+        """
+        Fetches the file to target_path.
+
+        Returns
+        -------
+            Information about the fetched file, or None if the source does not have the file. Raises if the source
+            itself failed, e.g., because it is not reachable
+        """
+
+        raise NotImplementedError()
+
+    def check_health(self) -> bool:
+        raise NotImplementedError()
+
+
+class LocalMirrorSource(DownloadSource):
+    """
+    Folder with (parts of) the dataset in the same layout as the server, e.g., a copy on a shared file system.
+    """
+
+    def __init__(self, folder: str):
+        super().__init__(folder)
+        self._folder = folder
+
+    def fetch(self, relative_path: str, target_path: str, **download_kwargs) -> Optional[DownloadResult]:
+        source_path = f"{self._folder}/{relative_path}"
+        if not os.path.isfile(source_path):
+            return None
+
+        size = os.path.getsize(source_path)
+        url = Path(source_path).resolve().as_uri()
+        if Path(target_path).exists() and os.path.getsize(target_path) == size:
+            count("download.n_skipped")
+            return DownloadResult(url, target_path, size, skipped=True)
+
+        Path(target_path).parent.mkdir(parents=True, exist_ok=True)
+        part_path = f"{target_path}.part"
+        shutil.copyfile(source_path, part_path)
+        os.replace(part_path, target_path)
+        # Sidecar files of an interrupted download from another source
+        remove_partial_download(target_path)
+
+        return DownloadResult(url, target_path, size, n_bytes_downloaded=size)
+
+    def check_health(self) -> bool:
+        return Path(self._folder).is_dir()
+
+
+class HTTPSource(DownloadSource):
+    """
+    HTTP server with (parts of) the dataset in the same layout as the origin, e.g., a site-wide cache or a peer node
+    that runs `nersemble-data serve`.
+    """
+
+    def __init__(self, base_url: str, name: Optional[str] = None, n_retries: int = 5, health_check_timeout: float = 5):
+        super().__init__(base_url if name is None else name)
+        self._base_url = base_url.rstrip('/')
+        self._n_retries = n_retries
+        self._health_check_timeout = health_check_timeout
+
+    def fetch(self, relative_path: str, target_path: str, **download_kwargs) -> Optional[DownloadResult]:
+        try:
+            return download_file(f"{self._base_url}/{relative_path}", target_path,
+                                 n_retries=self._n_retries, raise_errors=True, **download_kwargs)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code in _NOT_AVAILABLE_STATUS_CODES:
+                return None
+            raise
+
+    def check_health(self) -> bool:
+        try:
+            response = get_session().head(f"{self._base_url}/", timeout=self._health_check_timeout)
+        except requests.RequestException:
+            return False
+
+        # Listing the root is not necessarily allowed, the server just has to answer
+        return response.status_code < 500
+
+
+@dataclass
+class _SourceState:
+    source: DownloadSource
+    n_consecutive_failures: int = 0
+    unhealthy_until: Optional[float] = None  # time.monotonic() until which the source is skipped
+    n_files: int = 0
+    n_bytes: int = 0
+    n_not_available: int = 0
+    n_failures: int = 0
+
+
+class DownloadSources:
+    """
+    Ordered list of sources that every file is requested from in turn, e.g., a local mirror, then a site-wide HTTP
+    cache, then the origin server. A file is taken from the first source that has it.
+    Sources that fail max_failures times in a row (connection errors, server errors, timeouts) are skipped for
+    retry_after seconds and only used again once a health check succeeds. The last source (the origin) is never skipped.
+    """
+
+    def __init__(self, sources: List[DownloadSource], max_failures: int = 3, retry_after: float = 60):
+        assert len(sources) > 0, "At least one download source is needed"
+
+        self._states = [_SourceState(source) for source in sources]
+        self._max_failures = max_failures
+        self._retry_after = retry_after
+        self._lock = Lock()
+
+    @staticmethod
+    def from_specs(mirrors: Iterable[str], origin_url: str, mirror_n_retries: int = 1) -> 'DownloadSources':
+        """
+        Parameters
+        ----------
+        mirrors:
+            Ordered mirrors that are tried before the origin. http(s):// URLs are HTTP sources, everything else
+            (optionally prefixed with file://) is a local folder
+        origin_url:
+            The dataset's origin server
+        mirror_n_retries:
+            How often a failed request to a mirror is retried before moving on to the next source
+        """
+
+        sources = []
+        for mirror in mirrors:
+            if mirror.startswith('http://') or mirror.startswith('https://'):
+                sources.append(HTTPSource(mirror, n_retries=mirror_n_retries))
+            else:
+                sources.append(LocalMirrorSource(mirror[len('file://'):] if mirror.startswith('file://') else mirror))
+        sources.append(HTTPSource(origin_url, name='origin'))
+
+        return DownloadSources(sources)
+
+    def check_health(self):
+        """
+        Checks all mirrors once upfront, such that unreachable ones are skipped right from the start.
+        """
+
+        for state in self._states[:-1]:
+            if not state.source.check_health():
+                print(f"[Warning] Download source {state.source.name} is not reachable and will be skipped for now")
+                state.unhealthy_until = time.monotonic() + self._retry_after
+
+    def download(self, relative_path: str, target_path: str, **download_kwargs) -> Optional[DownloadResult]:
+        """
+        Fetches the file from the first available source, see download_file() for the options.
+
+        Returns
+        -------
+            Information about the downloaded file, or None if no source could provide it
+        """
+
+        for i_source, state in enumerate(self._states):
+            is_last = i_source == len(self._states) - 1
+            if not is_last and not self._is_usable(state):
+                continue
+
+            try:
+                result = state.source.fetch(relative_path, target_path, **download_kwargs)
+            except (requests.RequestException, OSError) as e:
+                print(f"[Warning] Could not download {relative_path} from {state.source.name}: {e}")
+                self._record_failure(state)
+                continue
+
+            with self._lock:
+                if result is None:
+                    state.n_not_available += 1
+                    continue
+
+                state.n_consecutive_failures = 0
+                state.n_files += 1
+                state.n_bytes += result.n_bytes_downloaded
+            if not is_last:
+                count("download.n_from_mirror")
+            return result
+
+        print(f"Could not download {relative_path} from any source")
+        count("download.n_failed")
+        return None
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {state.source.name: {
+                "n_files": state.n_files,
+                "n_bytes": state.n_bytes,
+                "n_not_available": state.n_not_available,
+                "n_failures": state.n_failures,
+            } for state in self._states}
+
+    def print_summary(self):
+        for name, stats in self.get_stats().items():
+            print(f" - {name}: {stats['n_files']} files ({stats['n_bytes'] / (1 << 30):.2f} GB), "
+                  f"{stats['n_not_available']} not available, {stats['n_failures']} failures")
+
+    def _is_usable(self, state: _SourceState) -> bool:
+        with self._lock:
+            if state.unhealthy_until is None:
+                return True
+            if time.monotonic() < state.unhealthy_until:
+                return False
+            # Only one thread re-checks the source, the others keep skipping it in the meantime
+            state.unhealthy_until = time.monotonic() + self._retry_after
+
+        if state.source.check_health():
+            with self._lock:
+                # One more failure puts the source back on hold
+                state.unhealthy_until = None
+                state.n_consecutive_failures = self._max_failures - 1
+            print(f"Download source {state.source.name} is reachable again")
+            return True
+
+        return False
+
+    def _record_failure(self, state: _SourceState):
+        with self._lock:
+            state.n_failures += 1
+            state.n_consecutive_failures += 1
+            if state.n_consecutive_failures >= self._max_failures and state.unhealthy_until is None:
+                state.unhealthy_until = time.monotonic() + self._retry_after
+                print(f"[Warning] Download source {state.source.name} failed {state.n_consecutive_failures} times in a "
+                      f"row and is skipped for the next {self._retry_after:.0f}s")
@@ -1,19 +1,550 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from threading import Lock
+from typing import Tuple, Hashable, Dict, Iterator, Optional, Type, Any, TYPE_CHECKING
+
 import cv2
 import numpy as np
 
+from nersemble_data.util.image import CropBox, Interpolation, crop_image, downscale_image
+from nersemble_data.util.instrumentation import timer, count
+
+if TYPE_CHECKING:
+    import av
+
+
+@dataclass
+class VideoInfo:
+    n_frames: int
+    width: int
+    height: int
+    fps: Optional[float]
+
+
+def probe_video(video_path: str) -> VideoInfo:
+    """
+    Reads frame count, resolution and frame rate of a video without decoding it.
+    With PyAV, the frame count is taken from the container's frame table (or by counting packets if the container
+    does not have one), which is exact. OpenCV's CAP_PROP_FRAME_COUNT is only used as fallback since it may be
+    extrapolated from duration and frame rate for some containers.
+    """
+
+    try:
+        import av
+    except ImportError:
+        av = None
+
+    if av is not None:
+        with av.open(video_path) as container:
+            stream = container.streams.video[0]
+            n_frames = stream.frames
+            if n_frames == 0:
+                n_frames = sum(1 for packet in container.demux(stream) if packet.size > 0)
+            fps = float(stream.average_rate) if stream.average_rate is not None else None
+            return VideoInfo(n_frames, stream.codec_context.width, stream.codec_context.height, fps)
+
+    video_capture = cv2.VideoCapture(video_path)
+    try:
+        fps = video_capture.get(cv2.CAP_PROP_FPS)
+        return VideoInfo(int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT)),
+                         int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                         int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                         fps if fps > 0 else None)
+    finally:
+        video_capture.release()
+
 
 class VideoFrameLoader:
+    """
+    Base class of the video decoding backends. Backends are registered with register_video_backend() and created via
+    open_video(video_path, backend=...).
+    For backwards compatibility, VideoFrameLoader(video_path) creates a loader of the default OpenCV backend.
+
+    Backends implement _decode_frame() which positions the decoder and decodes a single frame, and _convert_frame()
+    which turns the decoded frame into the requested RGB uint8 image. Decoding happens under a lock since the same
+    loader may be shared by several decoding threads, the conversion does not.
+    """
+
+    def __new__(cls, *args, **kwargs):
+        if cls is VideoFrameLoader:
+            cls = OpenCVVideoFrameLoader
+        return super().__new__(cls)
+
+    def __init__(self, video_path: str, max_skip_frames: int = 32):
+        """
+        Parameters
+        ----------
+        video_path:
+            Path to the video file
+        max_skip_frames:
+            Requesting a frame up to this many frames ahead of the current decoder position is served by decoding
+            forward instead of seeking. Seeking always restarts decoding at the previous keyframe, so for small forward
+            jumps (and especially for sequential access) decoding forward is much cheaper.
+        """
 
-    def __init__(self, video_path: str):
-        self._video_capture = cv2.VideoCapture(video_path)
+        self._video_path = video_path
+        self._max_skip_frames = max_skip_frames
+        self._next_frame_id: Optional[int] = 0  # Frame that the next decoded frame will be, None if unknown
+        self._lock = Lock()
+
+    def get_n_frames(self) -> int:
+        raise NotImplementedError()
+
+    def load_frame(self,
+                   frame_id: int,
+                   crop_box: Optional[CropBox] = None,
+                   downscale_factor: Optional[float] = None,
+                   out: Optional[np.ndarray] = None,
+                   interpolation: Interpolation = 'bilinear') -> np.ndarray:
+        """
+        Decodes a single frame as RGB uint8 image.
+        Cropping and downscaling happen on the decoded frame before the color conversion, such that only the requested
+        pixels are converted and copied.
+
+        Parameters
+        ----------
+        frame_id:
+            Which frame to decode
+        crop_box:
+            If given, only the (left, top, right, bottom) region of the full-resolution frame is returned
+        downscale_factor:
+            If given, the (cropped) frame is downscaled by this factor
+        out:
+            Optional preallocated uint8 array of the final shape that the frame is written into
+        interpolation:
+            How the frame is downscaled, see downscale_image()
+        """
+
+        with self._lock:
+            try:
+                frame = self._decode_frame(frame_id)
+            except Exception:
+                # Decoder position is unclear after a failed read, force a seek for the next request
+                self._next_frame_id = None
+                raise
+
+        return self._convert_frame(frame, crop_box, downscale_factor, out, interpolation)
+
+    def iter_frames(self,
+                    start: int = 0,
+                    stop: Optional[int] = None,
+                    step: int = 1,
+                    crop_box: Optional[CropBox] = None,
+                    downscale_factor: Optional[float] = None,
+                    interpolation: Interpolation = 'bilinear') -> Iterator[np.ndarray]:
+        """
+        Streams frames start, start + step, ... (excluding stop) in a single forward pass through the video.
+        See load_frame() for crop_box, downscale_factor and interpolation.
+        """
+
+        if stop is None:
+            stop = self.get_n_frames()
+
+        for frame_id in range(start, stop, step):
+            yield self.load_frame(frame_id, crop_box=crop_box, downscale_factor=downscale_factor, interpolation=interpolation)
+
+    def _decode_frame(self, frame_id: int) -> Any:
+        """
+        Decodes frame_id and updates _next_frame_id. Called with the lock held.
+        """
+
+        raise NotImplementedError()
+
+    def _convert_frame(self,
+                       frame: Any,
+                       crop_box: Optional[CropBox],
+                       downscale_factor: Optional[float],
+                       out: Optional[np.ndarray],
+                       interpolation: Interpolation) -> np.ndarray:
+        raise NotImplementedError()
+
+    def _should_seek(self, frame_id: int) -> bool:
+        return self._next_frame_id is None or not 0 <= frame_id - self._next_frame_id <= self._max_skip_frames
+
+    def _close(self):
+        pass
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def __enter__(self) -> 'VideoFrameLoader':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+VIDEO_BACKENDS: Dict[str, Type[VideoFrameLoader]] = dict()
+
+
+def register_video_backend(name: str):
+    """
+    Class decorator that makes a VideoFrameLoader subclass available as open_video(..., backend=name).
+    """
+
+    def register(video_frame_loader_cls: Type[VideoFrameLoader]) -> Type[VideoFrameLoader]:
+        VIDEO_BACKENDS[name] = video_frame_loader_cls
+        return video_frame_loader_cls
+
+    return register
+
+
+def open_video(video_path: str, backend: str = 'opencv', **kwargs) -> VideoFrameLoader:
+    """
+    Parameters
+    ----------
+    video_path:
+        Path to the video file
+    backend:
+        Name of a registered video backend:
+            - opencv: cv2.VideoCapture, single-threaded decoding
+            - pyav: FFmpeg via PyAV with threaded decoding, exact frame indexing by timestamps and direct RGB output.
+              Requires av (pip install nersemble_data[pyav])
+    kwargs:
+        Passed on to the backend's constructor
+    """
+
+    assert backend in VIDEO_BACKENDS, f"Unknown video backend {backend}. Available backends: {list(VIDEO_BACKENDS.keys())}"
+    return VIDEO_BACKENDS[backend](video_path, **kwargs)
+
+
+def _finish_image(image: np.ndarray,
+                  crop_box: Optional[CropBox],
+                  downscale_factor: Optional[float],
+                  out: Optional[np.ndarray],
+                  swap_channels: bool,
+                  interpolation: Interpolation) -> np.ndarray:
+    if crop_box is not None:
+        image = crop_image(image, crop_box)
+
+    if downscale_factor is not None:
+        with timer("video.resize"):
+            image = downscale_image(image, downscale_factor, interpolation)
+
+    if out is not None:
+        assert out.shape == image.shape and out.dtype == np.uint8, \
+            f"out has to be a uint8 array of shape {image.shape}, got {out.dtype} {out.shape}"
+
+    if not swap_channels:
+        if out is not None:
+            out[:] = image
+            image = out
+        return image
+
+    with timer("video.cvt_color"):
+        if out is not None and out.flags.c_contiguous:
+            # The color conversion writes straight into the caller's buffer
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=out)
+        else:
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            if out is not None:
+                out[:] = image
+                image = out
+
+    return image
+
+
+@register_video_backend('opencv')
+class OpenCVVideoFrameLoader(VideoFrameLoader):
+    """
+    Decodes videos with cv2.VideoCapture. OpenCV decodes to BGR, hence every frame needs an additional channel swap.
+    """
+
+    def __init__(self, video_path: str, max_skip_frames: int = 32):
+        super().__init__(video_path, max_skip_frames=max_skip_frames)
+        with timer("video.open"):
+            self._video_capture = cv2.VideoCapture(video_path)
 
     def get_n_frames(self) -> int:
         n_frames = int(self._video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
         return n_frames
 
-    def load_frame(self, frame_id: int) -> np.ndarray:
-        # set frame position
-        self._video_capture.set(cv2.CAP_PROP_POS_FRAMES, frame_id)
-        success, image = self._video_capture.read()
-        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    def _decode_frame(self, frame_id: int) -> np.ndarray:
+        self._move_to(frame_id)
+        with timer("video.decode"):
+            success, image = self._video_capture.read()
+        if not success:
+            raise ValueError(f"Could not read frame {frame_id} from {self._video_path}")
+
+        self._next_frame_id = frame_id + 1
         return image
+
+    def _convert_frame(self,
+                       frame: np.ndarray,
+                       crop_box: Optional[CropBox],
+                       downscale_factor: Optional[float],
+                       out: Optional[np.ndarray],
+                       interpolation: Interpolation) -> np.ndarray:
+        return _finish_image(frame, crop_box, downscale_factor, out, swap_channels=True, interpolation=interpolation)
+
+    def _move_to(self, frame_id: int):
+        if self._next_frame_id == frame_id:
+            return
+
+        if not self._should_seek(frame_id):
+            n_skip_frames = frame_id - self._next_frame_id
+            count("video.n_skipped_frames", n_skip_frames)
+            # Decode forward without converting the skipped frames
+            with timer("video.skip"):
+                for _ in range(n_skip_frames):
+                    if not self._video_capture.grab():
+                        break
+                    self._next_frame_id += 1
+
+            if self._next_frame_id == frame_id:
+                return
+
+        # set frame position
+        count("video.n_seeks")
+        with timer("video.seek"):
+            self._video_capture.set(cv2.CAP_PROP_POS_FRAMES, frame_id)
+        self._next_frame_id = frame_id
+
+    def _close(self):
+        self._video_capture.release()
+
+
+@register_video_backend('pyav')
+class PyAVVideoFrameLoader(VideoFrameLoader):
+    """
+    Decodes videos with FFmpeg via PyAV.
+     - Decoding runs on multiple threads inside FFmpeg
+     - Frames are identified by their presentation timestamp instead of by counting, i.e., the returned frame is exactly
+       the requested one even if the container's frame count or seek positions are imprecise
+     - Seeking jumps to the keyframe before the requested frame and decodes forward to the exact timestamp
+     - FFmpeg converts directly to RGB (and scales at the same time if no crop is requested), no channel swap is needed
+    """
+
+    def __init__(self, video_path: str, max_skip_frames: int = 32, n_threads: int = 0):
+        """
+        Parameters
+        ----------
+        n_threads:
+            Number of FFmpeg decoding threads. 0 lets FFmpeg decide based on the number of CPU cores
+        """
+
+        try:
+            import av
+        except ImportError:
+            raise ImportError("The pyav video backend requires av. Install it via pip install nersemble_data[pyav]")
+
+        super().__init__(video_path, max_skip_frames=max_skip_frames)
+        with timer("video.open"):
+            self._container = av.open(video_path)
+        self._stream = self._container.streams.video[0]
+        self._stream.thread_type = 'AUTO'
+        self._stream.codec_context.thread_count = n_threads
+        self._frames = self._container.decode(self._stream)
+
+        # Number of timestamp units per frame. None for containers without frame rate, frames are counted then
+        if self._stream.average_rate is not None and self._stream.time_base is not None:
+            self._pts_per_frame = 1 / (self._stream.average_rate * self._stream.time_base)
+        else:
+            self._pts_per_frame = None
+        self._start_pts = self._stream.start_time if self._stream.start_time is not None else 0
+
+    def get_n_frames(self) -> int:
+        n_frames = self._stream.frames
+        if n_frames == 0:
+            # Container does not store the number of frames
+            n_frames = probe_video(self._video_path).n_frames
+        return n_frames
+
+    def _decode_frame(self, frame_id: int) -> 'av.VideoFrame':
+        if self._should_seek(frame_id):
+            self._seek(frame_id)
+
+        n_skipped_frames = 0
+        with timer("video.decode"):
+            for frame in self._frames:
+                current_frame_id = self._get_frame_id(frame)
+                if current_frame_id is None:
+                    # Frame without timestamp right after a seek, i.e., its position is unknown. Timestamps cannot be
+                    # relied on for this video then, frames are counted from the start instead
+                    self._pts_per_frame = None
+                    self._seek(frame_id)
+                    return self._decode_frame(frame_id)
+
+                self._next_frame_id = current_frame_id + 1
+                if current_frame_id == frame_id:
+                    count("video.n_skipped_frames", n_skipped_frames)
+                    return frame
+                elif current_frame_id > frame_id:
+                    break
+                n_skipped_frames += 1
+
+        raise ValueError(f"Could not read frame {frame_id} from {self._video_path}")
+
+    def _convert_frame(self,
+                       frame: 'av.VideoFrame',
+                       crop_box: Optional[CropBox],
+                       downscale_factor: Optional[float],
+                       out: Optional[np.ndarray],
+                       interpolation: Interpolation) -> np.ndarray:
+        # Scaling with swscale (frame.reformat(width, height)) would be cheaper, but its area filter gives different
+        # pixels than downscale_image(). Hence, only the color conversion is done by FFmpeg, such that both backends
+        # return the same images
+        with timer("video.reformat"):
+            image = frame.to_ndarray(format='rgb24')
+
+        return _finish_image(image, crop_box, downscale_factor, out, swap_channels=False, interpolation=interpolation)
+
+    def _seek(self, frame_id: int):
+        count("video.n_seeks")
+        with timer("video.seek"):
+            if self._pts_per_frame is None:
+                # Without timestamps, frames can only be counted from the start
+                self._container.seek(0, stream=self._stream)
+                self._next_frame_id = 0
+            else:
+                target_pts = self._start_pts + int(round(frame_id * self._pts_per_frame))
+                # Lands on the last keyframe before the target, the remaining frames are decoded in _decode_frame()
+                self._container.seek(target_pts, stream=self._stream, backward=True, any_frame=False)
+                self._next_frame_id = None
+            self._frames = self._container.decode(self._stream)
+
+    def _get_frame_id(self, frame: 'av.VideoFrame') -> Optional[int]:
+        """
+        Returns
+        -------
+            The frame's index in the video, or None if the frame has no timestamp and the position is unknown because
+            of a preceding seek
+        """
+
+        timestamp = frame.pts if frame.pts is not None else frame.dts
+        if timestamp is None or self._pts_per_frame is None:
+            return self._next_frame_id
+        return int(round((timestamp - self._start_pts) / self._pts_per_frame))
+
+    def _close(self):
+        self._container.close()
+
+
+@dataclass
+class _PooledVideoLoader:
+    video_loader: VideoFrameLoader
+    n_leases: int = 0
+    is_evicted: bool = False  # Closed once the last lease is returned
+
+
+class VideoFrameLoaderPool:
+    """
+    Bounded LRU pool of open video decoders.
+    Reusing a VideoFrameLoader avoids re-opening the container (and re-parsing its header) for every frame.
+    Once more than `max_open_videos` videos are open, the least recently used one is removed from the pool. Loaders
+    are leased, i.e., a removed loader is only closed once no thread uses it anymore. Hence, more than
+    `max_open_videos` videos can be open for a short time if all of them are in use.
+    """
+
+    def __init__(self, max_open_videos: int = 32, backend: str = 'opencv'):
+        assert max_open_videos > 0, f"max_open_videos has to be positive, got {max_open_videos}"
+        assert backend in VIDEO_BACKENDS, f"Unknown video backend {backend}. Available backends: {list(VIDEO_BACKENDS.keys())}"
+        self._max_open_videos = max_open_videos
+        self._backend = backend
+        self._video_loaders: 'OrderedDict[Hashable, _PooledVideoLoader]' = OrderedDict()  # In least-recently-used order
+        self._lock = Lock()
+
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_evictions = 0
+
+    @contextmanager
+    def lease(self, key: Hashable, video_path: str) -> Iterator[VideoFrameLoader]:
+        """
+        Provides the open loader for key, or opens video_path if there is none. The loader stays open at least until
+        the with block is left.
+        """
+
+        pooled_video_loader = self._acquire(key, video_path)
+        try:
+            yield pooled_video_loader.video_loader
+        finally:
+            self._release(pooled_video_loader)
+
+    def evict(self, key: Hashable) -> bool:
+        with self._lock:
+            pooled_video_loader = self._video_loaders.pop(key, None)
+            if pooled_video_loader is None:
+                return False
+            video_loader_to_close = self._mark_evicted(pooled_video_loader)
+
+        if video_loader_to_close is not None:
+            video_loader_to_close.close()
+        return True
+
+    def keys(self) -> Tuple[Hashable, ...]:
+        with self._lock:
+            return tuple(self._video_loaders.keys())
+
+    def close(self):
+        with self._lock:
+            video_loaders_to_close = [self._mark_evicted(pooled_video_loader, count_eviction=False)
+                                      for pooled_video_loader in self._video_loaders.values()]
+            self._video_loaders.clear()
+
+        for video_loader in video_loaders_to_close:
+            if video_loader is not None:
+                video_loader.close()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "n_open": len(self._video_loaders),
+            "n_hits": self.n_hits,
+            "n_misses": self.n_misses,
+            "n_evictions": self.n_evictions,
+        }
+
+    def __len__(self) -> int:
+        return len(self._video_loaders)
+
+    def _acquire(self, key: Hashable, video_path: str) -> _PooledVideoLoader:
+        with self._lock:
+            pooled_video_loader = self._video_loaders.get(key)
+            if pooled_video_loader is not None:
+                self._video_loaders.move_to_end(key)
+                pooled_video_loader.n_leases += 1
+                self.n_hits += 1
+                return pooled_video_loader
+            self.n_misses += 1
+
+        # Opening parses the container header, other threads keep using the pool in the meantime
+        video_loader = open_video(video_path, backend=self._backend)
+
+        video_loaders_to_close = []
+        with self._lock:
+            pooled_video_loader = self._video_loaders.get(key)
+            if pooled_video_loader is None:
+                pooled_video_loader = _PooledVideoLoader(video_loader)
+                self._video_loaders[key] = pooled_video_loader
+            else:
+                # Another thread opened the same video in the meantime
+                self._video_loaders.move_to_end(key)
+                video_loaders_to_close.append(video_loader)
+            pooled_video_loader.n_leases += 1
+
+            while len(self._video_loaders) > self._max_open_videos:
+                _, evicted_video_loader = self._video_loaders.popitem(last=False)
+                video_loaders_to_close.append(self._mark_evicted(evicted_video_loader))
+
+        for video_loader_to_close in video_loaders_to_close:
+            if video_loader_to_close is not None:
+                video_loader_to_close.close()
+
+        return pooled_video_loader
+
+    def _release(self, pooled_video_loader: _PooledVideoLoader):
+        with self._lock:
+            pooled_video_loader.n_leases -= 1
+            is_unused = pooled_video_loader.is_evicted and pooled_video_loader.n_leases == 0
+
+        if is_unused:
+            pooled_video_loader.video_loader.close()
+
+    def _mark_evicted(self, pooled_video_loader: _PooledVideoLoader, count_eviction: bool = True) -> Optional[VideoFrameLoader]:
+        # Called with the lock held. Returns the loader if it can be closed right away
+        pooled_video_loader.is_evicted = True
+        if count_eviction:
+            self.n_evictions += 1
+        return pooled_video_loader.video_loader if pooled_video_loader.n_leases == 0 else None
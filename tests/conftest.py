@@ -0,0 +1,81 @@
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# The local HTTP server with Range support lives next to the benchmarks
+sys.path.insert(0, str(Path(__file__).parent.parent / "benchmarks"))
+
+from range_http_server import RangeHTTPServer
+
+
+@pytest.fixture
+def server_folder(tmp_path: Path) -> Path:
+    folder = tmp_path / "server"
+    folder.mkdir()
+    return folder
+
+
+@pytest.fixture
+def http_server(server_folder: Path) -> RangeHTTPServer:
+    with RangeHTTPServer(str(server_folder)) as server:
+        yield server
+
+
+# ----------------------------------------------------------
+# Local NeRSemble folder
+# ----------------------------------------------------------
+
+PARTICIPANT_ID = 1
+SEQUENCES = ["EXP-1-head", "FREE"]
+TEST_SERIALS = ["222200042", "222200044", "222200046"]
+N_FRAMES = 20
+
+
+def make_frame(serial: str, timestep: int) -> np.ndarray:
+    # Every frame of every camera looks different, such that mixed up frames are detected
+    frame = np.full((48, 64, 3), timestep * 10, dtype=np.uint8)
+    frame[:, :, 1] = int(serial[-2:])
+    frame[:8, :8, 2] = 200
+    return frame
+
+
+@pytest.fixture(scope="session")
+def nersemble_folder(tmp_path_factory) -> Path:
+    """
+    Tiny NeRSemble folder with 64x48 videos of a few cameras, backgrounds and calibration for one participant.
+    """
+
+    cv2 = pytest.importorskip("cv2")
+
+    folder = tmp_path_factory.mktemp("nersemble")
+    participant_folder = folder / f"{PARTICIPANT_ID:03d}"
+    for sequence_name in SEQUENCES:
+        images_folder = participant_folder / "sequences" / sequence_name / "images"
+        images_folder.mkdir(parents=True)
+        for serial in TEST_SERIALS:
+            writer = cv2.VideoWriter(str(images_folder / f"cam_{serial}.mp4"), cv2.VideoWriter_fourcc(*'mp4v'), 30, (64, 48))
+            for timestep in range(N_FRAMES):
+                writer.write(make_frame(serial, timestep))
+            writer.release()
+
+    backgrounds_folder = participant_folder / "sequences" / "BACKGROUND"
+    backgrounds_folder.mkdir(parents=True)
+    for serial in TEST_SERIALS:
+        cv2.imwrite(str(backgrounds_folder / f"image_{serial}.jpg"), np.full((48, 64, 3), 100, dtype=np.uint8))
+
+    calibration_folder = participant_folder / "calibration"
+    calibration_folder.mkdir()
+    rng = np.random.default_rng(0)
+    color_calibration = {serial: (np.concatenate([np.eye(3), np.zeros((3, 1))], axis=1) + rng.normal(0, 0.05, (3, 4))).tolist()
+                         for serial in TEST_SERIALS}
+    (calibration_folder / "color_calibration.json").write_text(json.dumps(color_calibration))
+    camera_params = {
+        "world_2_cam": {serial: np.eye(4).tolist() for serial in TEST_SERIALS},
+        "intrinsics": [[50, 0, 32], [0, 50, 24], [0, 0, 1]],
+    }
+    (calibration_folder / "camera_params.json").write_text(json.dumps(camera_params))
+
+    return folder
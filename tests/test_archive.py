@@ -0,0 +1,78 @@
+import tarfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from conftest import PARTICIPANT_ID, TEST_SERIALS
+from nersemble_data.data.archive import ShardedArchive, export_archive, ARCHIVE_SHARD_NAME
+from nersemble_data.data.nersemble_data import NeRSembleParticipantDataManager, NeRSembleDataManager
+
+
+def _list_files(nersemble_folder: Path):
+    return sorted(path.relative_to(nersemble_folder).as_posix() for path in nersemble_folder.rglob("*")
+                  if path.is_file() and path.suffix in (".mp4", ".jpg", ".json") and path.parent.name != "frames")
+
+
+@pytest.mark.parametrize("max_shard_size", [1 << 30, 20_000])
+def test_export_archive_round_trip(nersemble_folder, tmp_path, max_shard_size):
+    relative_paths = [relative_path for relative_path in _list_files(nersemble_folder)
+                      if relative_path.startswith(f"{PARTICIPANT_ID:03d}/")]
+    archive_folder = tmp_path / "archive"
+
+    n_shards, n_bytes = export_archive(str(nersemble_folder), relative_paths, str(archive_folder), participants=dict(),
+                                       max_shard_size=max_shard_size)
+
+    assert n_bytes == sum((nersemble_folder / relative_path).stat().st_size for relative_path in relative_paths)
+    assert (n_shards == 1) == (max_shard_size == 1 << 30)
+    archive = ShardedArchive.open(str(archive_folder))
+    for relative_path in relative_paths:
+        assert archive.read_bytes(relative_path) == (nersemble_folder / relative_path).read_bytes()
+
+    # The shards are regular tar files
+    unpacked_folder = tmp_path / "unpacked"
+    for shard_id in range(n_shards):
+        with tarfile.open(archive.get_shard_path(shard_id)) as tar:
+            tar.extractall(unpacked_folder)
+    for relative_path in relative_paths:
+        assert (unpacked_folder / relative_path).read_bytes() == (nersemble_folder / relative_path).read_bytes()
+
+
+def test_export_archive_removes_stale_shards(nersemble_folder, tmp_path):
+    relative_paths = [relative_path for relative_path in _list_files(nersemble_folder) if relative_path.endswith(".mp4")]
+    archive_folder = tmp_path / "archive"
+    n_shards, _ = export_archive(str(nersemble_folder), relative_paths, str(archive_folder), dict(), max_shard_size=1)
+    assert n_shards == len(relative_paths)
+
+    n_shards, _ = export_archive(str(nersemble_folder), relative_paths[:1], str(archive_folder), dict())
+
+    assert n_shards == 1
+    assert sorted(path.name for path in archive_folder.glob("*.tar")) == [ARCHIVE_SHARD_NAME.format(shard_id=0)]
+    assert not ShardedArchive.open(str(archive_folder)).exists(relative_paths[1])
+
+
+@pytest.mark.parametrize("video_backend", ["opencv", "pyav"])
+def test_load_from_archive(nersemble_folder, tmp_path, video_backend):
+    if video_backend == "pyav":
+        pytest.importorskip("av")
+    from nersemble_data.scripts.manage_data import export
+
+    archive_folder = tmp_path / "archive"
+    export(nersemble_folder, archive_folder, sequence="FREE", camera=",".join(TEST_SERIALS[:2]), shard_size=1e-6)
+    assert len(list(archive_folder.glob("*.tar"))) > 1
+
+    assert NeRSembleDataManager(str(archive_folder)).list_participants() == [PARTICIPANT_ID]
+    with NeRSembleParticipantDataManager(str(archive_folder), PARTICIPANT_ID, video_backend=video_backend) as archived, \
+            NeRSembleParticipantDataManager(str(nersemble_folder), PARTICIPANT_ID, video_backend=video_backend) as local:
+        assert archived.list_sequences() == ["FREE"]
+        assert archived.list_cameras("FREE") == TEST_SERIALS[:2]
+        assert archived.get_camera_info("FREE", TEST_SERIALS[0]) == local.get_camera_info("FREE", TEST_SERIALS[0])
+
+        for timestep in [0, 13, 2, 19]:
+            np.testing.assert_array_equal(archived.load_image("FREE", TEST_SERIALS[1], timestep, as_uint8=True),
+                                          local.load_image("FREE", TEST_SERIALS[1], timestep, as_uint8=True))
+        np.testing.assert_array_equal(archived.load_background(TEST_SERIALS[0]), local.load_background(TEST_SERIALS[0]))
+        np.testing.assert_array_equal(archived.load_camera_calibration().intrinsics,
+                                      local.load_camera_calibration().intrinsics)
+        for serial, ccm in local.load_color_calibration().items():
+            np.testing.assert_array_equal(archived.load_color_calibration()[serial], ccm)
@@ -0,0 +1,101 @@
+import os
+import subprocess
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from conftest import PARTICIPANT_ID, TEST_SERIALS
+from nersemble_data.data.asset_cache import AssetCache, _HEADER_SIZE, _HEADER_LENGTH
+from nersemble_data.data.nersemble_data import NeRSembleParticipantDataManager
+
+
+@pytest.fixture(scope="module")
+def expected_backgrounds(nersemble_folder) -> np.ndarray:
+    with NeRSembleParticipantDataManager(str(nersemble_folder), PARTICIPANT_ID) as data_manager:
+        return np.stack([data_manager.load_background(serial) for serial in TEST_SERIALS])
+
+
+def _get_shared_memory_name(nersemble_folder) -> str:
+    cache = AssetCache(str(nersemble_folder), shared_memory=True)
+    with NeRSembleParticipantDataManager(str(nersemble_folder), PARTICIPANT_ID) as data_manager:
+        return cache._get_shared_memory_name(data_manager, data_manager.list_backgrounds())
+
+
+def _get_dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_shared_backgrounds(nersemble_folder, expected_backgrounds):
+    name = _get_shared_memory_name(nersemble_folder)
+    creator_cache = AssetCache(str(nersemble_folder), shared_memory=True)
+    # Stands in for a DataLoader worker
+    attached_cache = AssetCache(str(nersemble_folder), shared_memory=True)
+
+    creator_assets = creator_cache.get(PARTICIPANT_ID)
+    attached_assets = attached_cache.get(PARTICIPANT_ID)
+
+    assert creator_assets.is_shared and attached_assets.is_shared
+    assert attached_cache.get_stats()["n_shared_attaches"] == 1
+    assert creator_assets.serials == attached_assets.serials == TEST_SERIALS
+    np.testing.assert_array_equal(creator_assets.backgrounds, expected_backgrounds)
+    np.testing.assert_array_equal(attached_assets.backgrounds, expected_backgrounds)
+    creator_assets.backgrounds[0, 0, 0] += 1
+    np.testing.assert_array_equal(attached_assets.backgrounds[0, 0, 0], creator_assets.backgrounds[0, 0, 0])
+    creator_assets.backgrounds[0, 0, 0] -= 1
+
+    # Backgrounds that are still referenced stay valid after the cache was closed
+    attached_segment = attached_assets._shared_memory
+    background = attached_assets.get_background(TEST_SERIALS[1])
+    attached_cache.close()
+    assert not attached_assets.is_shared
+    assert attached_segment.buf is not None
+    np.testing.assert_array_equal(background, expected_backgrounds[1])
+    del background
+    assert attached_segment.buf is None
+
+    # Attached segments do not outlive their creator
+    creator_segment = creator_assets._shared_memory
+    creator_cache.close()
+    assert creator_segment.buf is None
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+@pytest.mark.parametrize("owner", ["crashed", "unknown"])
+def test_stale_shared_backgrounds(nersemble_folder, expected_backgrounds, owner, capsys):
+    # Segment of a process that crashed while loading the backgrounds
+    stale_segment = shared_memory.SharedMemory(name=_get_shared_memory_name(nersemble_folder), create=True,
+                                               size=_HEADER_SIZE + expected_backgrounds.nbytes)
+    header = np.ndarray((_HEADER_LENGTH,), dtype=np.int64, buffer=stale_segment.buf)
+    header[1:4] = expected_backgrounds.shape[:3]
+    if owner == "crashed":
+        header[4] = _get_dead_pid()
+    del header
+
+    try:
+        with AssetCache(str(nersemble_folder), shared_memory=True) as cache:
+            start = time.monotonic()
+            assets = cache.get(PARTICIPANT_ID)
+
+            assert time.monotonic() - start < 10
+            assert not assets.is_shared
+            np.testing.assert_array_equal(assets.backgrounds, expected_backgrounds)
+            assert "Loading them without shared memory" in capsys.readouterr().out
+
+        # The stale segment was removed, hence the next process shares its backgrounds again
+        with AssetCache(str(nersemble_folder), shared_memory=True) as cache:
+            assets = cache.get(PARTICIPANT_ID)
+            assert assets.is_shared
+            assert assets._shared_memory_creator_pid == os.getpid()
+            np.testing.assert_array_equal(assets.backgrounds, expected_backgrounds)
+    finally:
+        stale_segment.close()
+        try:
+            stale_segment.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,128 @@
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from nersemble_data.util.async_download import AsyncDownloader
+
+
+@pytest.fixture
+def remote_files(server_folder: Path) -> dict:
+    rng = np.random.default_rng(0)
+    remote_files = {f"video_{i}.mp4": rng.bytes(100_000 + i) for i in range(4)}
+    for name, data in remote_files.items():
+        (server_folder / name).write_bytes(data)
+    return remote_files
+
+
+def test_async_download(http_server, remote_files, tmp_path):
+    event_loop_thread = threading.current_thread()
+    callback_threads = []
+    jobs = [(f"{http_server.url}/{name}", str(tmp_path / name)) for name in remote_files.keys()]
+
+    results = AsyncDownloader(max_concurrency=2, n_retries=0).download(
+        jobs, n_jobs=len(jobs), on_complete=lambda result: callback_threads.append(threading.current_thread()))
+
+    assert all(result is not None for result in results)
+    assert all((tmp_path / name).read_bytes() == data for name, data in remote_files.items())
+    # Callbacks (e.g., hashing) must not block the event loop
+    assert len(callback_threads) == len(jobs) and event_loop_thread not in callback_threads
+
+
+def test_async_resume_and_corrupted_part_files(http_server, remote_files, tmp_path):
+    data = remote_files["video_0.mp4"]
+    # Regular interrupted download
+    Path(f"{tmp_path / 'video_0.mp4'}.part").write_bytes(data[:50_000])
+    # Oversized .part file, the server answers 416
+    Path(f"{tmp_path / 'video_1.mp4'}.part").write_bytes(bytes(len(remote_files["video_1.mp4"]) + 1))
+    # Preallocated .part file of an interrupted multi-connection download
+    Path(f"{tmp_path / 'video_2.mp4'}.part").write_bytes(bytes(len(remote_files["video_2.mp4"])))
+    Path(f"{tmp_path / 'video_2.mp4'}.part.ranges").write_text(json.dumps([[0, len(remote_files["video_2.mp4"]), 10]]))
+    # .part file of an older version of the remote file
+    Path(f"{tmp_path / 'video_3.mp4'}.part").write_bytes(bytes(50_000))
+    Path(f"{tmp_path / 'video_3.mp4'}.part.validator").write_text('"outdated-etag"')
+
+    jobs = [(f"{http_server.url}/{name}", str(tmp_path / name)) for name in remote_files.keys()]
+    results = AsyncDownloader(n_retries=0).download(jobs)
+
+    assert results[0].n_bytes_downloaded == len(data) - 50_000
+    assert all((tmp_path / name).read_bytes() == data for name, data in remote_files.items())
+    assert not any(path.name.endswith(('.part', '.ranges', '.validator')) for path in tmp_path.iterdir())
+
+
+@contextmanager
+def _redirecting_server(target_url: str, send_content_length: bool = True) -> Iterator[str]:
+    # Redirects every request to target_url, e.g., like a CDN. HEAD responses optionally omit the Content-Length
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_HEAD(self):
+            if send_content_length:
+                self.send_response(302)
+                self.send_header('Location', f"{target_url}{self.path}")
+            else:
+                self.send_response(200)
+            self.end_headers()
+
+        def do_GET(self):
+            self.send_response(302)
+            self.send_header('Location', f"{target_url}{self.path}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs=dict(poll_interval=0.01), daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("send_content_length", [True, False])
+def test_async_existing_files_are_not_downloaded_again(http_server, remote_files, tmp_path, send_content_length):
+    for name, data in remote_files.items():
+        (tmp_path / name).write_bytes(data)
+
+    with _redirecting_server(http_server.url, send_content_length=send_content_length) as url:
+        jobs = [(f"{url}/{name}", str(tmp_path / name)) for name in remote_files.keys()]
+        results = AsyncDownloader(n_retries=0).download(jobs)
+
+    assert all(result.skipped and result.size == len(remote_files[Path(result.target_path).name]) for result in results)
+    # Only the redirected HEAD requests reach the server
+    assert http_server.n_requests == (len(remote_files) if send_content_length else 0)
+
+
+def test_async_existing_file_with_wrong_size_is_downloaded_again(http_server, remote_files, tmp_path):
+    (tmp_path / "video_0.mp4").write_bytes(remote_files["video_0.mp4"][:1000])
+
+    with _redirecting_server(http_server.url) as url:
+        results = AsyncDownloader(n_retries=0).download([(f"{url}/video_0.mp4", str(tmp_path / "video_0.mp4"))])
+
+    assert not results[0].skipped
+    assert (tmp_path / "video_0.mp4").read_bytes() == remote_files["video_0.mp4"]
+
+
+def test_async_os_errors_only_fail_their_job(http_server, remote_files, tmp_path):
+    # The target folder cannot be created, since a file is in the way
+    (tmp_path / "blocked").write_bytes(b"")
+    jobs = [(f"{http_server.url}/{name}", str(tmp_path / name)) for name in remote_files.keys()]
+    jobs.insert(1, (f"{http_server.url}/video_0.mp4", str(tmp_path / "blocked" / "video_0.mp4")))
+    completed = []
+
+    results = AsyncDownloader(max_concurrency=2, n_retries=0).download(jobs, on_complete=completed.append)
+
+    assert [result is not None for result in results] == [True, False, True, True, True]
+    assert len(completed) == len(remote_files)
+    assert all((tmp_path / name).read_bytes() == data for name, data in remote_files.items())
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from nersemble_data.data.cameras import CameraArrays, IMAGE_WIDTH, IMAGE_HEIGHT
+from nersemble_data.util.image import downscale_image
+
+
+@pytest.fixture
+def cameras() -> CameraArrays:
+    intrinsics = np.array([[8000., 1.5, 1603.7],
+                           [0., 8000., 1099.2],
+                           [0., 0., 1.]])
+    world_2_cam = np.eye(4)
+    world_2_cam[:3, 3] = [0.1, -0.2, 1.]
+
+    return CameraArrays(["222200037"], world_2_cam[None], intrinsics[None])
+
+
+@pytest.mark.parametrize("downscale_factor", [2, 3, 16, 2.5])
+def test_rays_match_image_size(cameras, downscale_factor):
+    # 3208 / 16 = 200.5 has to be rounded up like the downscaled images, not to the even 200
+    image = downscale_image(np.zeros((IMAGE_HEIGHT, IMAGE_WIDTH, 3), dtype=np.uint8), downscale_factor)
+    _, directions = cameras.get_rays(downscale_factor)
+
+    assert directions.shape == (1, *image.shape)
+
+
+@pytest.mark.parametrize("downscale_factor", [2, 4, 8])
+def test_downscaled_projection_hits_averaged_pixel(cameras, downscale_factor):
+    # Area downscaling by an integer factor averages blocks of downscale_factor x downscale_factor pixels, i.e., the
+    # center of downscaled pixel x is at x * f + (f - 1) / 2 in the full-resolution image
+    x, y = 37, 21
+    full_resolution_pixel = np.array([[x * downscale_factor + (downscale_factor - 1) / 2,
+                                       y * downscale_factor + (downscale_factor - 1) / 2]])
+    point = _unproject(cameras, full_resolution_pixel, depth=1.3)
+
+    pixels, _ = cameras.project(point, downscale_factor=downscale_factor)
+
+    np.testing.assert_allclose(pixels[0], [[x, y]], atol=1e-9)
+
+
+def test_rays_hit_projected_points(cameras):
+    downscale_factor = 4
+    origins, directions = cameras.get_rays(downscale_factor, normalize=False, dtype=np.float64)
+    points = origins[0] + 1.7 * directions[0, [5, 80], [9, 120]]
+
+    pixels, depths = cameras.project(points, downscale_factor=downscale_factor)
+
+    np.testing.assert_allclose(pixels[0], [[9, 5], [120, 80]], atol=1e-9)
+    np.testing.assert_allclose(depths[0], 1.7)
+
+
+def _unproject(cameras: CameraArrays, pixels: np.ndarray, depth: float) -> np.ndarray:
+    intrinsics = cameras.intrinsics[0]
+    points_cam = np.concatenate([pixels, np.ones((len(pixels), 1))], axis=1) @ np.linalg.inv(intrinsics).T * depth
+    return (np.concatenate([points_cam, np.ones((len(pixels), 1))], axis=1) @ cameras.cam_2_world[0].T)[:, :3]
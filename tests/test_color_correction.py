@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("colour")
+
+from nersemble_data.util.color_correction import ColorCorrector, correct_color, correct_color_reference
+
+
+def _make_ccm(terms: int) -> np.ndarray:
+    # Close to identity with small cross-channel and higher-order terms, like a calibrated CCM
+    ccm = np.random.default_rng(terms).normal(0, 0.05, size=(3, terms))
+    ccm[:, :3] += np.eye(3)
+    return ccm
+
+
+@pytest.fixture
+def image() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(37, 64, 3), dtype=np.uint8)
+    # All intensity levels, such that every entry of the decoding lookup table is used
+    image[:4] = np.arange(256, dtype=np.uint8).reshape(4, 64, 1)
+    return image
+
+
+@pytest.mark.parametrize("terms", [3, 5, 7, 8, 10])
+def test_uint8_matches_reference(image, terms):
+    ccm = _make_ccm(terms)
+
+    corrected = ColorCorrector(ccm)(image)
+    reference = correct_color_reference(image, ccm)
+
+    assert corrected.dtype == np.uint8
+    assert np.abs(corrected.astype(np.int32) - reference.astype(np.int32)).max() <= 1
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_float_matches_reference(image, dtype):
+    ccm = _make_ccm(10)
+    image_float = (image / 255.).astype(dtype)
+
+    corrected = ColorCorrector(ccm)(image_float)
+    reference = correct_color_reference(image_float.astype(np.float64), ccm)
+
+    assert corrected.dtype == dtype
+    np.testing.assert_allclose(corrected, reference, atol=1e-4)
+
+
+def test_uint8_to_float_matches_reference(image):
+    ccm = _make_ccm(10)
+
+    corrected = ColorCorrector(ccm)(image, dtype=np.float32)
+    reference = correct_color_reference(image / 255., ccm)
+
+    np.testing.assert_allclose(corrected, reference, atol=1e-4)
+
+
+def test_chunks_and_out(image):
+    # Chunks that do not divide the number of pixels, a batch of images and a preallocated output
+    ccm = _make_ccm(7)
+    batch = np.stack([image, image[::-1]])
+    out = np.empty_like(batch)
+
+    corrected = ColorCorrector(ccm, chunk_size=1000)(batch, out=out)
+
+    assert corrected is out
+    np.testing.assert_array_equal(corrected, ColorCorrector(ccm)(batch))
+    np.testing.assert_array_equal(corrected[1], ColorCorrector(ccm)(image[::-1]))
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.float32])
+def test_non_contiguous_out(image, dtype):
+    ccm = _make_ccm(7)
+    buffer = np.zeros((image.shape[0], image.shape[1] + 16, 3), dtype=dtype)
+    out = buffer[:, 8:-8]
+
+    corrected = ColorCorrector(ccm)(image, out=out)
+
+    assert corrected is out
+    np.testing.assert_array_equal(out, ColorCorrector(ccm)(image, dtype=dtype))
+    assert not buffer[:, :8].any() and not buffer[:, -8:].any()
+
+
+@pytest.mark.parametrize("as_float", [False, True])
+def test_correct_color_matches_reference(image, as_float):
+    # Tolerances as documented by ColorCorrector
+    ccm = _make_ccm(4)
+    if as_float:
+        image = image / 255.
+
+    corrected = correct_color(image, ccm)
+    reference = correct_color_reference(image, ccm)
+
+    assert corrected.dtype == image.dtype
+    if as_float:
+        np.testing.assert_allclose(corrected, reference, atol=1e-4)
+    else:
+        assert np.abs(corrected.astype(np.int32) - reference.astype(np.int32)).max() <= 1
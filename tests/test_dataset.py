@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import PARTICIPANT_ID, SEQUENCES, TEST_SERIALS, N_FRAMES
+from nersemble_data.data import dataset as dataset_module
+from nersemble_data.data.dataset import NeRSembleDataset, NeRSembleIterableDataset, SimpleDataLoader, WorkerInfo
+from nersemble_data.data.nersemble_data import NeRSembleParticipantDataManager
+
+
+@pytest.fixture(scope="module")
+def expected_timesteps(nersemble_folder) -> dict:
+    with NeRSembleParticipantDataManager(str(nersemble_folder), PARTICIPANT_ID) as data_manager:
+        return {(sequence_name, timestep): data_manager.load_timestep(sequence_name, timestep, as_uint8=True)
+                for sequence_name in SEQUENCES for timestep in range(N_FRAMES)}
+
+
+def test_map_style_dataset(nersemble_folder, expected_timesteps):
+    dataset = NeRSembleDataset(str(nersemble_folder), timestep_stride=5, as_uint8=True)
+
+    assert len(dataset) == len(SEQUENCES) * len(TEST_SERIALS) * (N_FRAMES // 5)
+    # Cameras are the fastest running dimension
+    assert [dataset.get_sample_info(index) for index in range(4)] == \
+           [(PARTICIPANT_ID, SEQUENCES[0], serial, 0) for serial in TEST_SERIALS] + [(PARTICIPANT_ID, SEQUENCES[0], TEST_SERIALS[0], 5)]
+    assert dataset.get_sample_info(-1) == (PARTICIPANT_ID, SEQUENCES[-1], TEST_SERIALS[-1], 15)
+    with pytest.raises(IndexError):
+        dataset.get_sample_info(len(dataset))
+
+    for index in [0, 7, len(dataset) - 1]:
+        sample = dataset[index]
+        i_serial = TEST_SERIALS.index(sample["serial"])
+        np.testing.assert_array_equal(sample["image"], expected_timesteps[(sample["sequence_name"], sample["timestep"])][i_serial])
+    dataset.close()
+
+
+def test_map_style_dataset_shuffle(nersemble_folder):
+    dataset = NeRSembleDataset(str(nersemble_folder), sequences=["FREE"], shuffle=True, seed=3)
+    unshuffled = NeRSembleDataset(str(nersemble_folder), sequences=["FREE"])
+
+    epoch_0 = [dataset.get_sample_info(index) for index in range(len(dataset))]
+    dataset.set_epoch(1)
+    epoch_1 = [dataset.get_sample_info(index) for index in range(len(dataset))]
+    dataset.set_epoch(0)
+
+    assert sorted(epoch_0) == sorted(epoch_1) == sorted(unshuffled.get_sample_info(index) for index in range(len(unshuffled)))
+    assert epoch_0 != epoch_1
+    assert [dataset.get_sample_info(index) for index in range(len(dataset))] == epoch_0
+
+
+def test_iterable_dataset(nersemble_folder, expected_timesteps, monkeypatch):
+    dataset = NeRSembleIterableDataset(str(nersemble_folder), serials=TEST_SERIALS[:2], timestep_stride=3, as_uint8=True)
+
+    samples = list(dataset)
+
+    assert len(dataset) == len(samples) == len(SEQUENCES) * len(range(0, N_FRAMES, 3))
+    assert [(sample["sequence_name"], sample["timestep"]) for sample in samples] == \
+           [(sequence_name, timestep) for sequence_name in SEQUENCES for timestep in range(0, N_FRAMES, 3)]
+    for sample in samples:
+        assert sample["serials"] == TEST_SERIALS[:2]
+        np.testing.assert_array_equal(sample["images"], expected_timesteps[(sample["sequence_name"], sample["timestep"])][:2])
+    # Decoders of finished sequences are closed
+    assert dataset._get_data_manager(PARTICIPANT_ID).get_cache_stats()["n_open"] == 0
+
+    # Every sequence is visited by exactly one worker
+    worker_sequences = []
+    for worker_id in range(2):
+        monkeypatch.setattr(dataset_module, "_worker_info", WorkerInfo(worker_id, 2))
+        worker_sequences.append([unit.sequence_name for unit in dataset.get_worker_units()])
+    assert worker_sequences == [[SEQUENCES[0]], [SEQUENCES[1]]]
+    dataset.close()
+
+
+@pytest.mark.parametrize("n_workers", [0, 2])
+def test_simple_data_loader(nersemble_folder, expected_timesteps, n_workers):
+    dataset = NeRSembleDataset(str(nersemble_folder), sequences=["FREE"], timestep_stride=4, as_uint8=True)
+    # The main process already has open decoders before the workers are forked
+    dataset[0]
+
+    samples = list(SimpleDataLoader(dataset, n_workers=n_workers, prefetch=3))
+
+    # Map-style samples arrive in index order
+    assert [(sample["serial"], sample["timestep"]) for sample in samples] == \
+           [dataset.get_sample_info(index)[2:] for index in range(len(dataset))]
+    for sample in samples:
+        np.testing.assert_array_equal(sample["image"],
+                                      expected_timesteps[("FREE", sample["timestep"])][TEST_SERIALS.index(sample["serial"])])
+
+    iterable_dataset = NeRSembleIterableDataset(str(nersemble_folder), timestep_stride=4, as_uint8=True)
+    iterable_samples = list(SimpleDataLoader(iterable_dataset, n_workers=n_workers))
+
+    # Iterable samples arrive in the order the workers finish them
+    assert sorted((sample["sequence_name"], sample["timestep"]) for sample in iterable_samples) == \
+           [(sequence_name, timestep) for sequence_name in SEQUENCES for timestep in range(0, N_FRAMES, 4)]
+    for sample in iterable_samples:
+        np.testing.assert_array_equal(sample["images"], expected_timesteps[(sample["sequence_name"], sample["timestep"])])
+    dataset.close()
+    iterable_dataset.close()
+
+
+def test_data_managers_are_recreated_after_pid_change(nersemble_folder, monkeypatch):
+    dataset = NeRSembleDataset(str(nersemble_folder), as_uint8=True)
+    image = dataset[0]["image"]
+    parent_data_manager = dataset._get_data_manager(PARTICIPANT_ID)
+    assert parent_data_manager.get_cache_stats()["n_open"] == 1
+
+    # As seen from a forked worker
+    parent_pid = os.getpid()
+    monkeypatch.setattr(dataset_module.os, "getpid", lambda: parent_pid + 1)
+    np.testing.assert_array_equal(dataset[0]["image"], image)
+    worker_data_manager = dataset._get_data_manager(PARTICIPANT_ID)
+    assert worker_data_manager is not parent_data_manager
+    dataset.close()
+
+    # The worker neither used nor closed the decoders it inherited
+    assert worker_data_manager.get_cache_stats()["n_open"] == 0
+    assert parent_data_manager.get_cache_stats() == {"n_open": 1, "n_hits": 0, "n_misses": 1, "n_evictions": 0,
+                                                     "n_calibration_loads": 0, "n_frame_stores": 0}
+    monkeypatch.undo()
+    parent_data_manager.close()
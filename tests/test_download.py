@@ -0,0 +1,136 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from nersemble_data.util import download
+from nersemble_data.util.download import download_file
+
+
+@pytest.fixture
+def remote_file(server_folder: Path) -> bytes:
+    data = np.random.default_rng(0).bytes(300_000)
+    (server_folder / "video.mp4").write_bytes(data)
+    return data
+
+
+def test_download(http_server, remote_file, tmp_path):
+    target_path = tmp_path / "local" / "video.mp4"
+    result = download_file(f"{http_server.url}/video.mp4", str(target_path), n_retries=0)
+
+    assert target_path.read_bytes() == remote_file
+    assert result.n_bytes_downloaded == len(remote_file)
+    assert not Path(f"{target_path}.part").exists()
+    assert not Path(f"{target_path}.part.validator").exists()
+
+
+def test_resume_partial_download(http_server, remote_file, tmp_path):
+    target_path = tmp_path / "video.mp4"
+    Path(f"{target_path}.part").write_bytes(remote_file[:100_000])
+
+    result = download_file(f"{http_server.url}/video.mp4", str(target_path), n_retries=0)
+
+    assert target_path.read_bytes() == remote_file
+    assert result.n_bytes_downloaded == len(remote_file) - 100_000
+
+
+def test_resume_interrupted_multi_connection_download_with_single_connection(http_server, remote_file, tmp_path):
+    # Interrupted multi-connection downloads leave a preallocated, zero-filled .part file with the full size
+    target_path = tmp_path / "video.mp4"
+    part_path = Path(f"{target_path}.part")
+    part_path.write_bytes(remote_file[:50_000] + bytes(len(remote_file) - 50_000))
+    ranges = [[0, 150_000, 50_000], [150_000, len(remote_file), 0]]
+    Path(f"{part_path}.ranges").write_text(json.dumps(ranges))
+
+    result = download_file(f"{http_server.url}/video.mp4", str(target_path), n_retries=0, n_connections=1)
+
+    assert target_path.read_bytes() == remote_file
+    assert result.n_bytes_downloaded == len(remote_file) - 50_000
+    assert not Path(f"{part_path}.ranges").exists()
+
+
+def test_multi_connection_download(http_server, remote_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(download, 'PARALLEL_DOWNLOAD_MIN_SIZE', 0)
+    target_path = tmp_path / "video.mp4"
+
+    result = download_file(f"{http_server.url}/video.mp4", str(target_path), n_retries=0, n_connections=4)
+
+    assert target_path.read_bytes() == remote_file
+    assert result.n_bytes_downloaded == len(remote_file)
+    assert not Path(f"{target_path}.part.ranges").exists()
+
+
+def test_oversized_part_file_is_downloaded_again(http_server, remote_file, tmp_path):
+    # The server answers 416 for a range behind the end of the file, which must not be taken as "complete"
+    target_path = tmp_path / "video.mp4"
+    Path(f"{target_path}.part").write_bytes(bytes(len(remote_file) + 10))
+
+    download_file(f"{http_server.url}/video.mp4", str(target_path), n_retries=0)
+
+    assert target_path.read_bytes() == remote_file
+
+
+def test_complete_part_file_is_finished(http_server, remote_file, tmp_path):
+    target_path = tmp_path / "video.mp4"
+    Path(f"{target_path}.part").write_bytes(remote_file)
+
+    result = download_file(f"{http_server.url}/video.mp4", str(target_path), n_retries=0)
+
+    assert target_path.read_bytes() == remote_file
+    assert result.n_bytes_downloaded == 0
+
+
+def test_part_file_of_changed_remote_file_is_discarded(http_server, remote_file, tmp_path):
+    # Interrupted download of an older version of the file
+    target_path = tmp_path / "video.mp4"
+    Path(f"{target_path}.part").write_bytes(bytes(100_000))
+    Path(f"{target_path}.part.validator").write_text('"outdated-etag"')
+
+    download_file(f"{http_server.url}/video.mp4", str(target_path), n_retries=0)
+
+    assert target_path.read_bytes() == remote_file
+
+
+def test_changed_remote_file_restarts_multi_connection_download(http_server, remote_file, tmp_path):
+    target_path = tmp_path / "video.mp4"
+    part_path = Path(f"{target_path}.part")
+    part_path.write_bytes(bytes(len(remote_file)))
+    Path(f"{part_path}.ranges").write_text(json.dumps([[0, 150_000, 1000], [150_000, len(remote_file), 0]]))
+    Path(f"{part_path}.validator").write_text('"outdated-etag"')
+
+    download_file(f"{http_server.url}/video.mp4", str(target_path), n_retries=0)
+
+    assert target_path.read_bytes() == remote_file
+    assert not Path(f"{part_path}.ranges").exists()
+
+
+def test_existing_file_is_skipped(http_server, remote_file, tmp_path):
+    target_path = tmp_path / "video.mp4"
+    target_path.write_bytes(remote_file)
+
+    result = download_file(f"{http_server.url}/video.mp4", str(target_path), n_retries=0)
+
+    assert result.skipped
+
+
+def test_missing_file(http_server, tmp_path):
+    assert download_file(f"{http_server.url}/missing.mp4", str(tmp_path / "missing.mp4"), n_retries=0) is None
+
+
+def test_range_states_of_concurrent_downloads_do_not_share_temporary_files(tmp_path):
+    # E.g., two processes that continue the same interrupted download
+    ranges_path = str(tmp_path / "video.mp4.part.ranges")
+    range_states = [download._RangeState.create(ranges_path, 300_000, n_ranges) for n_ranges in (2, 3)]
+
+    def save(i: int):
+        range_state = range_states[i % 2]
+        range_state.add_progress(0, 1)
+        range_state.save()
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(save, range(200)))
+
+    assert download._RangeState.load(ranges_path).ranges in [state.ranges for state in range_states]
+    assert [path.name for path in tmp_path.iterdir()] == ["video.mp4.part.ranges"]
@@ -0,0 +1,119 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from conftest import PARTICIPANT_ID, TEST_SERIALS, N_FRAMES
+from nersemble_data.data.frame_store import FrameStore, extract_frames
+from nersemble_data.data.nersemble_data import NeRSembleParticipantDataManager
+from nersemble_data.util.instrumentation import enable_instrumentation, disable_instrumentation
+
+
+@pytest.fixture
+def nersemble_copy(nersemble_folder, tmp_path) -> Path:
+    # Extracting frames writes into the dataset folder, hence every test works on its own copy
+    nersemble_copy = tmp_path / "nersemble"
+    shutil.copytree(nersemble_folder, nersemble_copy)
+    return nersemble_copy
+
+
+def _count_frame_store_hits(data_manager: NeRSembleParticipantDataManager, **load_kwargs) -> int:
+    enable_instrumentation()
+    try:
+        data_manager.load_image("FREE", TEST_SERIALS[0], 5, as_uint8=True, **load_kwargs)
+    finally:
+        stats = disable_instrumentation()
+    return stats["counters"].get("load_image.n_frame_store_hits", 0)
+
+
+@pytest.mark.parametrize("apply_color_correction", [False, True])
+@pytest.mark.parametrize("downscale_factor", [None, 2])
+def test_extract_frames_round_trip(nersemble_copy, downscale_factor, apply_color_correction):
+    load_kwargs = dict(downscale_factor=downscale_factor, apply_color_correction=apply_color_correction)
+    with NeRSembleParticipantDataManager(str(nersemble_copy), PARTICIPANT_ID) as data_manager:
+        expected = [data_manager.load_image("FREE", TEST_SERIALS[0], timestep, as_uint8=True, **load_kwargs)
+                    for timestep in range(N_FRAMES)]
+        expected_float = data_manager.load_image("FREE", TEST_SERIALS[0], 11, dtype=np.float32, **load_kwargs)
+
+        frames_path = data_manager.extract_frames("FREE", TEST_SERIALS[0], **load_kwargs)
+
+        assert len(FrameStore(frames_path)) == N_FRAMES
+        for timestep in [0, 19, 4, 11, 12]:
+            np.testing.assert_array_equal(data_manager.load_image("FREE", TEST_SERIALS[0], timestep, as_uint8=True, **load_kwargs),
+                                          expected[timestep])
+        # Color-corrected frames are stored as uint8, i.e., float images are quantized (and can be off by one level)
+        np.testing.assert_allclose(data_manager.load_image("FREE", TEST_SERIALS[0], 11, dtype=np.float32, **load_kwargs),
+                                   expected_float, rtol=0, atol=1.5 / 255 if apply_color_correction else 0)
+        assert _count_frame_store_hits(data_manager, **load_kwargs) == 1
+        # Color correction cannot be undone
+        assert _count_frame_store_hits(data_manager, downscale_factor=downscale_factor) == (not apply_color_correction)
+        assert _count_frame_store_hits(data_manager) == (downscale_factor is None and not apply_color_correction)
+
+
+def test_frame_store_frames_are_read_only(nersemble_copy):
+    with NeRSembleParticipantDataManager(str(nersemble_copy), PARTICIPANT_ID) as data_manager:
+        data_manager.extract_frames("FREE", TEST_SERIALS[0])
+        image = data_manager.load_image("FREE", TEST_SERIALS[0], 3, as_uint8=True)
+        out = np.zeros_like(image)
+        copied = data_manager.load_image("FREE", TEST_SERIALS[0], 3, out=out)
+
+    # Zero-copy view into the memory-mapped frames
+    assert not image.flags.writeable
+    with pytest.raises(ValueError):
+        image[0, 0] = 0
+    assert copied is out and out.flags.writeable
+    np.testing.assert_array_equal(out, image)
+
+
+def test_failed_extraction_removes_partial_frames(nersemble_copy, tmp_path):
+    video_path = str(nersemble_copy / f"{PARTICIPANT_ID:03d}/sequences/FREE/images/cam_{TEST_SERIALS[0]}.mp4")
+    frames_path = tmp_path / "frames" / "cam.npy"
+
+    n_written_frames = []
+
+    def failing_color_corrector(image: np.ndarray, out: np.ndarray):
+        # Interrupted after some frames were written
+        if len(n_written_frames) == 5:
+            raise RuntimeError("Interrupted")
+        out[:] = image
+        n_written_frames.append(1)
+
+    with pytest.raises(RuntimeError):
+        extract_frames(video_path, str(frames_path), color_corrector=failing_color_corrector)
+
+    assert list(frames_path.parent.iterdir()) == []
+    assert FrameStore.open(str(frames_path)) is None
+
+    # Leftovers of a crashed extraction are overwritten
+    frames_path.with_name("cam.npy.part").write_bytes(b"crashed")
+    extract_frames(video_path, str(frames_path))
+    assert sorted(path.name for path in frames_path.parent.iterdir()) == ["cam.json", "cam.npy"]
+    assert len(FrameStore.open(str(frames_path), video_path=video_path)) == N_FRAMES
+
+
+@pytest.mark.parametrize("interpolation", ["bilinear", "area"])
+def test_frame_store_only_serves_matching_interpolation(nersemble_copy, interpolation):
+    other_interpolation = "area" if interpolation == "bilinear" else "bilinear"
+    crop_box = (8, 4, 56, 44)
+
+    with NeRSembleParticipantDataManager(str(nersemble_copy), PARTICIPANT_ID) as data_manager:
+        expected = data_manager.load_image("FREE", TEST_SERIALS[0], 5, as_uint8=True, downscale_factor=2,
+                                           interpolation=interpolation)
+        expected_crop = data_manager.load_image("FREE", TEST_SERIALS[0], 5, as_uint8=True, downscale_factor=2,
+                                                interpolation=interpolation, crop_box=crop_box)
+        data_manager.extract_frames("FREE", TEST_SERIALS[0], downscale_factor=2, interpolation=interpolation)
+
+        assert _count_frame_store_hits(data_manager, downscale_factor=2, interpolation=interpolation) == 1
+        assert _count_frame_store_hits(data_manager, downscale_factor=2, interpolation=other_interpolation) == 0
+        # Bilinear filters reach beyond the crop borders, hence only area-downscaled frames can be cropped afterwards
+        assert _count_frame_store_hits(data_manager, downscale_factor=2, interpolation=interpolation,
+                                       crop_box=crop_box) == (interpolation == "area")
+
+        np.testing.assert_array_equal(
+            data_manager.load_image("FREE", TEST_SERIALS[0], 5, as_uint8=True, downscale_factor=2, interpolation=interpolation),
+            expected)
+        np.testing.assert_array_equal(
+            data_manager.load_image("FREE", TEST_SERIALS[0], 5, as_uint8=True, downscale_factor=2, interpolation=interpolation,
+                                    crop_box=crop_box),
+            expected_crop)
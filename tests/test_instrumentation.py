@@ -0,0 +1,50 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from nersemble_data.util.instrumentation import Histogram, enable_instrumentation, disable_instrumentation, dump_stats, \
+    format_stats, observe, count
+
+
+def _reject_constant(constant: str):
+    raise ValueError(f"Invalid JSON constant {constant}")
+
+
+def test_dump_stats_writes_strict_json(tmp_path):
+    dump_path = tmp_path / "stats.json"
+    enable_instrumentation()
+    try:
+        observe("download.n_bytes", 1000, unit='bytes')
+        count("video.n_seeks", 2)
+        dump_stats(str(dump_path))
+    finally:
+        disable_instrumentation()
+
+    dumped = json.loads(dump_path.read_text(), parse_constant=_reject_constant)
+    assert dumped["counters"] == {"video.n_seeks": 2}
+    assert dumped["histograms"]["download.n_bytes"]["p50"] == 1000
+
+
+def test_empty_histogram_is_null_in_json():
+    empty = json.loads(json.dumps(Histogram().to_dict(), allow_nan=False))
+
+    assert empty["count"] == 0
+    assert all(empty[key] is None for key in ("mean", "min", "p50", "p90", "p99", "max"))
+    stats = {"pid": 0, "duration_s": 0., "counters": dict(), "histograms": {"empty": empty}}
+    assert format_stats(stats).splitlines()[-1].split() == ["empty", "0", "0.00ms", "-", "-", "-", "-"]
+
+
+def test_concurrent_dumps_leave_no_temporary_files(tmp_path):
+    dump_path = tmp_path / "stats.json"
+    enable_instrumentation()
+    try:
+        def dump(i: int):
+            observe("load_image", i * 1e-3)
+            dump_stats(str(dump_path))
+
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(dump, range(100)))
+    finally:
+        disable_instrumentation()
+
+    assert json.loads(dump_path.read_text())["histograms"]["load_image"]["count"] > 0
+    assert [path.name for path in tmp_path.iterdir()] == ["stats.json"]
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from nersemble_data.util.download import DownloadResult
+from nersemble_data.util.manifest import DownloadManifest, compute_sha256
+
+RELATIVE_PATHS = [f"001/sequences/FREE/images/cam_{i}.mp4" for i in range(3)]
+
+
+@pytest.fixture
+def downloaded_folder(tmp_path: Path) -> Path:
+    # A NeRSemble folder whose files were all recorded as completely downloaded
+    downloaded_folder = tmp_path / "nersemble"
+    rng = np.random.default_rng(0)
+    with DownloadManifest(str(downloaded_folder)) as manifest:
+        for relative_path in RELATIVE_PATHS:
+            local_path = downloaded_folder / relative_path
+            local_path.parent.mkdir(parents=True, exist_ok=True)
+            local_path.write_bytes(rng.bytes(10_000))
+            manifest.record(relative_path, DownloadResult(url=f"https://example.com/{relative_path}",
+                                                          target_path=str(local_path),
+                                                          size=10_000,
+                                                          etag='"abc"'))
+    return downloaded_folder
+
+
+def test_manifest_round_trip(downloaded_folder):
+    with DownloadManifest(str(downloaded_folder)) as manifest:
+        entry = manifest.get(RELATIVE_PATHS[0])
+        assert entry.url == f"https://example.com/{RELATIVE_PATHS[0]}"
+        assert entry.size == 10_000
+        assert entry.etag == '"abc"'
+        assert entry.sha256 is None
+        assert manifest.get("001/missing.mp4") is None
+        assert [entry.relative_path for entry in manifest.list_entries()] == RELATIVE_PATHS
+        assert all(manifest.is_up_to_date(relative_path) for relative_path in RELATIVE_PATHS)
+
+        manifest.set_hash(RELATIVE_PATHS[0], compute_sha256(str(downloaded_folder / RELATIVE_PATHS[0])))
+        manifest.remove(RELATIVE_PATHS[2])
+
+        # Changed and deleted files are not up-to-date anymore
+        (downloaded_folder / RELATIVE_PATHS[1]).write_bytes(b"changed")
+        assert not manifest.is_up_to_date(RELATIVE_PATHS[1])
+        os.remove(downloaded_folder / RELATIVE_PATHS[0])
+        assert not manifest.is_up_to_date(RELATIVE_PATHS[0])
+        assert not manifest.is_up_to_date(RELATIVE_PATHS[2])
+
+    with DownloadManifest(str(downloaded_folder)) as manifest:
+        assert manifest.get(RELATIVE_PATHS[0]).sha256 is not None
+        assert manifest.get(RELATIVE_PATHS[2]) is None
+
+
+def test_manifest_uses_rollback_journal(tmp_path):
+    manifest_path = tmp_path / DownloadManifest.FILE_NAME
+    # Manifests of earlier versions were created in WAL mode
+    with sqlite3.connect(str(manifest_path)) as connection:
+        connection.execute("PRAGMA journal_mode=WAL")
+
+    with DownloadManifest(str(tmp_path)):
+        with sqlite3.connect(str(manifest_path)) as connection:
+            assert connection.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [DownloadManifest.FILE_NAME]
+
+
+def test_verify_and_repair(downloaded_folder, capsys):
+    from nersemble_data.scripts.manage_data import verify
+
+    verify(downloaded_folder, n_workers=2)
+    assert "0 ok, 3 hashed for the first time, 0 missing, 0 corrupted" in capsys.readouterr().out
+
+    # Same size, different content
+    corrupted_path = downloaded_folder / RELATIVE_PATHS[0]
+    corrupted_path.write_bytes(bytes(10_000))
+    os.remove(downloaded_folder / RELATIVE_PATHS[1])
+
+    verify(downloaded_folder, n_workers=2)
+    output = capsys.readouterr().out
+    assert "1 ok, 0 hashed for the first time, 1 missing, 1 corrupted" in output
+    assert f"[CORRUPTED] {RELATIVE_PATHS[0]}" in output
+    assert f"[MISSING] {RELATIVE_PATHS[1]}" in output
+    assert corrupted_path.exists()
+
+    verify(downloaded_folder, n_workers=2, repair=True)
+    assert not corrupted_path.exists()
+    with DownloadManifest(str(downloaded_folder)) as manifest:
+        assert [entry.relative_path for entry in manifest.list_entries()] == RELATIVE_PATHS[2:]
+
+    verify(downloaded_folder, n_workers=2)
+    assert "1 ok, 0 hashed for the first time, 0 missing, 0 corrupted" in capsys.readouterr().out
@@ -0,0 +1,38 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from nersemble_data.util.metadata import fetch_cached
+
+
+def test_fetch_cached(http_server, server_folder, tmp_path):
+    (server_folder / "participants.csv").write_text("ID\n1\n2\n")
+    cache_path = tmp_path / "cache" / "participants.csv"
+
+    path = fetch_cached(f"{http_server.url}/participants.csv", str(cache_path), max_age=3600)
+
+    assert Path(path).read_text() == "ID\n1\n2\n"
+    assert "validated_at" in json.loads(Path(f"{cache_path}.info.json").read_text())
+
+    # Within max_age, the server is not asked again
+    (server_folder / "participants.csv").write_text("ID\n1\n2\n3\n")
+    assert Path(fetch_cached(f"{http_server.url}/participants.csv", str(cache_path), max_age=3600)).read_text() == "ID\n1\n2\n"
+    assert Path(fetch_cached(f"{http_server.url}/participants.csv", str(cache_path), max_age=0)).read_text() == "ID\n1\n2\n3\n"
+
+
+def test_concurrent_fetch_cached(http_server, server_folder, tmp_path):
+    content = "ID\n" + "\n".join(str(p_id) for p_id in range(10_000)) + "\n"
+    (server_folder / "participants.csv").write_text(content)
+    cache_path = tmp_path / "cache" / "participants.csv"
+
+    def fetch(_) -> str:
+        path = fetch_cached(f"{http_server.url}/participants.csv", str(cache_path), max_age=0)
+        # Readers never see partially written files
+        json.loads(Path(f"{cache_path}.info.json").read_text())
+        return Path(path).read_text()
+
+    with ThreadPoolExecutor(8) as executor:
+        contents = list(executor.map(fetch, range(32)))
+
+    assert all(fetched_content == content for fetched_content in contents)
+    assert sorted(path.name for path in cache_path.parent.iterdir()) == ["participants.csv", "participants.csv.info.json"]
@@ -0,0 +1,129 @@
+import sys
+from importlib.util import find_spec
+
+import numpy as np
+import pytest
+
+from conftest import PARTICIPANT_ID, SEQUENCES, TEST_SERIALS, N_FRAMES
+from nersemble_data.constants import SERIALS
+from nersemble_data.data.nersemble_data import NeRSembleParticipantDataManager
+from nersemble_data.util.instrumentation import enable_instrumentation, disable_instrumentation
+
+VIDEO_BACKENDS = ["opencv", pytest.param("pyav", marks=pytest.mark.skipif(find_spec("av") is None, reason="PyAV is not installed"))]
+
+
+@pytest.mark.parametrize("video_backend", VIDEO_BACKENDS)
+@pytest.mark.parametrize("n_decode_workers", [1, 2, None])
+def test_iter_timesteps_matches_load_timestep(nersemble_folder, video_backend, n_decode_workers):
+    with NeRSembleParticipantDataManager(str(nersemble_folder), PARTICIPANT_ID, video_backend=video_backend) as data_manager:
+        expected = [data_manager.load_timestep("FREE", timestep, as_uint8=True) for timestep in range(N_FRAMES)]
+
+    with NeRSembleParticipantDataManager(str(nersemble_folder), PARTICIPANT_ID,
+                                         n_decode_workers=n_decode_workers, video_backend=video_backend) as data_manager:
+        enable_instrumentation()
+        try:
+            streamed = list(data_manager.iter_timesteps("FREE", prefetch=4, as_uint8=True))
+        finally:
+            stats = disable_instrumentation()
+
+    assert [timestep for timestep, _ in streamed] == list(range(N_FRAMES))
+    for (_, images), expected_images in zip(streamed, expected):
+        assert images.shape == (len(TEST_SERIALS), 48, 64, 3)
+        np.testing.assert_array_equal(images, expected_images)
+    # Every camera is decoded front to back by a single thread, hence the decoders never have to seek
+    assert stats["counters"].get("video.n_seeks", 0) == 0
+
+
+def test_iter_timesteps_stops_early(nersemble_folder):
+    with NeRSembleParticipantDataManager(str(nersemble_folder), PARTICIPANT_ID, n_decode_workers=1) as data_manager:
+        iterator = data_manager.iter_timesteps("FREE", timesteps=[3, 4, 5], prefetch=1, as_uint8=True)
+        timestep, images = next(iterator)
+        iterator.close()
+
+        assert timestep == 3
+        np.testing.assert_array_equal(images, data_manager.load_timestep("FREE", 3, as_uint8=True))
+
+
+def test_iter_timesteps_raises_decoding_errors(nersemble_folder):
+    with NeRSembleParticipantDataManager(str(nersemble_folder), PARTICIPANT_ID) as data_manager:
+        with pytest.raises(AssertionError):
+            list(data_manager.iter_timesteps("FREE", crop_boxes=(0, 0, 1000, 10)))
+
+
+def test_list_default_serials(nersemble_folder):
+    with NeRSembleParticipantDataManager(str(nersemble_folder), PARTICIPANT_ID) as data_manager:
+        serials = data_manager.list_default_serials("FREE")
+
+    assert serials == [serial for serial in SERIALS if serial in TEST_SERIALS]
+
+
+@pytest.mark.parametrize("max_open_videos", [1, 2])
+def test_threaded_loading_with_fewer_pool_slots_than_cameras(nersemble_folder, max_open_videos):
+    with NeRSembleParticipantDataManager(str(nersemble_folder), PARTICIPANT_ID, max_open_videos=1000) as data_manager:
+        expected = {sequence_name: [data_manager.load_timestep(sequence_name, timestep, as_uint8=True)
+                                    for timestep in range(N_FRAMES)]
+                    for sequence_name in SEQUENCES}
+
+    # Frequent thread switches make decoding threads evict loaders that others are still using
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with NeRSembleParticipantDataManager(str(nersemble_folder), PARTICIPANT_ID, max_open_videos=max_open_videos) as data_manager:
+            for i_round in range(10):
+                for sequence_name in SEQUENCES:
+                    timestep = (i_round * 7) % N_FRAMES
+                    np.testing.assert_array_equal(data_manager.load_timestep(sequence_name, timestep, as_uint8=True),
+                                                  expected[sequence_name][timestep])
+
+                    for timestep, images in data_manager.iter_timesteps(sequence_name, prefetch=3, as_uint8=True):
+                        np.testing.assert_array_equal(images, expected[sequence_name][timestep])
+
+            assert data_manager.get_cache_stats()["n_open"] <= max_open_videos
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+
+@pytest.mark.parametrize("downscale_factor", [2, 1.5])
+def test_load_image_downscaling_interpolation(nersemble_folder, downscale_factor):
+    import cv2
+    from elias.util.io import resize_img
+
+    with NeRSembleParticipantDataManager(str(nersemble_folder), PARTICIPANT_ID) as data_manager:
+        image = data_manager.load_image("FREE", TEST_SERIALS[0], 5, as_uint8=True)
+        bilinear = data_manager.load_image("FREE", TEST_SERIALS[0], 5, as_uint8=True, downscale_factor=downscale_factor)
+        area = data_manager.load_image("FREE", TEST_SERIALS[0], 5, as_uint8=True, downscale_factor=downscale_factor,
+                                       interpolation='area')
+
+    # Default is Pillow's bilinear filter, as in earlier versions that downscaled with elias' resize_img()
+    np.testing.assert_array_equal(bilinear, resize_img(image, 1 / downscale_factor))
+    np.testing.assert_array_equal(area, cv2.resize(image, area.shape[1::-1], interpolation=cv2.INTER_AREA))
+    assert not np.array_equal(bilinear, area)
+
+
+@pytest.mark.parametrize("apply_color_correction", [False, True])
+@pytest.mark.parametrize("dtype", [np.uint8, np.float16, np.float32, np.float64])
+def test_load_image_dtype_and_out(nersemble_folder, dtype, apply_color_correction):
+    with NeRSembleParticipantDataManager(str(nersemble_folder), PARTICIPANT_ID) as data_manager:
+        image = data_manager.load_image("FREE", TEST_SERIALS[1], 7, apply_color_correction=apply_color_correction,
+                                        dtype=dtype)
+        reference = data_manager.load_image("FREE", TEST_SERIALS[1], 7, apply_color_correction=apply_color_correction)
+
+        out = np.empty((48, 64, 3), dtype=dtype)
+        contiguous = data_manager.load_image("FREE", TEST_SERIALS[1], 7, apply_color_correction=apply_color_correction,
+                                             out=out)
+        # E.g., writing into a crop of a larger canvas
+        canvas = np.zeros((60, 80, 3), dtype=dtype)
+        strided = data_manager.load_image("FREE", TEST_SERIALS[1], 7, apply_color_correction=apply_color_correction,
+                                          out=canvas[6:54, 8:72])
+
+    assert image.dtype == dtype and image.shape == (48, 64, 3)
+    assert reference.dtype == np.float64
+    if dtype == np.uint8:
+        assert np.abs(image / 255. - reference).max() <= 1 / 255.
+    else:
+        np.testing.assert_allclose(image, reference, atol=1e-3 if dtype == np.float16 else 1e-4)
+    assert contiguous is out
+    np.testing.assert_array_equal(out, image)
+    np.testing.assert_array_equal(strided, image)
+    np.testing.assert_array_equal(canvas[6:54, 8:72], image)
+    assert not canvas[:6].any() and not canvas[54:].any() and not canvas[:, :8].any() and not canvas[:, 72:].any()
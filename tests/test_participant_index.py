@@ -0,0 +1,57 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from nersemble_data.data.participant_index import ParticipantIndex, SequenceInfo, CameraInfo, load_participant_ids
+from nersemble_data.util import files
+from nersemble_data.util.files import write_atomic
+
+
+def test_load_participant_ids(tmp_path):
+    nersemble_folder = tmp_path / "nersemble"
+    cache_folder = tmp_path / "cache"
+    for p_id in [3, 1, 20]:
+        (nersemble_folder / f"{p_id:03d}").mkdir(parents=True)
+
+    assert load_participant_ids(str(nersemble_folder), str(cache_folder)) == [1, 3, 20]
+    # Writing the cache must not invalidate it
+    mtime_ns = nersemble_folder.stat().st_mtime_ns
+    assert load_participant_ids(str(nersemble_folder), str(cache_folder)) == [1, 3, 20]
+    assert nersemble_folder.stat().st_mtime_ns == mtime_ns
+    assert len(list(cache_folder.iterdir())) == 1
+
+    (nersemble_folder / "007").mkdir()
+    assert load_participant_ids(str(nersemble_folder), str(cache_folder)) == [1, 3, 7, 20]
+
+
+def test_concurrent_index_writes(tmp_path):
+    index_path = tmp_path / ParticipantIndex.FILE_NAME
+    camera_info = CameraInfo(n_frames=10, width=64, height=48, fps=30., source_size=1000, source_mtime_ns=1)
+    participant_indices = [ParticipantIndex({f"SEQ-{i}": SequenceInfo(cameras={"222200037": camera_info})}) for i in range(16)]
+
+    def save_and_load(participant_index: ParticipantIndex):
+        participant_index.save(str(index_path))
+        # Readers only ever see complete files
+        with open(index_path) as f:
+            return json.load(f)
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(save_and_load, participant_indices * 8))
+
+    assert [path.name for path in tmp_path.iterdir()] == [ParticipantIndex.FILE_NAME]
+
+
+def test_write_atomic_keeps_previous_content_on_failure(tmp_path, monkeypatch):
+    path = tmp_path / "file.json"
+    write_atomic(str(path), "previous")
+
+    def replace(src, dst):
+        raise PermissionError(f"Cannot replace {dst}")
+
+    monkeypatch.setattr(files.os, "replace", replace)
+    with pytest.raises(PermissionError):
+        write_atomic(str(path), "new")
+
+    assert path.read_text() == "previous"
+    assert [path.name for path in tmp_path.iterdir()] == ["file.json"]
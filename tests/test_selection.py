@@ -0,0 +1,129 @@
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from nersemble_data.constants import SERIALS
+from nersemble_data.util.download import DownloadResult
+from nersemble_data.util.manifest import DownloadManifest
+from nersemble_data.util.selection import DownloadSelection, AVERAGE_BYTES_PER_VIDEO, select_participants, select_names, \
+    plan_download, _format_bytes
+
+PARTICIPANT_IDS = [1, 2, 5, 30, 31, 35, 39, 40, 100]
+SEQUENCES = ["EXP-1-head", "EXP-2-eyes", "EXP-9-jaw", "EMO-1-shout", "SEN-01-port", "SEN-10-conf", "FREE"]
+
+
+class _Metadata:
+    # Stand-in for NeRSembleMetadata
+
+    def list_participants(self) -> List[int]:
+        return [1, 2, 3]
+
+    def list_sequences(self) -> List[str]:
+        return ["EXP-1-head", "EXP-2-eyes", "FREE"]
+
+    def list_sequences_for_participant(self, participant_id: int) -> List[str]:
+        return ["EXP-1-head", "FREE"] if participant_id == 2 else self.list_sequences()
+
+
+@pytest.mark.parametrize("selector, expected", [
+    ("all", PARTICIPANT_IDS),
+    ("5", [5]),
+    ("30-39", [30, 31, 35, 39]),
+    ("100, 1-2", [1, 2, 100]),
+    ("1-100,^30-39", [1, 2, 5, 40, 100]),
+    ("^31,^100", [1, 2, 5, 30, 35, 39, 40]),
+    ("all,^1-35", [39, 40, 100]),
+    ("50-99", []),
+])
+def test_select_participants(selector, expected):
+    assert select_participants(selector, PARTICIPANT_IDS) == expected
+
+
+def test_select_participants_unavailable():
+    with pytest.raises(AssertionError, match=r"\[3, 4\]"):
+        select_participants("1,3,4", PARTICIPANT_IDS)
+    with pytest.raises(AssertionError):
+        select_participants("1-5-9", PARTICIPANT_IDS)
+
+
+@pytest.mark.parametrize("selector, expected", [
+    ("all", SEQUENCES),
+    ("FREE", ["FREE"]),
+    ("EXP-*", ["EXP-1-head", "EXP-2-eyes", "EXP-9-jaw"]),
+    ("FREE,EXP-*", ["EXP-1-head", "EXP-2-eyes", "EXP-9-jaw", "FREE"]),
+    ("EXP-*,EMO-*,^EXP-1-head", ["EXP-2-eyes", "EXP-9-jaw", "EMO-1-shout"]),
+    ("SEN-0[1-5]*", ["SEN-01-port"]),
+    ("^EXP-*,^SEN-??-*", ["EMO-1-shout", "FREE"]),
+    ("EXP-?-head", ["EXP-1-head"]),
+])
+def test_select_names(selector, expected):
+    assert select_names(selector, SEQUENCES) == expected
+
+
+def test_select_names_unavailable():
+    with pytest.raises(AssertionError, match=r"sequences do not exist: \['FOO-\*'\]"):
+        select_names("EXP-*,FOO-*", SEQUENCES, kind='sequences')
+    # Globs are case-sensitive, like the sequence names on the server
+    with pytest.raises(AssertionError):
+        select_names("exp-*", SEQUENCES)
+
+
+@pytest.mark.parametrize("assets", ["all", ("images",), ("calibration", "backgrounds"), ("metadata_sequences",)])
+def test_download_selection_len_matches_jobs(assets):
+    selection = DownloadSelection.from_selectors(_Metadata(), participant="^3", sequence="EXP-*,FREE",
+                                                 camera="^222200042", assets=assets)
+
+    assert selection.participant_ids == [1, 2]
+    assert selection.sequences == ["EXP-1-head", "EXP-2-eyes", "FREE"]
+    assert selection.sequences_per_participant[2] == ["EXP-1-head", "FREE"]
+    assert selection.serials == SERIALS[1:]
+    jobs = list(selection.iter_jobs())
+    assert len(selection) == len(jobs)
+    assert len({job.relative_path for job in jobs}) == len(jobs)
+
+
+def test_plan_download(http_server, server_folder, tmp_path):
+    selection = DownloadSelection({1: ["FREE"]}, SERIALS[:3], ["images", "calibration"])
+    relative_paths = [job.relative_path for job in selection.iter_jobs()]
+    calibration_path, video_paths = relative_paths[0], relative_paths[1:]
+
+    # First video was downloaded before, the second one is on the server
+    local_folder = tmp_path / "local"
+    (local_folder / video_paths[0]).parent.mkdir(parents=True)
+    (local_folder / video_paths[0]).write_bytes(bytes(1000))
+    (server_folder / video_paths[1]).parent.mkdir(parents=True)
+    (server_folder / video_paths[1]).write_bytes(bytes(2500))
+    with DownloadManifest(str(local_folder)) as manifest:
+        manifest.record(video_paths[0], DownloadResult("url", str(local_folder / video_paths[0]), 1000))
+
+        estimated_plan = plan_download(selection, manifest=manifest)
+        exact_plan = plan_download(selection, manifest=manifest, base_url=http_server.url, n_workers=2)
+
+    assert estimated_plan.total.n_files == exact_plan.total.n_files == 4
+    assert estimated_plan.total.n_bytes == 1000 + 2 * AVERAGE_BYTES_PER_VIDEO
+    assert estimated_plan.total.n_files_estimated == 2
+    assert estimated_plan.total.n_files_unknown == 1
+    assert estimated_plan.total.n_bytes_local == 1000
+    assert estimated_plan.total.n_bytes_remaining == 2 * AVERAGE_BYTES_PER_VIDEO
+
+    # Sizes of files that are neither local nor on the server stay estimates
+    assert exact_plan.total.n_bytes == 1000 + 2500 + AVERAGE_BYTES_PER_VIDEO
+    assert exact_plan.total.n_files_estimated == 1
+    assert exact_plan.per_asset["calibration"].n_files_unknown == 1
+    assert exact_plan.per_participant["001"].n_files_local == 1
+    assert not Path(server_folder / calibration_path).exists()
+
+
+@pytest.mark.parametrize("n_bytes, expected", [
+    (0, "0 B"),
+    (999, "999 B"),
+    (1000, "1.0 KB"),
+    (1024, "1.0 KB"),
+    (1_500_000, "1.5 MB"),
+    (AVERAGE_BYTES_PER_VIDEO, "8.7 MB"),
+    (999_000_000_000, "999.0 GB"),
+    (1_490_000_000_000, "1.5 TB"),
+])
+def test_format_bytes_is_decimal(n_bytes, expected):
+    assert _format_bytes(n_bytes) == expected
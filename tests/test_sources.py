@@ -0,0 +1,166 @@
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pytest
+import requests
+from range_http_server import RangeHTTPServer
+
+from nersemble_data.util.download import DownloadResult, download_file
+from nersemble_data.util.file_server import PeerFileServer
+from nersemble_data.util.manifest import DownloadManifest
+from nersemble_data.util.sources import DownloadSource, DownloadSources, HTTPSource, LocalMirrorSource
+
+RELATIVE_PATHS = [f"001/sequences/FREE/images/cam_{i}.mp4" for i in range(4)]
+UNREACHABLE_URL = "http://127.0.0.1:1"
+
+
+class _FailingSource(DownloadSource):
+
+    def __init__(self):
+        super().__init__("failing")
+        self.n_fetches = 0
+        self.is_healthy = False
+
+    def fetch(self, relative_path: str, target_path: str, **download_kwargs) -> Optional[DownloadResult]:
+        self.n_fetches += 1
+        raise requests.ConnectionError("Connection refused")
+
+    def check_health(self) -> bool:
+        return self.is_healthy
+
+
+@pytest.fixture
+def remote_files(server_folder: Path) -> dict:
+    remote_files = dict()
+    rng = np.random.default_rng(0)
+    for i, relative_path in enumerate(RELATIVE_PATHS):
+        remote_files[relative_path] = rng.bytes(50_000 + i)
+        (server_folder / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        (server_folder / relative_path).write_bytes(remote_files[relative_path])
+    return remote_files
+
+
+@pytest.fixture
+def mirror_folder(tmp_path: Path, remote_files: dict) -> Path:
+    # The mirror only has the first two files
+    mirror_folder = tmp_path / "mirror"
+    for relative_path in RELATIVE_PATHS[:2]:
+        (mirror_folder / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        (mirror_folder / relative_path).write_bytes(remote_files[relative_path])
+    return mirror_folder
+
+
+def test_files_come_from_first_source_that_has_them(http_server, remote_files, mirror_folder, tmp_path):
+    sources = DownloadSources([LocalMirrorSource(str(mirror_folder)), HTTPSource(http_server.url, name="origin", n_retries=0)])
+    local_folder = tmp_path / "local"
+
+    for relative_path in RELATIVE_PATHS:
+        result = sources.download(relative_path, str(local_folder / relative_path))
+        assert result.n_bytes_downloaded == len(remote_files[relative_path])
+        assert (local_folder / relative_path).read_bytes() == remote_files[relative_path]
+
+    stats = sources.get_stats()
+    assert stats[str(mirror_folder)] == {"n_files": 2, "n_bytes": 100_001, "n_not_available": 2, "n_failures": 0}
+    assert stats["origin"]["n_files"] == 2
+    assert http_server.n_requests == 2
+
+
+def test_mirror_without_file_falls_back_to_origin(http_server, remote_files, tmp_path):
+    (tmp_path / "empty_mirror").mkdir()
+    with RangeHTTPServer(str(tmp_path / "empty_mirror")) as mirror:
+        mirror_url = mirror.url
+        sources = DownloadSources([HTTPSource(mirror_url, n_retries=0), HTTPSource(http_server.url, name="origin", n_retries=0)])
+        result = sources.download(RELATIVE_PATHS[0], str(tmp_path / "local" / RELATIVE_PATHS[0]))
+
+        assert result.n_bytes_downloaded == len(remote_files[RELATIVE_PATHS[0]])
+        # Not having a file is not a failure of the mirror
+        assert sources.get_stats()[mirror_url]["n_not_available"] == 1
+        assert sources.get_stats()[mirror_url]["n_failures"] == 0
+
+
+def test_failing_mirror_is_skipped_until_healthy_again(http_server, remote_files, tmp_path):
+    failing_source = _FailingSource()
+    sources = DownloadSources([failing_source, HTTPSource(http_server.url, name="origin", n_retries=0)], max_failures=2, retry_after=0)
+    local_folder = tmp_path / "local"
+
+    for relative_path in RELATIVE_PATHS:
+        result = sources.download(relative_path, str(local_folder / relative_path))
+        assert (local_folder / relative_path).read_bytes() == remote_files[relative_path]
+        assert result.n_bytes_downloaded == len(remote_files[relative_path])
+
+    # After max_failures failures in a row, only health checks are done
+    assert failing_source.n_fetches == 2
+    assert sources.get_stats()["origin"]["n_files"] == len(RELATIVE_PATHS)
+
+    failing_source.is_healthy = True
+    sources.download(RELATIVE_PATHS[0], str(tmp_path / "again" / RELATIVE_PATHS[0]))
+    assert failing_source.n_fetches == 3
+
+
+def test_unreachable_origin(tmp_path, mirror_folder):
+    sources = DownloadSources([LocalMirrorSource(str(mirror_folder)), HTTPSource(UNREACHABLE_URL, name="origin", n_retries=0)])
+
+    assert sources.download(RELATIVE_PATHS[0], str(tmp_path / "local" / RELATIVE_PATHS[0])) is not None
+    assert sources.download(RELATIVE_PATHS[3], str(tmp_path / "local" / RELATIVE_PATHS[3])) is None
+    assert sources.get_stats()["origin"]["n_failures"] == 1
+
+
+def test_local_mirror_removes_leftovers_of_other_sources(tmp_path, remote_files, mirror_folder):
+    target_path = tmp_path / "local" / RELATIVE_PATHS[0]
+    target_path.parent.mkdir(parents=True)
+    for suffix in (".part", ".part.ranges", ".part.validator"):
+        Path(f"{target_path}{suffix}").write_bytes(b"interrupted")
+
+    LocalMirrorSource(str(mirror_folder)).fetch(RELATIVE_PATHS[0], str(target_path))
+
+    assert target_path.read_bytes() == remote_files[RELATIVE_PATHS[0]]
+    assert sorted(path.name for path in target_path.parent.iterdir()) == [target_path.name]
+
+
+def test_peer_serves_completely_downloaded_files(http_server, remote_files, tmp_path):
+    node_folder = tmp_path / "node"
+    with DownloadManifest(str(node_folder)) as manifest:
+        for relative_path in RELATIVE_PATHS[:3]:
+            result = download_file(f"{http_server.url}/{relative_path}", str(node_folder / relative_path), n_retries=0)
+            manifest.record(relative_path, result)
+    # Not recorded in the manifest, e.g., still being downloaded
+    (node_folder / RELATIVE_PATHS[3]).write_bytes(remote_files[RELATIVE_PATHS[3]])
+
+    with PeerFileServer(str(node_folder), port=0) as peer:
+        assert requests.get(f"{peer.url}/{RELATIVE_PATHS[3]}").status_code == 404
+        assert requests.get(f"{peer.url}/../{node_folder.name}/{RELATIVE_PATHS[0]}").status_code == 404
+
+        response = requests.get(f"{peer.url}/{RELATIVE_PATHS[0]}", headers={"Range": "bytes=10-19"})
+        assert response.status_code == 206
+        assert response.content == remote_files[RELATIVE_PATHS[0]][10:20]
+        # Outdated validator, the whole file is sent
+        response = requests.get(f"{peer.url}/{RELATIVE_PATHS[0]}", headers={"Range": "bytes=10-19", "If-Range": '"outdated"'})
+        assert response.status_code == 200
+        assert response.content == remote_files[RELATIVE_PATHS[0]]
+
+        # Another node whose origin is down gets the files from the peer
+        sources = DownloadSources.from_specs([peer.url], UNREACHABLE_URL)
+        other_node_folder = tmp_path / "other_node"
+        for relative_path in RELATIVE_PATHS[:3]:
+            sources.download(relative_path, str(other_node_folder / relative_path))
+            assert (other_node_folder / relative_path).read_bytes() == remote_files[relative_path]
+        assert sources.get_stats()[peer.url]["n_files"] == 3
+
+
+def test_file_server_ranges(http_server, remote_files, server_folder):
+    url = f"{http_server.url}/{RELATIVE_PATHS[1]}"
+    data = remote_files[RELATIVE_PATHS[1]]
+
+    response = requests.get(url, headers={"Range": "bytes=49990-"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 49990-{len(data) - 1}/{len(data)}"
+    assert response.content == data[49990:]
+    # Current validator, only the range is sent
+    response = requests.get(url, headers={"Range": "bytes=0-9", "If-Range": requests.head(url).headers["ETag"]})
+    assert response.status_code == 206 and response.content == data[:10]
+
+    assert requests.get(url, headers={"Range": f"bytes={len(data)}-"}).status_code == 416
+    assert requests.get(url, headers={"Range": "lines=1-2"}).status_code == 400
+    assert requests.get(f"{http_server.url}/../{server_folder.name}/{RELATIVE_PATHS[1]}").status_code == 404
+    assert requests.get(f"{http_server.url}/001").status_code == 404
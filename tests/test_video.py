@@ -0,0 +1,167 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from conftest import PARTICIPANT_ID, TEST_SERIALS, N_FRAMES
+from nersemble_data.util.instrumentation import enable_instrumentation, disable_instrumentation
+from nersemble_data.util.video import open_video, PyAVVideoFrameLoader, VideoFrameLoaderPool
+
+
+@pytest.fixture
+def video_path(nersemble_folder) -> str:
+    return f"{nersemble_folder}/{PARTICIPANT_ID:03d}/sequences/FREE/images/cam_{TEST_SERIALS[0]}.mp4"
+
+
+@pytest.mark.parametrize("backend", ["opencv", "pyav"])
+def test_random_access_matches_sequential_decoding(video_path, backend):
+    if backend == "pyav":
+        pytest.importorskip("av")
+
+    with open_video(video_path, backend='opencv') as video:
+        expected = [video.load_frame(frame_id) for frame_id in range(N_FRAMES)]
+
+    # No forward decoding, every jump is a seek
+    with open_video(video_path, backend=backend, max_skip_frames=0) as video:
+        for frame_id in [15, 3, 4, 19, 0, 11]:
+            np.testing.assert_array_equal(video.load_frame(frame_id), expected[frame_id])
+
+
+@pytest.mark.parametrize("backend", ["opencv", "pyav"])
+def test_forward_decoding_instead_of_seeking(video_path, backend):
+    if backend == "pyav":
+        pytest.importorskip("av")
+
+    with open_video(video_path, backend='opencv') as video:
+        expected = [video.load_frame(frame_id) for frame_id in range(N_FRAMES)]
+
+    def load_frames(frame_ids, max_skip_frames: int) -> dict:
+        enable_instrumentation()
+        try:
+            with open_video(video_path, backend=backend, max_skip_frames=max_skip_frames) as video:
+                for frame_id in frame_ids:
+                    np.testing.assert_array_equal(video.load_frame(frame_id), expected[frame_id])
+        finally:
+            stats = disable_instrumentation()
+        return stats["counters"]
+
+    # Sequential access never seeks
+    assert load_frames(range(N_FRAMES), max_skip_frames=32).get("video.n_seeks", 0) == 0
+    # Small forward jumps decode the frames in between instead of seeking
+    counters = load_frames([0, 5, 9, 10], max_skip_frames=4)
+    assert counters.get("video.n_seeks", 0) == 0
+    assert counters["video.n_skipped_frames"] == 4 + 3
+    # Backward jumps and jumps further than max_skip_frames seek
+    assert load_frames([10, 3, 9], max_skip_frames=4)["video.n_seeks"] == 3
+
+
+def test_pool_counters(nersemble_folder):
+    video_paths = [f"{nersemble_folder}/{PARTICIPANT_ID:03d}/sequences/FREE/images/cam_{serial}.mp4" for serial in TEST_SERIALS]
+    pool = VideoFrameLoaderPool(max_open_videos=2)
+
+    for i_video in [0, 0, 1, 2, 0, 2]:
+        with pool.lease(i_video, video_paths[i_video]):
+            pass
+    assert pool.keys() == (0, 2)
+    assert pool.get_stats() == {"n_open": 2, "n_hits": 2, "n_misses": 4, "n_evictions": 2}
+
+    assert pool.evict(0)
+    assert not pool.evict(1)
+    assert len(pool) == 1
+    assert pool.get_stats()["n_evictions"] == 3
+
+    pool.close()
+    assert pool.get_stats() == {"n_open": 0, "n_hits": 2, "n_misses": 4, "n_evictions": 3}
+
+
+@pytest.mark.parametrize("crop_box", [None, (8, 4, 56, 44)])
+@pytest.mark.parametrize("downscale_factor", [2, 1.5, 3])
+def test_pyav_downscaling_matches_opencv(video_path, crop_box, downscale_factor):
+    pytest.importorskip("av")
+
+    with open_video(video_path, backend='opencv') as opencv_video, open_video(video_path, backend='pyav') as pyav_video:
+        for frame_id in [0, 7, 19]:
+            expected = opencv_video.load_frame(frame_id, crop_box=crop_box, downscale_factor=downscale_factor)
+            image = pyav_video.load_frame(frame_id, crop_box=crop_box, downscale_factor=downscale_factor)
+
+            np.testing.assert_array_equal(image, expected)
+
+
+class _FrameWithoutTimestamp:
+    pts = None
+    dts = None
+
+    def __init__(self, frame):
+        self._frame = frame
+
+    def __getattr__(self, name: str):
+        return getattr(self._frame, name)
+
+
+class _PyAVVideoFrameLoaderWithoutTimestamps(PyAVVideoFrameLoader):
+    # Emulates containers whose frames have no timestamps after a seek
+
+    def _seek(self, frame_id: int):
+        super()._seek(frame_id)
+        self._frames = (_FrameWithoutTimestamp(frame) for frame in self._frames)
+
+
+def test_pyav_frames_without_timestamps_after_seek(video_path):
+    pytest.importorskip("av")
+
+    with open_video(video_path, backend='opencv') as video:
+        expected = [video.load_frame(frame_id) for frame_id in range(N_FRAMES)]
+
+    with _PyAVVideoFrameLoaderWithoutTimestamps(video_path, max_skip_frames=0) as video:
+        for frame_id in [15, 3, 4, 19]:
+            np.testing.assert_array_equal(video.load_frame(frame_id), expected[frame_id])
+
+
+def test_pool_closes_evicted_loaders_after_last_lease(nersemble_folder):
+    video_paths = [f"{nersemble_folder}/{PARTICIPANT_ID:03d}/sequences/FREE/images/cam_{serial}.mp4" for serial in TEST_SERIALS]
+    pool = VideoFrameLoaderPool(max_open_videos=1)
+
+    with pool.lease(0, video_paths[0]) as video:
+        with pool.lease(1, video_paths[1]):
+            # Pushed out of the pool, but still in use
+            assert pool.keys() == (1,)
+            assert video._video_capture.isOpened()
+            video.load_frame(3)
+        assert video._video_capture.isOpened()
+    assert not video._video_capture.isOpened()
+
+    with pool.lease(1, video_paths[1]) as video:
+        pool.close()
+        assert video._video_capture.isOpened()
+    assert not video._video_capture.isOpened()
+    assert pool.get_stats() == {"n_open": 0, "n_hits": 1, "n_misses": 2, "n_evictions": 1}
+
+
+def test_pool_concurrent_eviction(nersemble_folder):
+    video_paths = [f"{nersemble_folder}/{PARTICIPANT_ID:03d}/sequences/FREE/images/cam_{serial}.mp4" for serial in TEST_SERIALS]
+    expected = dict()
+    for i_video, video_path in enumerate(video_paths):
+        with open_video(video_path) as video:
+            expected[i_video] = [video.load_frame(frame_id) for frame_id in range(N_FRAMES)]
+
+    pool = VideoFrameLoaderPool(max_open_videos=1)
+
+    def load(i_job: int) -> bool:
+        i_video = i_job % len(video_paths)
+        frame_id = (i_job * 7) % N_FRAMES
+        with pool.lease(i_video, video_paths[i_video]) as video:
+            return np.array_equal(video.load_frame(frame_id), expected[i_video][frame_id])
+
+    # Frequent thread switches make threads evict loaders that others are still decoding with
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(load, range(2000)))
+    finally:
+        sys.setswitchinterval(switch_interval)
+        pool.close()
+
+    assert all(results)
+    assert pool.n_evictions > 0